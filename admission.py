@@ -0,0 +1,335 @@
+"""Admission control and priority scheduling in front of the Gemini and ElevenLabs APIs.
+
+Each upstream gets token buckets sized to its quota: requests per minute, plus
+Gemini prompt tokens or ElevenLabs characters per minute. Calls that cannot go
+out at once wait in one queue per priority class:
+
+- ``interactive``: the live interview (voice, chat streams, TTS, STT);
+- ``streaming``: streamed resume analyses;
+- ``bulk``: non-streaming and batch analyses.
+
+Queued calls are served by weighted fair queueing: each is tagged with a
+virtual finish time advanced by the quota it uses (in seconds of rate) divided
+by its class weight (ADMISSION_WEIGHT_*), and the smallest tag goes first. So
+under contention a class gets quota in proportion to its weight, and a burst
+of 4000-token analyses cannot hold up an interview turn queued behind them.
+ADMISSION_INTERACTIVE_RESERVE of every bucket and of the wait queue is kept for
+interactive calls: the other classes only use quota above it, and an
+interactive call may overtake one that is still waiting for quota.
+
+A call is refused with Overloaded, and the route answers 429 with
+``Retry-After`` rather than tying up another worker, when its class's share of
+the ADMISSION_MAX_QUEUE wait slots is taken or its estimated wait exceeds the
+caller's deadline; it is also refused if higher-priority work keeps it queued
+past that deadline. A 429 from the upstream itself pauses admission for the
+time it asks for.
+
+The class comes from the route of the request being served (``prioritize``,
+called where each request starts); threads and tasks working for a request
+inherit it. The quotas are for the whole project: each worker process
+enforces its share (the quota divided by WEB_CONCURRENCY). Instances behind a
+load balancer each need their share of the quota set explicitly.
+"""
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+from tokens import estimate_tokens
+
+# Worker processes sharing the quotas below (same variable as serve.py and gunicorn)
+WORKERS = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+GEMINI_RPM = float(os.environ.get('GEMINI_RPM', 2000)) / WORKERS
+GEMINI_TPM = float(os.environ.get('GEMINI_TPM', 4000000)) / WORKERS
+ELEVENLABS_RPM = float(os.environ.get('ELEVENLABS_RPM', 600)) / WORKERS
+ELEVENLABS_CHARS_PER_MINUTE = float(os.environ.get('ELEVENLABS_CHARS_PER_MINUTE', 0)) / WORKERS
+BURST_SECONDS = float(os.environ.get('ADMISSION_BURST_SECONDS', 10))
+MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 64))
+MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 10))
+
+INTERACTIVE = 'interactive'
+PRIORITIES = (INTERACTIVE, 'streaming', 'bulk')
+WEIGHTS = {
+    INTERACTIVE: float(os.environ.get('ADMISSION_WEIGHT_INTERACTIVE', 8)),
+    'streaming': float(os.environ.get('ADMISSION_WEIGHT_STREAMING', 3)),
+    'bulk': float(os.environ.get('ADMISSION_WEIGHT_BULK', 1)),
+}
+# Fraction of each bucket and of the wait queue only interactive calls may use
+INTERACTIVE_RESERVE = min(0.9, max(0.0, float(os.environ.get('ADMISSION_INTERACTIVE_RESERVE', 0.2))))
+
+ROUTE_PRIORITIES = {
+    '/ws/voice': INTERACTIVE,
+    '/api/interview/stream': INTERACTIVE,
+    '/api/gemini/stream': INTERACTIVE,
+    '/api/elevenlabs/tts': INTERACTIVE,
+    '/api/elevenlabs/tts/stream': INTERACTIVE,
+    '/api/elevenlabs/stt': INTERACTIVE,
+    '/api/analyze-resume/stream': 'streaming',
+}
+DEFAULT_PRIORITY = 'bulk'
+
+# Used when an upstream 429 carries no usable Retry-After
+DEFAULT_BACKOFF = 1.0
+
+ADMISSION_WAIT_SECONDS = metrics.registry.histogram(
+    'intervue_admission_wait_seconds', 'Time a call waited for upstream quota', ('upstream', 'priority'))
+ADMISSION_REJECTED = metrics.registry.counter(
+    'intervue_admission_rejected_total', 'Calls refused with 429 before reaching the upstream',
+    ('upstream', 'priority', 'reason'))
+ADMISSION_QUEUED = metrics.registry.gauge(
+    'intervue_admission_queued', 'Calls waiting for upstream quota', ('upstream', 'priority'))
+
+_priority = contextvars.ContextVar('admission_priority', default=DEFAULT_PRIORITY)
+
+
+def prioritize(route):
+    """Schedule the upstream calls made from this context in the class of ``route`` (see ROUTE_PRIORITIES)"""
+    _priority.set(ROUTE_PRIORITIES.get(route, DEFAULT_PRIORITY))
+
+
+def current_priority():
+    return _priority.get()
+
+
+class Overloaded(Exception):
+    """No upstream quota within the caller's deadline; retry after ``retry_after`` seconds"""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f'{upstream} is over capacity, retry in {retry_after}s')
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """``per_minute`` units per minute with a burst of ``burst_seconds`` worth"""
+
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self, amount, now, reserve=0.0):
+        """Seconds until ``amount`` units are available, leaving the ``reserve`` fraction untouched"""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        floor = self.capacity * reserve
+        # A single call larger than the burst would otherwise never fit
+        deficit = floor + min(amount, self.capacity - floor) - self.level
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def seconds(self, amount):
+        """Time the bucket takes to earn ``amount`` units back"""
+        return min(amount, self.capacity) / self.rate
+
+
+class _Ticket:
+    """One call waiting for quota"""
+
+    def __init__(self, priority, units, cost, wake):
+        self.priority = priority
+        self.units = units
+        self.cost = cost
+        self.wake = wake
+        self.finish = 0.0
+        self.deadline = 0.0
+        self.granted = False
+
+
+class Limiter:
+    """Request and volume buckets for one upstream, shared by priority queues with bounded waits"""
+
+    def __init__(self, name, requests_per_minute, units_per_minute=0, max_queue=MAX_QUEUE,
+                 max_wait=MAX_WAIT, weights=WEIGHTS, reserve=INTERACTIVE_RESERVE):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.units = TokenBucket(units_per_minute) if units_per_minute > 0 else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.weights = weights
+        self.reserve = reserve
+        self.paused_until = 0.0
+        self.queues = {priority: deque() for priority in PRIORITIES}
+        # Self-clocked fair queueing: virtual time is the finish tag of the last call served
+        self.virtual_time = 0.0
+        self.last_finish = dict.fromkeys(PRIORITIES, 0.0)
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _cost(self, units):
+        """Quota a call uses, in seconds of the scarcer bucket's rate"""
+        cost = 0.0
+        if self.requests is not None:
+            cost = self.requests.seconds(1)
+        if self.units is not None and units:
+            cost = max(cost, self.units.seconds(units))
+        return cost
+
+    def _delay(self, ticket, now):
+        """Seconds until the buckets can serve ``ticket``; only interactive calls may dip into the reserve"""
+        reserve = 0.0 if ticket.priority == INTERACTIVE else self.reserve
+        delay = max(0.0, self.paused_until - now)
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1, now, reserve))
+        if self.units is not None and ticket.units:
+            delay = max(delay, self.units.delay(ticket.units, now, reserve))
+        return delay
+
+    def _grant(self, ticket):
+        self.queues[ticket.priority].remove(ticket)
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.units is not None and ticket.units:
+            self.units.take(ticket.units)
+        self.virtual_time = max(self.virtual_time, ticket.finish)
+        ticket.granted = True
+        ticket.wake()
+
+    def _dispatch(self, now):
+        """Grant queued calls in finish-tag order while quota lasts.
+
+        Returns the seconds until the next one could go, or None when nothing
+        is queued. A call still waiting for quota holds back the calls tagged
+        after it, except interactive ones.
+        """
+        while True:
+            heads = sorted((queue[0] for queue in self.queues.values() if queue), key=lambda ticket: ticket.finish)
+            if not heads:
+                return None
+            wait = None
+            for position, ticket in enumerate(heads):
+                if position and ticket.priority != INTERACTIVE:
+                    continue
+                delay = self._delay(ticket, now)
+                if delay <= 0:
+                    self._grant(ticket)
+                    break
+                wait = delay if wait is None else min(wait, delay)
+            else:
+                return wait
+
+    def _enqueue(self, units, max_wait, wake):
+        """Queue one call and grant what can go now; raises Overloaded"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        priority = current_priority()
+        ticket = _Ticket(priority, units, self._cost(units), wake)
+        with self._lock:
+            now = time.monotonic()
+            ticket.finish = max(self.virtual_time, self.last_finish[priority]) + ticket.cost / self.weights[priority]
+            # Calls served first: tagged earlier, plus every interactive one for the other classes
+            ahead = sum(
+                queued.cost
+                for queue in self.queues.values() for queued in queue
+                if queued.finish <= ticket.finish or (priority != INTERACTIVE and queued.priority == INTERACTIVE)
+            )
+            estimate = ahead + self._delay(ticket, now)
+            limit = self.max_queue if priority == INTERACTIVE else int(self.max_queue * (1 - self.reserve))
+            if estimate > 0:
+                if self.waiting >= limit:
+                    reason = 'queue_full'
+                elif estimate > max_wait:
+                    reason = 'deadline'
+                else:
+                    reason = None
+                if reason:
+                    ADMISSION_REJECTED.labels(self.name, priority, reason).inc()
+                    raise Overloaded(self.name, max(1, math.ceil(estimate)))
+            self.last_finish[priority] = ticket.finish
+            ticket.deadline = now + max_wait
+            self.queues[priority].append(ticket)
+            self._dispatch(now)
+        return ticket
+
+    def _poll(self, ticket):
+        """None once ``ticket`` is granted, else seconds to wait before polling again; raises Overloaded past its deadline"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._dispatch(now)
+            if ticket.granted:
+                return None
+            remaining = ticket.deadline - now
+            if remaining <= 0:
+                # Overtaken by higher-priority calls for longer than the caller would wait
+                self.queues[ticket.priority].remove(ticket)
+                ADMISSION_REJECTED.labels(self.name, ticket.priority, 'deadline').inc()
+                raise Overloaded(self.name, max(1, math.ceil(wait or 1)))
+            return remaining if wait is None else min(wait, remaining)
+
+    def _abandon(self, ticket):
+        with self._lock:
+            if not ticket.granted and ticket in self.queues[ticket.priority]:
+                self.queues[ticket.priority].remove(ticket)
+
+    def acquire(self, units=0, max_wait=None):
+        """Block until the call may go out; raises Overloaded instead of waiting past ``max_wait``"""
+        started = time.monotonic()
+        granted = threading.Event()
+        ticket = self._enqueue(units, max_wait, granted.set)
+        if not ticket.granted:
+            queued = ADMISSION_QUEUED.labels(self.name, ticket.priority)
+            queued.inc()
+            try:
+                delay = self._poll(ticket)
+                while delay is not None:
+                    granted.wait(delay)
+                    delay = self._poll(ticket)
+            finally:
+                queued.dec()
+                self._abandon(ticket)
+        ADMISSION_WAIT_SECONDS.labels(self.name, ticket.priority).observe(time.monotonic() - started)
+
+    async def acquire_async(self, units=0, max_wait=None):
+        """Event-loop counterpart of ``acquire``"""
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = asyncio.Event()
+        # Granted from whichever thread or task polls next
+        ticket = self._enqueue(units, max_wait, lambda: loop.call_soon_threadsafe(granted.set))
+        if not ticket.granted:
+            queued = ADMISSION_QUEUED.labels(self.name, ticket.priority)
+            queued.inc()
+            try:
+                delay = self._poll(ticket)
+                while delay is not None:
+                    try:
+                        await asyncio.wait_for(granted.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    delay = self._poll(ticket)
+            finally:
+                queued.dec()
+                self._abandon(ticket)
+        ADMISSION_WAIT_SECONDS.labels(self.name, ticket.priority).observe(time.monotonic() - started)
+
+    def backoff(self, retry_after):
+        """Hold every call for ``retry_after`` seconds after the upstream answered 429"""
+        try:
+            seconds = float(retry_after)
+        except (TypeError, ValueError):
+            seconds = DEFAULT_BACKOFF
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        print(f"[ADMISSION] {self.name} rate limited us, pausing calls for {seconds:.1f}s")
+
+
+def payload_tokens(payload):
+    """Estimated prompt tokens of a Gemini generateContent payload"""
+    parts = list(payload.get('systemInstruction', {}).get('parts', []))
+    for content in payload.get('contents', []):
+        parts.extend(content.get('parts', []))
+    return sum(estimate_tokens(part.get('text', '')) for part in parts)
+
+
+gemini = Limiter('gemini', GEMINI_RPM, GEMINI_TPM)
+elevenlabs = Limiter('elevenlabs', ELEVENLABS_RPM, ELEVENLABS_CHARS_PER_MINUTE)
+limiters = {'gemini': gemini, 'elevenlabs': elevenlabs}
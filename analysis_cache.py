@@ -0,0 +1,93 @@
+"""Result cache for resume analyses.
+
+Candidates often upload the same CV several times in a row. Analyses are keyed
+on a hash of the normalized extracted text, the language, the prompt version
+and the generation config, and kept for a limited time in a size-bounded LRU.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import gemini
+import prompts
+
+TTL_SECONDS = float(os.environ.get('ANALYSIS_CACHE_TTL', 3600))
+MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 256))
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Replayed text is cut at sentence ends so the frontend still speaks sentence by sentence
+_REPLAY_PIECES = re.compile(r'[^.!?]*[.!?]+\s*|[^.!?]+$')
+
+
+class TTLCache:
+    """Thread-safe LRU whose entries also expire ``ttl`` seconds after being stored"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+def analysis_key(resume_text, language, stream, generation_config):
+    """Hash of (normalized text, language, prompt version and variant, generation config)"""
+    normalized = {
+        'text': _WHITESPACE.sub(' ', resume_text).strip(),
+        'language': language,
+        'prompt_version': prompts.PROMPT_VERSION,
+        'variant': 'stream' if stream else 'full',
+        'generation_config': generation_config,
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def replay_frames(text, events=None):
+    """Yield a cached analysis as standard ``content_block_delta`` SSE frames, plus the frames of ``events``"""
+    for piece in _REPLAY_PIECES.findall(text):
+        if piece:
+            yield gemini.delta_frame(piece)
+            if events is not None:
+                yield from events.feed(piece)
+    if events is not None:
+        yield from events.close()
+
+
+cache = TTLCache()
@@ -0,0 +1,542 @@
+"""Asyncio serving mode for the long-lived streaming routes.
+
+Run with:  uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The three streaming routes are served natively on the event loop with
+non-blocking upstream streams, so a single process can relay hundreds of
+concurrent streams instead of tying up one sync worker per stream. The
+/ws/voice WebSocket (see voice_session) only exists in this mode. Every other
+route falls through to the Flask app unchanged.
+
+Native streams are listed in the inflight registry like the Flask ones.
+Starlette cancels a response whose client disconnects; /api/inflight cancels
+one by cancelling the task sending it (see inflight.aguard). The mounted Flask
+app has no client socket to watch: its streams are cancelled when uvicorn
+reports the disconnect (see RequestMetrics.mounted).
+"""
+import asyncio
+import contextlib
+import json
+import os
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+import admission
+import analysis_cache
+import context_cache
+import elevenlabs
+import gemini
+import inflight
+import ledger
+import metrics
+import pdf_extract
+import prompts
+import resume
+import resume_events
+import server
+import sessions
+import singleflight
+import speech_pipeline
+import sse_relay
+import tts_cache
+import upstream
+from tokens import estimate_tokens
+
+# Single-flight group for the async streams (asyncio primitives, one per event loop)
+flights = singleflight.AsyncGroup()
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+
+def overloaded(e):
+    """429 for a call refused by admission control"""
+    return JSONResponse({'error': str(e)}, status_code=429, headers={'Retry-After': str(e.retry_after)})
+
+
+async def prefixed(first, frames):
+    """``first`` followed by ``frames``, a sync or async iterable"""
+    yield first
+    if hasattr(frames, '__aiter__'):
+        async for frame in frames:
+            yield frame
+    else:
+        for frame in frames:
+            yield frame
+
+
+class RequestMetrics:
+    """Request counts and latency for the native routes; Flask instruments the mounted app itself"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route = scope.get('path') if scope['type'] == 'http' else None
+        if route is not None and route not in NATIVE_ROUTES:
+            await self.mounted(scope, receive, send)
+            return
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        timer = metrics.RequestTimer(route, scope['method'])
+        ledger.reset(route=route)
+        admission.prioritize(route)
+        # Listed by inflight.aguard once the handler has tagged it and its body starts
+        entry = inflight.begin(route)
+        entry.client = scope['client'][0] if scope.get('client') else None
+        status = [500]
+
+        async def send_and_observe(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            elif message['type'] == 'http.response.body' and message.get('more_body') and not timer.streamed:
+                timer.streaming()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_observe)
+        finally:
+            inflight.registry.remove(entry)
+            # Upstream responses opened for a body that never started (the client left first)
+            await entry.aclose()
+            timer.finish(status[0])
+
+    async def mounted(self, scope, receive, send):
+        """Run a Flask route, cancelling the inflight entry of its stream once the client disconnects.
+
+        server.register_stream puts the entry in the scope. a2wsgi only receives
+        while the view reads its body, so once the response has started the
+        next message is the disconnect.
+        """
+        listener = None
+        finished = [False]
+
+        async def wait_for_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            entry = scope.get('inflight.entry')
+            if entry is not None and not finished[0]:
+                entry.cancel('disconnect')
+
+        async def send_and_watch(message):
+            nonlocal listener
+            if message['type'] == 'http.response.start' and scope.get('inflight.entry') is not None:
+                listener = asyncio.create_task(wait_for_disconnect())
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                # uvicorn also answers receive() with a disconnect once the response is complete
+                finished[0] = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_watch)
+        finally:
+            finished[0] = True
+            if listener is not None:
+                listener.cancel()
+
+
+async def relay_gemini_sse(route, path, payloads, timeout, on_complete=None, events=None):
+    """Yield standard SSE frames from a Gemini streamGenerateContent call.
+
+    ``payloads`` are ``(payload, cached_content)`` pairs tried in order, as from
+    context_cache.ContextCache.payloads. ``on_complete`` is called with the
+    full text once the stream finishes successfully; ``events`` adds typed
+    frames (see sse_relay.GeminiRelay).
+    """
+    relay = sse_relay.GeminiRelay(route, keep_text=on_complete is not None, events=events)
+    for payload, cached_content in payloads:
+        async with app.state.gemini.stream(
+            path,
+            headers={'Content-Type': 'application/json'},
+            json=payload,
+            timeout=timeout
+        ) as response:
+            print(f"[ASGI] Gemini stream status: {response.status_code}")
+            if cached_content and response.status_code in context_cache.STALE_STATUSES:
+                print(f"[CONTEXT-CACHE] {cached_content} refused ({response.status_code}), sending the prompt inline")
+                context_cache.cache.invalidate(cached_content)
+                continue
+            async for frame in relay.arelay(response, on_complete):
+                yield frame
+            return
+
+
+async def analyze_resume_stream(request):
+    """Async twin of server.analyze_resume_stream"""
+    try:
+        print("[RESUME-STREAM] Starting streaming resume analysis...")
+
+        form = await request.form()
+        file = form.get('resume')
+        if file is None or isinstance(file, str):
+            return JSONResponse({'error': 'No file uploaded'}, status_code=400)
+
+        language = form.get('language', 'en')
+        ledger.tag(language=language)
+        data = await file.read()
+
+        try:
+            # PDF extraction is CPU-bound, keep it off the event loop
+            resume_text = await run_in_threadpool(
+                resume.extract_text, file.filename or '', data, 'RESUME-STREAM'
+            )
+            resume_text, normalization = await run_in_threadpool(resume.normalize, resume_text, 'RESUME-STREAM')
+        except resume.ResumeError as e:
+            return JSONResponse({'error': e.message}, status_code=e.status)
+
+        if not server.GEMINI_API_KEY or server.GEMINI_API_KEY == 'YOUR_GEMINI_API_KEY_HERE':
+            print("[ERROR] Gemini API key not configured!")
+            return JSONResponse({'error': 'API key not configured in server.py'}, status_code=500)
+
+        template = prompts.get('resume-stream', language)
+        cache_key = analysis_cache.analysis_key(resume_text, language, True, gemini.generation_config())
+        cached = analysis_cache.cache.get(cache_key)
+        if cached is not None:
+            print("[RESUME-STREAM] Cache hit - replaying previous analysis")
+            return StreamingResponse(
+                inflight.aguard(prefixed(
+                    resume.usage_frame(normalization),
+                    analysis_cache.replay_frames(cached, resume_events.ResumeEvents())
+                )),
+                media_type='text/event-stream',
+                headers={**SSE_HEADERS, 'X-Cache': 'HIT'}
+            )
+
+        await admission.gemini.acquire_async(estimate_tokens(template.system + template.render(resume_text)))
+
+        # Identical uploads streamed concurrently attach to the same Gemini stream
+        return StreamingResponse(
+            inflight.aguard(prefixed(resume.usage_frame(normalization), flights.stream(f'resume-stream:{cache_key}', lambda: relay_gemini_sse(
+                '/api/analyze-resume/stream',
+                upstream.gemini_path(server.GEMINI_API_KEY, stream=True),
+                context_cache.cache.payloads(template, resume_text),
+                timeout=120,
+                on_complete=lambda text: analysis_cache.cache.put(cache_key, text),
+                events=resume_events.ResumeEvents()
+            )))),
+            media_type='text/event-stream',
+            headers={**SSE_HEADERS, 'X-Cache': 'MISS'}
+        )
+
+    except admission.Overloaded as e:
+        return overloaded(e)
+    except Exception as e:
+        print(f"[ERROR] Resume streaming exception: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def gemini_stream(request):
+    """Async twin of server.gemini_stream"""
+    try:
+        data = await request.json()
+        combined_parts, session = server.conversation_parts(data)
+        payload = gemini.build_payload(
+            combined_parts,
+            temperature=data.get('temperature', 0.7),
+            max_tokens=data.get('max_tokens', 4000)
+        )
+        await admission.gemini.acquire_async(admission.payload_tokens(payload))
+
+        print(f"[GEMINI-STREAM] Starting stream...")
+        key = singleflight.key_for('gemini-stream', payload, session.id if session else None)
+        return StreamingResponse(
+            inflight.aguard(flights.stream(key, lambda: relay_gemini_sse(
+                '/api/gemini/stream',
+                upstream.gemini_path(server.GEMINI_API_KEY, stream=True),
+                [(payload, None)],
+                timeout=60,
+                on_complete=server.session_recorder(session, data)
+            ))),
+            media_type='text/event-stream',
+            headers=SSE_HEADERS
+        )
+
+    except sessions.UnknownSession:
+        return JSONResponse({'error': 'Unknown session'}, status_code=404)
+    except admission.Overloaded as e:
+        return overloaded(e)
+    except Exception as e:
+        print(f"[ERROR] Gemini stream error: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def elevenlabs_tts_stream(request):
+    """Async twin of server.elevenlabs_tts_stream"""
+    try:
+        data = await request.json()
+        voice_id, payload = elevenlabs.tts_request(data)
+        ledger.tag(language=data.get('language'))
+        profile = elevenlabs.tts_profile(data.get('output_profile'), request.headers.get('Accept'), request.headers)
+        output_format, media_type, chunk_bytes = elevenlabs.TTS_PROFILES[profile]
+        headers = {**SSE_HEADERS, **elevenlabs.audio_headers(profile)}
+
+        key = tts_cache.cache_key(voice_id, payload, output_format)
+        audio = await run_in_threadpool(tts_cache.cache.get, key)
+        if audio is not None:
+            return Response(audio, media_type=media_type, headers={**headers, 'X-Cache': 'HIT'})
+
+        # Open the upstream stream before answering, like the Flask route
+        await admission.elevenlabs.acquire_async(len(payload['text']))
+        response = await app.state.elevenlabs.open_stream(
+            elevenlabs.tts_path(voice_id, profile, stream=True),
+            headers=elevenlabs.tts_headers(server.ELEVENLABS_API_KEY, media_type),
+            json=payload,
+            timeout=30
+        )
+        if response.is_success:
+            ledger.ledger.record(tts_characters=len(payload['text']))
+
+        async def generate():
+            chunks = []
+            try:
+                async for chunk in response.aiter_bytes(chunk_bytes):
+                    if chunk:
+                        chunks.append(chunk)
+                        yield chunk
+                if response.is_success:
+                    audio = b''.join(chunks)
+                    metrics.TTS_AUDIO_BYTES.labels('/api/elevenlabs/tts/stream', profile).inc(len(audio))
+                    await run_in_threadpool(tts_cache.cache.put, key, audio)
+            finally:
+                await response.aclose()
+
+        return StreamingResponse(
+            inflight.aguard(generate()), media_type=media_type, headers={**headers, 'X-Cache': 'MISS'}
+        )
+
+    except admission.Overloaded as e:
+        return overloaded(e)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def transcribe(audio, language, mime_type):
+    """Text of one recorded answer; WAV is preprocessed like /api/elevenlabs/stt"""
+    form = elevenlabs.stt_form(language)
+    upload = ('answer', audio, mime_type)
+    if audio[:4] == b'RIFF':
+        import stt_audio
+        result = await run_in_threadpool(stt_audio.preprocess_wav, audio)
+        if result is not None:
+            pcm, summary = result
+            print(f"[VOICE] Preprocessed audio: {summary}")
+            upload = ('audio.pcm', pcm.tobytes(), 'application/octet-stream')
+            form['file_format'] = stt_audio.STT_FILE_FORMAT
+
+    await admission.elevenlabs.acquire_async()
+    response = await app.state.elevenlabs.post(
+        '/v1/speech-to-text',
+        headers={'xi-api-key': server.ELEVENLABS_API_KEY},
+        files={'file': upload},
+        data=form,
+        timeout=30
+    )
+    if not response.is_success:
+        raise RuntimeError(f'STT failed: {response.status_code}')
+    result = response.json()
+    ledger.ledger.record(stt_seconds=elevenlabs.transcript_seconds(result))
+    return result.get('text', '')
+
+
+async def send_events(websocket, frame):
+    """Forward the events of one /api/interview/stream SSE frame as WebSocket text messages"""
+    if isinstance(frame, bytes):
+        frame = frame.decode('utf-8')
+    for line in frame.split('\n'):
+        if line.startswith('data: '):
+            await websocket.send_text(line[6:])
+
+
+async def voice_turn(websocket, voice, audio, entry):
+    """STT -> Gemini -> TTS for one answer, streamed back over ``websocket``.
+
+    ``entry`` is the turn's inflight entry; cancelling it stops the pipeline thread.
+    """
+    inflight.enter(entry)
+    entry.client = voice['client']
+    inflight.registry.add(entry)
+    # Cancelled from /api/inflight: stop the turn as a new answer would
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    entry.on_cancel(lambda: loop.call_soon_threadsafe(task.cancel))
+    try:
+        transcript = ''
+        if audio:
+            transcript = (await transcribe(audio, voice['language'], voice['mime_type'])).strip()
+        print(f"[VOICE] Transcript: {transcript[:50]}")
+        await websocket.send_json({'type': 'transcript', 'text': transcript})
+        if not transcript:
+            return
+
+        data = {'session_id': voice['session_id'], 'message': transcript}
+        combined_parts, session = server.conversation_parts(data)
+        payload = gemini.build_payload(combined_parts, temperature=0.7, max_tokens=voice['max_tokens'])
+        await admission.gemini.acquire_async(admission.payload_tokens(payload))
+
+        # Same pipeline as /api/interview/stream; it blocks, so it runs on the thread pool
+        frames = speech_pipeline.stream_speech(
+            server.GEMINI_API_KEY, server.ELEVENLABS_API_KEY, payload, voice['voice_id'],
+            on_complete=server.session_recorder(session, data), profile=voice['profile']
+        )
+        try:
+            async for frame in iterate_in_threadpool(frames):
+                await send_events(websocket, frame)
+        finally:
+            try:
+                await run_in_threadpool(frames.close)
+            except ValueError:
+                # Cancelled while a pool thread is still pulling the next frame: the pipeline sees
+                # the cancelled entry and ends on its own
+                pass
+
+    except (asyncio.CancelledError, WebSocketDisconnect):
+        raise
+    except admission.Overloaded as e:
+        await websocket.send_json({'type': 'error', 'error': {'message': str(e), 'retry_after': e.retry_after}})
+    except Exception as e:
+        print(f"[ERROR] Voice turn error: {str(e)}")
+        await websocket.send_json({'type': 'error', 'error': {'message': str(e)}})
+    finally:
+        inflight.registry.remove(entry)
+        await entry.aclose()
+
+
+async def voice_session(websocket):
+    """Full-duplex interview over one WebSocket.
+
+    Client -> server: a JSON ``start`` message (``language``, ``voice_id``,
+    optional ``session_id``, ``system``, ``messages``, ``mime_type``,
+    ``output_profile`` or ``audio_accept`` and ``network`` hints), then per
+    answer binary audio chunks followed by ``{"type": "end_of_turn"}``;
+    ``{"type": "cancel"}`` stops the reply being generated.
+    Server -> client: ``ready`` with the session id, ``transcript``, then the
+    same events as /api/interview/stream, ending with ``message_stop``.
+    """
+    await websocket.accept()
+    metrics.STREAMS_IN_FLIGHT.labels('/ws/voice').inc()
+    voice = None
+    audio = bytearray()
+    turn = None
+    turn_entry = None
+
+    def stop_turn(reason):
+        # The pipeline thread only notices a task cancellation at its next frame: cancel the entry too
+        if turn is not None and not turn.done():
+            turn_entry.cancel(reason)
+            turn.cancel()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('bytes') is not None:
+                # Buffered here while the candidate speaks, so the turn starts with the upload complete
+                audio.extend(message['bytes'])
+                continue
+
+            try:
+                event = json.loads(message.get('text') or '{}')
+            except ValueError:
+                event = None
+            if not isinstance(event, dict):
+                await websocket.send_json({'type': 'error', 'error': {'message': 'Messages must be JSON objects'}})
+                continue
+            kind = event.get('type')
+            if kind == 'start':
+                language = 'fr' if event.get('language') == 'fr' else 'en'
+                session = None
+                if event.get('session_id'):
+                    try:
+                        session = sessions.store.get(event['session_id'])
+                    except sessions.UnknownSession:
+                        pass
+                if session is None:
+                    session = sessions.store.create(
+                        system=event.get('system') or prompts.interview_system(language),
+                        language=language,
+                        messages=event.get('messages')
+                    )
+                voice = {
+                    'session_id': session.id,
+                    'language': language,
+                    'voice_id': event.get('voice_id', elevenlabs.DEFAULT_VOICE_ID),
+                    'mime_type': event.get('mime_type', 'audio/webm'),
+                    'max_tokens': event.get('max_tokens', 1000),
+                    # Browsers cannot set headers on a WebSocket: audio types and network hints come in the message
+                    'profile': elevenlabs.tts_profile(
+                        event.get('output_profile'), event.get('audio_accept'), event.get('network') or {}
+                    ),
+                    'client': websocket.client.host if websocket.client else None,
+                }
+                # Turns are tasks created from here, so they inherit these tags and the interactive priority
+                ledger.reset(route='/ws/voice', language=language, session_id=session.id)
+                admission.prioritize('/ws/voice')
+                print(f"[VOICE] Session {session.id} ready ({language})")
+                await websocket.send_json({'type': 'ready', 'session_id': session.id})
+            elif voice is None:
+                await websocket.send_json({'type': 'error', 'error': {'message': 'Send a start message first'}})
+            elif kind == 'end_of_turn':
+                # A new answer interrupts whatever reply is still being generated
+                stop_turn('interrupted')
+                turn_entry = inflight.Entry('/ws/voice')
+                turn = asyncio.ensure_future(voice_turn(websocket, voice, bytes(audio), turn_entry))
+                audio.clear()
+            elif kind == 'cancel':
+                audio.clear()
+                stop_turn('client')
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stop_turn('disconnect')
+        metrics.STREAMS_IN_FLIGHT.labels('/ws/voice').dec()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # httpx clients must be created inside the running event loop
+    app.state.gemini = upstream.AsyncUpstreamClient('gemini', upstream.GEMINI_BASE_URL)
+    app.state.elevenlabs = upstream.AsyncUpstreamClient('elevenlabs', upstream.ELEVENLABS_BASE_URL)
+    # Startup completes, and the worker starts accepting, once the pools are open
+    if os.environ.get('UPSTREAM_WARM', '1') == '1':
+        await asyncio.gather(app.state.gemini.warm(), app.state.elevenlabs.warm())
+    await run_in_threadpool(server.warm_worker, False)
+    try:
+        yield
+    finally:
+        await app.state.gemini.close()
+        await app.state.elevenlabs.close()
+        # uvicorn re-raises SIGTERM once the app has shut down, so atexit handlers never run
+        await run_in_threadpool(pdf_extract.shutdown)
+        await run_in_threadpool(ledger.ledger.flush)
+
+
+NATIVE_ROUTES = {
+    '/api/analyze-resume/stream': analyze_resume_stream,
+    '/api/gemini/stream': gemini_stream,
+    '/api/elevenlabs/tts/stream': elevenlabs_tts_stream,
+}
+
+app = Starlette(
+    routes=[
+        *(Route(path, endpoint, methods=['POST']) for path, endpoint in NATIVE_ROUTES.items()),
+        WebSocketRoute('/ws/voice', voice_session),
+        Mount('/', WSGIMiddleware(server.create_app())),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(RequestMetrics),
+    ],
+    lifespan=lifespan,
+)
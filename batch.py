@@ -0,0 +1,230 @@
+"""Bulk resume analysis jobs behind /api/analyze-resume/batch.
+
+An upload (several files and/or zip archives) becomes a job. Its files are
+extracted in parallel and graded with the same prompt and cache as
+/api/analyze-resume, with Gemini calls capped at BATCH_CONCURRENCY for the whole
+worker however many jobs are running. Results are appended in completion order
+and streamed as NDJSON; a client that loses the connection re-attaches with the
+job id and the number of results it already has. Jobs live in worker memory and
+are dropped BATCH_JOB_TTL seconds after they finish; re-attaching only finds a
+job on the worker process that created it, so batch jobs are refused when the
+server runs more than one worker (WEB_CONCURRENCY).
+"""
+import json
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import admission
+import inflight
+import ledger
+import pdf_extract
+import resume
+
+CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+EXTRACT_WORKERS = int(os.environ.get('BATCH_EXTRACT_WORKERS', pdf_extract.WORKERS))
+MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 500))
+MAX_FILE_BYTES = int(os.environ.get('BATCH_MAX_FILE_BYTES', 10 * 1024 * 1024))
+# Bytes of files a job may hold in worker memory, zip contents included
+MAX_TOTAL_BYTES = int(os.environ.get('BATCH_MAX_TOTAL_BYTES', 200 * 1024 * 1024))
+JOB_TTL = float(os.environ.get('BATCH_JOB_TTL', 3600))
+
+ROUTE = '/api/analyze-resume/batch'
+
+# Jobs live in one worker's memory: with several, a re-attach lands on the wrong one
+SINGLE_WORKER = int(os.environ.get('WEB_CONCURRENCY', 1)) <= 1
+
+_extractors = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix='batch-extract')
+_graders = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix='batch-grade')
+
+
+def collect_files(uploads):
+    """``(filename, data)`` pairs to grade from uploaded ``(filename, stream)``, expanding zips.
+
+    Streams are read no further than BATCH_MAX_FILE_BYTES per file and zips are
+    read in place, so only the files kept are held in memory. ``data`` is None
+    for larger files; they are reported as failed results rather than failing
+    the whole batch. Raises ResumeError (413) once the files kept add up to more
+    than BATCH_MAX_TOTAL_BYTES.
+    """
+    files = []
+    total = [0]
+
+    def keep(name, content):
+        if len(content) > MAX_FILE_BYTES:
+            files.append((name, None))
+            return
+        total[0] += len(content)
+        if total[0] > MAX_TOTAL_BYTES:
+            raise resume.ResumeError(f'At most {MAX_TOTAL_BYTES // (1024 * 1024)} MB of files per batch', 413)
+        files.append((name, content))
+
+    for filename, stream in uploads:
+        if not filename.lower().endswith('.zip'):
+            keep(filename, stream.read(MAX_FILE_BYTES + 1))
+            continue
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile:
+            raise resume.ResumeError(f'{filename} is not a valid zip archive')
+        for info in archive.infolist():
+            name = info.filename.rsplit('/', 1)[-1]
+            if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            if len(files) >= MAX_FILES:
+                raise resume.ResumeError(f'At most {MAX_FILES} files per batch', 413)
+            # The declared size can lie, so never read more than the limit
+            with archive.open(info) as member:
+                keep(name, member.read(MAX_FILE_BYTES + 1))
+    if len(files) > MAX_FILES:
+        raise resume.ResumeError(f'At most {MAX_FILES} files per batch', 413)
+    return files
+
+
+class BatchJob:
+    """One batch upload; grading starts as soon as the job is created"""
+
+    def __init__(self, api_key, language, files):
+        self.id = uuid.uuid4().hex
+        self.api_key = api_key
+        self.language = language
+        self.total = len(files)
+        self.results = []
+        self.finished_at = None if files else time.monotonic()
+        self._changed = threading.Condition()
+        for index, (filename, data) in enumerate(files):
+            _extractors.submit(self._extract, index, filename, data)
+
+    def done(self):
+        return len(self.results) >= self.total
+
+    def _extract(self, index, filename, data):
+        try:
+            if data is None:
+                raise resume.ResumeError(f'File is larger than {MAX_FILE_BYTES // (1024 * 1024)} MB', 413)
+            resume_text, normalization = resume.normalize(
+                resume.extract_text(filename, data, log_tag='BATCH'), log_tag='BATCH'
+            )
+        except resume.ResumeError as e:
+            self._add(index, filename, e.status, {'error': e.message})
+            return
+        except Exception as e:
+            print(f"[ERROR] Batch extraction exception: {str(e)}")
+            self._add(index, filename, 500, {'error': str(e)})
+            return
+        _graders.submit(self._grade, index, filename, resume_text, normalization)
+
+    def _grade(self, index, filename, resume_text, normalization):
+        # Pool threads outlive the request that created the job
+        ledger.reset(route=ROUTE, language=self.language)
+        admission.prioritize(ROUTE)
+        try:
+            while True:
+                try:
+                    status, body, cache_hit = resume.analyze(
+                        self.api_key, resume_text, self.language, route=ROUTE, log_tag='BATCH',
+                        normalization=normalization
+                    )
+                    break
+                except admission.Overloaded as e:
+                    # Nobody is waiting on a single file: back off instead of failing it
+                    time.sleep(e.retry_after)
+        except Exception as e:
+            print(f"[ERROR] Batch analysis exception: {str(e)}")
+            status, body, cache_hit = 500, {'error': str(e)}, False
+        self._add(index, filename, status, body, cache_hit)
+
+    def _add(self, index, filename, status, body, cache_hit=False):
+        with self._changed:
+            self.results.append({
+                'type': 'result',
+                'job_id': self.id,
+                'seq': len(self.results),
+                'index': index,
+                'filename': filename,
+                'status': status,
+                'cache': 'HIT' if cache_hit else 'MISS',
+                'response': body,
+            })
+            if self.done():
+                self.finished_at = time.monotonic()
+                print(f"[BATCH] Job {self.id} finished ({self.total} files)")
+            self._changed.notify_all()
+
+    def info(self):
+        with self._changed:
+            return {
+                'job_id': self.id,
+                'language': self.language,
+                'total': self.total,
+                'completed': len(self.results),
+                'failed': sum(1 for result in self.results if result['status'] >= 400),
+                'done': self.done(),
+            }
+
+    def lines(self, after=0):
+        """NDJSON: a job line, results from ``seq`` ``after`` on as they complete, then a done line.
+
+        Cancelling the current inflight entry (the client left) only ends this
+        listing: the job keeps running for a later re-attach.
+        """
+        entry = inflight.current()
+        if entry is not None:
+            entry.on_cancel(self._wake)
+        return self._lines(entry, after)
+
+    def _wake(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _lines(self, entry, after):
+        yield json.dumps({'type': 'job', **self.info()}) + '\n'
+        seq = max(after, 0)
+        while True:
+            with self._changed:
+                while seq >= len(self.results) and not self.done():
+                    if entry is not None and entry.cancelled is not None:
+                        return
+                    self._changed.wait()
+                pending = self.results[seq:]
+            for result in pending:
+                yield json.dumps(result) + '\n'
+            seq += len(pending)
+            if self.done() and seq >= len(self.results):
+                break
+        yield json.dumps({'type': 'done', **self.info()}) + '\n'
+
+
+class JobStore:
+    """Running jobs, plus finished ones for ``ttl`` seconds so clients can re-attach"""
+
+    def __init__(self, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, api_key, language, files):
+        job = BatchJob(api_key, language, files)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        """The job for ``job_id``, or None if unknown or expired"""
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.ttl:
+                del self._jobs[job_id]
+
+
+jobs = JobStore()
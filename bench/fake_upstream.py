@@ -0,0 +1,204 @@
+"""Local stand-ins for the Gemini and ElevenLabs APIs, for benchmarking the proxy.
+
+Run with:  python -m bench.fake_upstream --port 8900 --latency-ms 200 --token-rate 80
+
+Serves generateContent, streamGenerateContent?alt=sse, cachedContents,
+text-to-speech (plain and /stream) and speech-to-text with configurable
+latency, token rate and chunk sizes. Point the server at it with GEMINI_BASE_URL / ELEVENLABS_BASE_URL.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class Config:
+    def __init__(self, latency_ms=200, token_rate=80.0, tokens=300, chunk_tokens=4,
+                 audio_bytes=48000, audio_chunk=4096, audio_rate=64000, stt_latency_ms=300):
+        self.latency_ms = latency_ms
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.chunk_tokens = chunk_tokens
+        self.audio_bytes = audio_bytes
+        self.audio_chunk = audio_chunk
+        self.audio_rate = audio_rate
+        self.stt_latency_ms = stt_latency_ms
+
+
+def _audio_scale(query):
+    """Size of the requested TTS output_format relative to the 128 kbps MP3 default (audio_bytes)"""
+    output_format = parse_qs(query).get('output_format', ['mp3_44100_128'])[0]
+    try:
+        if output_format.startswith('pcm_'):
+            return int(output_format.split('_')[1]) * 16 / 128000
+        return int(output_format.rsplit('_', 1)[1]) / 128
+    except (IndexError, ValueError):
+        return 1.0
+
+
+def _text(tokens):
+    # Sentence ends every 12 tokens so the speech pipeline has something to segment
+    words = []
+    for i in range(tokens):
+        words.append('lorem.' if i % 12 == 11 else 'lorem')
+    return ' '.join(words) + ' '
+
+
+_cache_ids = itertools.count(1)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = Config()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_PATCH(self):
+        path = urlparse(self.path).path
+        self._read_body()
+        self._send_json({'name': path[len('/v1beta/'):]})
+
+    def do_POST(self):
+        try:
+            self._post()
+        except ConnectionError:
+            # The server cancelled the stream (its client left) and dropped the connection
+            self.close_connection = True
+
+    def _post(self):
+        url = urlparse(self.path)
+        path = url.path
+        self._read_body()
+        cfg = self.config
+        if path == '/v1beta/cachedContents':
+            self._send_json({'name': f'cachedContents/fake-{next(_cache_ids)}'})
+            return
+        time.sleep(cfg.latency_ms / 1000.0)
+
+        if path.endswith(':generateContent'):
+            time.sleep(cfg.tokens / cfg.token_rate)
+            self._send_json({
+                'candidates': [{
+                    'content': {'parts': [{'text': _text(cfg.tokens)}], 'role': 'model'},
+                    'finishReason': 'STOP'
+                }],
+                'usageMetadata': {'promptTokenCount': 500, 'candidatesTokenCount': cfg.tokens}
+            })
+        elif path.endswith(':streamGenerateContent'):
+            self._start_chunked('text/event-stream')
+            sent = 0
+            while sent < cfg.tokens:
+                count = min(cfg.chunk_tokens, cfg.tokens - sent)
+                time.sleep(count / cfg.token_rate)
+                event = {'candidates': [{'content': {'parts': [{'text': _text(count)}], 'role': 'model'}}]}
+                sent += count
+                if sent >= cfg.tokens:
+                    event['candidates'][0]['finishReason'] = 'STOP'
+                    event['usageMetadata'] = {'promptTokenCount': 500, 'candidatesTokenCount': cfg.tokens}
+                self._chunk(b'data: ' + json.dumps(event).encode('utf-8') + b'\r\n\r\n')
+            self._end_chunked()
+        elif path.startswith('/v1/text-to-speech/') and path.endswith('/stream'):
+            scale = _audio_scale(url.query)
+            self._start_chunked('audio/mpeg')
+            remaining = int(cfg.audio_bytes * scale)
+            while remaining > 0:
+                size = min(cfg.audio_chunk, remaining)
+                time.sleep(size / (cfg.audio_rate * scale))
+                self._chunk(b'\xff' * size)
+                remaining -= size
+            self._end_chunked()
+        elif path.startswith('/v1/text-to-speech/'):
+            scale = _audio_scale(url.query)
+            time.sleep(cfg.audio_bytes / cfg.audio_rate)
+            data = b'\xff' * int(cfg.audio_bytes * scale)
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif path == '/v1/speech-to-text':
+            time.sleep(cfg.stt_latency_ms / 1000.0)
+            self._send_json({'language_code': 'en', 'text': 'This is a transcribed benchmark answer.'})
+        else:
+            self._send_json({'error': f'unknown path {path}'}, status=404)
+
+
+def start(port=0, config=None):
+    """Start the stand-in server on a background thread; returns (server, base_url)"""
+    handler = type('ConfiguredHandler', (Handler,), {'config': config or Config()})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-upstream', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=200, help='delay before the first byte')
+    parser.add_argument('--token-rate', type=float, default=80, help='generated tokens per second')
+    parser.add_argument('--tokens', type=int, default=300, help='tokens per Gemini response')
+    parser.add_argument('--chunk-tokens', type=int, default=4, help='tokens per SSE event')
+    parser.add_argument('--audio-bytes', type=int, default=48000, help='bytes of audio per TTS response at 128 kbps (scaled for other output formats)')
+    parser.add_argument('--audio-chunk', type=int, default=4096, help='bytes per streamed audio chunk')
+    parser.add_argument('--audio-rate', type=float, default=64000, help='audio bytes generated per second')
+    parser.add_argument('--stt-latency-ms', type=float, default=300, help='speech-to-text processing time')
+
+
+def config_from_args(args):
+    return Config(
+        latency_ms=args.latency_ms,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        chunk_tokens=args.chunk_tokens,
+        audio_bytes=args.audio_bytes,
+        audio_chunk=args.audio_chunk,
+        audio_rate=args.audio_rate,
+        stt_latency_ms=args.stt_latency_ms,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, base_url = start(args.port, config_from_args(args))
+    print(f"[FAKE] Gemini/ElevenLabs stand-in listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,334 @@
+"""Benchmark the proxy's own overhead against local upstream stand-ins.
+
+Run with:  python -m bench.run --concurrency 16 --requests 64 --output bench_results.json
+
+Starts bench/fake_upstream.py and the server (pointed at it through
+GEMINI_BASE_URL / ELEVENLABS_BASE_URL), drives every route at the requested
+concurrency and writes time to first byte, time to first token, relay
+throughput, latency percentiles and per-request memory to a JSON file.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench import fake_upstream
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Scenario:
+    """One route to drive: ``kind`` is 'json', 'sse' or 'audio'"""
+
+    def __init__(self, name, path, kind, build):
+        self.name = name
+        self.path = path
+        self.kind = kind
+        self.build = build
+
+
+def _messages(tag):
+    return {
+        'system': 'You are a professional interviewer conducting a job interview.',
+        'messages': [{'role': 'user', 'content': f'Tell me about yourself. {tag}'}],
+        'max_tokens': 1000,
+    }
+
+
+def _resume(tag):
+    text = f'Jane Doe\nSenior engineer at Acme, 2018-2024. Led a team of 6. {tag}\nSkills: Python, SQL.\n'
+    return {'files': {'resume': ('resume.txt', text.encode('utf-8'))}, 'data': {'language': 'en'}}
+
+
+def _wav(tag):
+    # 1 s of silence, 16 kHz mono 16-bit PCM, with the tag in a trailing chunk to keep payloads distinct
+    samples = b'\x00\x00' * 16000
+    tag_bytes = tag.encode('ascii')
+    extra = b'LIST' + len(tag_bytes).to_bytes(4, 'little') + tag_bytes
+    header = (
+        b'RIFF' + (36 + len(samples) + len(extra)).to_bytes(4, 'little') + b'WAVE'
+        + b'fmt ' + (16).to_bytes(4, 'little') + (1).to_bytes(2, 'little') + (1).to_bytes(2, 'little')
+        + (16000).to_bytes(4, 'little') + (32000).to_bytes(4, 'little') + (2).to_bytes(2, 'little')
+        + (16).to_bytes(2, 'little') + b'data' + len(samples).to_bytes(4, 'little')
+    )
+    return header + samples + extra
+
+
+SCENARIOS = [
+    Scenario('gemini', '/api/gemini', 'json', lambda tag: {'json': _messages(tag)}),
+    Scenario('gemini_stream', '/api/gemini/stream', 'sse', lambda tag: {'json': _messages(tag)}),
+    Scenario('interview_stream', '/api/interview/stream', 'sse', lambda tag: {'json': _messages(tag)}),
+    Scenario('analyze_resume', '/api/analyze-resume', 'json', _resume),
+    Scenario('analyze_resume_stream', '/api/analyze-resume/stream', 'sse', _resume),
+    Scenario('tts', '/api/elevenlabs/tts', 'audio',
+             lambda tag: {'json': {'text': f'Thank you for your answer. {tag}', 'language': 'en'}}),
+    Scenario('tts_stream', '/api/elevenlabs/tts/stream', 'audio',
+             lambda tag: {'json': {'text': f'Thank you for your answer. {tag}', 'language': 'en'}}),
+    Scenario('stt', '/api/elevenlabs/stt', 'json',
+             lambda tag: {'files': {'audio': ('answer.wav', _wav(tag), 'audio/wav')}, 'data': {'language': 'en'}}),
+]
+
+
+def percentiles(values):
+    """p50/p95/p99 (nearest rank) in milliseconds"""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(p):
+        index = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+        return round(ordered[index] * 1000, 2)
+
+    return {'p50': rank(50), 'p95': rank(95), 'p99': rank(99), 'max': round(ordered[-1] * 1000, 2)}
+
+
+def rss_kb(pid):
+    """Resident memory of ``pid`` and all its descendants, in KiB (Linux only)"""
+    if not os.path.isdir('/proc'):
+        return None
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            pass
+        stack.extend(children.get(current, []))
+    return total
+
+
+class MemorySampler:
+    """Samples the server's RSS in the background to find the peak during a scenario"""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.pid is not None:
+            self.baseline = rss_kb(self.pid)
+            self.peak = self.baseline
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        else:
+            self.baseline = None
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            current = rss_kb(self.pid)
+            if current is not None and (self.peak is None or current > self.peak):
+                self.peak = current
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def run_request(session, url, scenario, tag):
+    """Issue one request and time it; returns a dict of raw measurements"""
+    started = time.perf_counter()
+    result = {'ok': False, 'ttfb': None, 'ttft': None, 'latency': None, 'bytes': 0, 'events': 0}
+    try:
+        response = session.post(url + scenario.path, stream=True, timeout=300, **scenario.build(tag))
+        for chunk in response.iter_content(chunk_size=None):
+            now = time.perf_counter()
+            if result['ttfb'] is None:
+                result['ttfb'] = now - started
+            if scenario.kind == 'sse':
+                if result['ttft'] is None and b'"text_delta"' in chunk:
+                    result['ttft'] = now - started
+                result['events'] += chunk.count(b'\n\n')
+            result['bytes'] += len(chunk)
+        result['latency'] = time.perf_counter() - started
+        result['ok'] = response.ok
+        result['status'] = response.status_code
+    except requests.RequestException as e:
+        result['error'] = str(e)
+    return result
+
+
+def run_scenario(url, scenario, concurrency, total, server_pid, repeat_payloads):
+    nonce = uuid.uuid4().hex[:8]
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+
+    def one(i):
+        tag = 'bench' if repeat_payloads else f'bench-{nonce}-{i}'
+        return run_request(session, url, scenario, tag)
+
+    with MemorySampler(server_pid) as memory:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(total)))
+        wall = time.perf_counter() - started
+
+    ok = [r for r in results if r['ok']]
+    total_events = sum(r['events'] for r in ok)
+    total_bytes = sum(r['bytes'] for r in ok)
+    summary = {
+        'route': scenario.path,
+        'requests': total,
+        'errors': total - len(ok),
+        'wall_s': round(wall, 3),
+        'requests_per_s': round(len(ok) / wall, 2) if wall else None,
+        'ttfb_ms': percentiles([r['ttfb'] for r in ok if r['ttfb'] is not None]),
+        'ttft_ms': percentiles([r['ttft'] for r in ok if r['ttft'] is not None]),
+        'latency_ms': percentiles([r['latency'] for r in ok if r['latency'] is not None]),
+        'events_per_s': round(total_events / wall, 2) if scenario.kind == 'sse' and wall else None,
+        'bytes_per_s': round(total_bytes / wall, 2) if wall else None,
+        'rss_baseline_kb': memory.baseline,
+        'rss_peak_kb': memory.peak,
+        'per_request_kb': (
+            round((memory.peak - memory.baseline) / min(concurrency, total), 1)
+            if memory.peak is not None and memory.baseline is not None else None
+        ),
+    }
+    failures = [r for r in results if not r['ok']]
+    if failures:
+        summary['first_error'] = failures[0].get('error') or f"HTTP {failures[0].get('status')}"
+    return summary
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', default=','.join(s.name for s in SCENARIOS),
+                        help='comma-separated scenario names')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=32, help='requests per route')
+    parser.add_argument('--url', help='benchmark an already running server instead of starting one')
+    parser.add_argument('--server-cmd', default='{python} server.py',
+                        help='command starting the server; {python} and {port} are substituted')
+    parser.add_argument('--repeat-payloads', action='store_true',
+                        help='send identical payloads (exercises caches and request coalescing)')
+    parser.add_argument('--output', default='bench_results.json')
+    fake_upstream.add_arguments(parser)
+    args = parser.parse_args()
+
+    wanted = args.routes.split(',')
+    scenarios = [s for s in SCENARIOS if s.name in wanted]
+
+    processes = []
+    server_pid = None
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            fake_port = free_port()
+            fake_cmd = [sys.executable, '-m', 'bench.fake_upstream', '--port', str(fake_port)]
+            for name in ('latency_ms', 'token_rate', 'tokens', 'chunk_tokens', 'audio_bytes',
+                         'audio_chunk', 'audio_rate', 'stt_latency_ms'):
+                fake_cmd += ['--' + name.replace('_', '-'), str(getattr(args, name))]
+            processes.append(subprocess.Popen(fake_cmd, cwd=ROOT))
+            fake_url = f'http://127.0.0.1:{fake_port}'
+
+            port = free_port()
+            env = dict(
+                os.environ,
+                PORT=str(port),
+                GEMINI_BASE_URL=fake_url,
+                ELEVENLABS_BASE_URL=fake_url,
+                GEMINI_API_KEY='bench',
+                ELEVENLABS_API_KEY='bench',
+            )
+            command = args.server_cmd.format(python=sys.executable, port=port).split()
+            server = subprocess.Popen(command, cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            processes.append(server)
+            server_pid = server.pid
+            url = f'http://127.0.0.1:{port}'
+            if not (wait_for(fake_url) and wait_for(url)):
+                sys.exit('[BENCH] Server or fake upstream did not start')
+
+        results = {}
+        for scenario in scenarios:
+            print(f"[BENCH] {scenario.name}: {args.requests} requests at concurrency {args.concurrency}...")
+            summary = run_scenario(url, scenario, args.concurrency, args.requests, server_pid, args.repeat_payloads)
+            results[scenario.name] = summary
+            latency = summary['latency_ms'] or {}
+            ttfb = summary['ttfb_ms'] or {}
+            print(f"        p50 {latency.get('p50')} ms  p99 {latency.get('p99')} ms  "
+                  f"ttfb p50 {ttfb.get('p50')} ms  errors {summary['errors']}")
+
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'git_commit': _git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'server_cmd': None if args.url else args.server_cmd,
+                'concurrency': args.concurrency,
+                'requests_per_route': args.requests,
+                'repeat_payloads': args.repeat_payloads,
+                'upstream': vars(fake_upstream.config_from_args(args)),
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] Wrote {args.output}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Gemini context caching for the static prefix of each prompt template.
+
+A background thread registers every template in prompts.py as a Gemini
+``cachedContents`` entry and extends its TTL before it expires. Requests then
+send only the variable part (the resume and closing reminder) with a
+``cachedContent`` reference. Nothing waits on the cache: until an entry is
+live, or if Gemini rejects it, requests fall back to the full inline prompt.
+Templates whose prefix is under the model's minimum cacheable size are never
+registered; they are logged once at startup and always sent inline.
+"""
+import os
+import threading
+import time
+
+import admission
+import gemini
+import upstream
+from tokens import estimate_tokens
+
+ENABLED = os.environ.get('GEMINI_CONTEXT_CACHE', '1') == '1'
+TTL_SECONDS = int(os.environ.get('GEMINI_CONTEXT_CACHE_TTL', 3600))
+REFRESH_MARGIN = float(os.environ.get('GEMINI_CONTEXT_CACHE_REFRESH', 300))
+RETRY_SECONDS = float(os.environ.get('GEMINI_CONTEXT_CACHE_RETRY', 900))
+# Gemini refuses cachedContents smaller than this many tokens
+MIN_TOKENS = int(os.environ.get('GEMINI_CONTEXT_CACHE_MIN_TOKENS', 1024))
+
+# Statuses meaning the cachedContent reference itself was refused; retried inline
+STALE_STATUSES = (400, 403, 404)
+
+
+class ContextCache:
+    """One live cachedContents entry per prompt template, kept fresh by a daemon thread"""
+
+    def __init__(self, client=upstream.gemini, ttl=TTL_SECONDS, refresh_margin=REFRESH_MARGIN,
+                 retry_seconds=RETRY_SECONDS, min_tokens=MIN_TOKENS):
+        self.client = client
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self.retry_seconds = retry_seconds
+        self.min_tokens = min_tokens
+        self._api_key = None
+        self._templates = []
+        self._entries = {}   # template key -> (name, expires_at)
+        self._retry_at = {}  # template key -> monotonic time of the next creation attempt
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, api_key, templates):
+        """Register ``templates`` in the background and keep them alive"""
+        self._api_key = api_key
+        self._templates = []
+        for template in templates:
+            size = estimate_tokens(template.prefix)
+            if size < self.min_tokens:
+                print(f"[CONTEXT-CACHE] Not caching {template.route}/{template.language}: "
+                      f"~{size} tokens is under the {self.min_tokens} token minimum, sending it inline")
+            else:
+                self._templates.append(template)
+        if self._templates and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='context-cache', daemon=True)
+            self._thread.start()
+
+    def name_for(self, template):
+        """The cachedContents name to use for ``template``, or None to send it inline"""
+        with self._lock:
+            entry = self._entries.get(template.key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def invalidate(self, name):
+        """Forget an entry Gemini refused and recreate it in the background"""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry[0] == name:
+                    del self._entries[key]
+        self._wake.set()
+
+    def payloads(self, template, resume_text, **generation):
+        """Request bodies to try in order: on top of the cached prefix (when live), then inline"""
+        name = self.name_for(template)
+        if name:
+            yield gemini.build_payload([{'text': template.variable(resume_text)}], cached_content=name, **generation), name
+        yield gemini.build_payload([{'text': template.render(resume_text)}], **generation), None
+
+    def post(self, template, resume_text, path, stream=False, timeout=60, **generation):
+        """POST a generateContent for ``template``, retrying inline if the cached prefix is refused"""
+        for payload, name in self.payloads(template, resume_text, **generation):
+            response = self.client.post(
+                path,
+                headers={'Content-Type': 'application/json'},
+                json=payload,
+                stream=stream,
+                timeout=timeout
+            )
+            if name and response.status_code in STALE_STATUSES:
+                print(f"[CONTEXT-CACHE] {name} refused ({response.status_code}), sending the prompt inline")
+                response.close()
+                self.invalidate(name)
+                continue
+            return response
+
+    def _run(self):
+        # Not a route in ROUTE_PRIORITIES: queued behind live calls as bulk work
+        admission.prioritize('context-cache')
+        while True:
+            self._wake.wait(self._refresh())
+            self._wake.clear()
+
+    def _refresh(self):
+        """Create or extend due entries; returns seconds until the next one is due"""
+        now = time.monotonic()
+        next_due = self.ttl
+        for template in self._templates:
+            with self._lock:
+                entry = self._entries.get(template.key)
+            if entry is None:
+                due = self._retry_at.get(template.key, 0)
+                if due <= now:
+                    self._create(template)
+                    due = self._retry_at.get(template.key, now + self.ttl - self.refresh_margin)
+            else:
+                due = entry[1] - self.refresh_margin
+                if due <= now:
+                    self._extend(template, entry[0])
+                    due = self._retry_at.get(template.key, now + self.ttl - self.refresh_margin)
+            next_due = min(next_due, max(1.0, due - time.monotonic()))
+        return next_due
+
+    def _create(self, template):
+        try:
+            admission.gemini.acquire(estimate_tokens(template.prefix))
+            response = self.client.post(
+                f'/v1beta/cachedContents?key={self._api_key}',
+                headers={'Content-Type': 'application/json'},
+                json={
+                    'model': f'models/{upstream.GEMINI_MODEL}',
+                    'displayName': f'intervue-{template.route}-{template.language}-v{template.version}',
+                    'systemInstruction': {'parts': [{'text': template.system}]},
+                    'contents': [{'role': 'user', 'parts': [{'text': template.instructions}]}],
+                    'ttl': f'{self.ttl}s',
+                },
+                timeout=30
+            )
+            if not response.ok:
+                raise RuntimeError(f'{response.status_code} - {response.text[:200]}')
+            name = response.json()['name']
+        except Exception as e:
+            print(f"[CONTEXT-CACHE] Could not cache {template.route}/{template.language}, "
+                  f"sending it inline: {str(e)}")
+            self._retry_at[template.key] = time.monotonic() + self.retry_seconds
+            return
+        with self._lock:
+            self._entries[template.key] = (name, time.monotonic() + self.ttl)
+        self._retry_at.pop(template.key, None)
+        print(f"[CONTEXT-CACHE] Cached {template.route}/{template.language} as {name}")
+
+    def _extend(self, template, name):
+        try:
+            admission.gemini.acquire()
+        except admission.Overloaded as e:
+            # The entry is still live: try again once there is quota
+            print(f"[CONTEXT-CACHE] TTL refresh of {name} postponed: {str(e)}")
+            self._retry_at[template.key] = time.monotonic() + e.retry_after
+            return
+        self._retry_at.pop(template.key, None)
+        try:
+            response = self.client.request(
+                'PATCH',
+                f'/v1beta/{name}?key={self._api_key}&updateMask=ttl',
+                headers={'Content-Type': 'application/json'},
+                json={'ttl': f'{self.ttl}s'},
+                timeout=30
+            )
+            ok = response.ok
+        except Exception as e:
+            print(f"[CONTEXT-CACHE] TTL refresh of {name} failed: {str(e)}")
+            ok = False
+        if ok:
+            with self._lock:
+                self._entries[template.key] = (name, time.monotonic() + self.ttl)
+            return
+        # Expired or deleted upstream: recreate it
+        self.invalidate(name)
+        self._create(template)
+
+
+cache = ContextCache()
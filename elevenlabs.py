@@ -0,0 +1,129 @@
+"""Request builders for the ElevenLabs Text-to-Speech and Speech-to-Text APIs"""
+import os
+import re
+
+DEFAULT_VOICE_ID = '1SM7GgM6IMuvQlz2BwM3'
+TTS_MODEL_ID = 'eleven_multilingual_v2'
+STT_MODEL_ID = 'scribe_v2'
+
+# TTS output profiles: ElevenLabs ``output_format``, the Content-Type the audio is served with and
+# the read size when relaying a stream (about 100 ms of audio, so small formats are not held back)
+TTS_PROFILES = {
+    'standard': ('mp3_44100_128', 'audio/mpeg', 1600),
+    'low-bitrate': ('mp3_22050_32', 'audio/mpeg', 400),
+    # Smallest frames and fastest first byte; plays in an <audio> element where Ogg Opus is supported
+    'low-latency': ('opus_48000_32', 'audio/ogg; codecs=opus', 400),
+    # Raw 16-bit little-endian mono, for clients that play through Web Audio or locally
+    'pcm': ('pcm_24000', 'audio/pcm; rate=24000', 4800),
+}
+DEFAULT_TTS_PROFILE = 'standard'
+# Below this Downlink client hint (Mbps), MP3 clients get the low-bitrate profile
+LOW_DOWNLINK_MBPS = float(os.environ.get('TTS_LOW_DOWNLINK_MBPS', 1.5))
+SLOW_CONNECTIONS = ('slow-2g', '2g', '3g')
+# Request headers an automatically chosen profile depends on
+TTS_VARY = 'Accept, Save-Data, ECT, Downlink'
+
+_MEDIA_PROFILES = {
+    'audio/ogg': 'low-latency',
+    'audio/opus': 'low-latency',
+    'audio/pcm': 'pcm',
+    'audio/l16': 'pcm',
+    'audio/mpeg': None,
+    'audio/mp3': None,
+}
+
+
+def tts_headers(api_key, media_type='audio/mpeg'):
+    return {
+        'Accept': media_type,
+        'Content-Type': 'application/json',
+        'xi-api-key': api_key
+    }
+
+
+def tts_path(voice_id, profile, stream=False):
+    """Upstream path of a TTS request producing ``profile`` audio"""
+    return f"/v1/text-to-speech/{voice_id}{'/stream' if stream else ''}?output_format={TTS_PROFILES[profile][0]}"
+
+
+def audio_headers(profile):
+    """Response headers describing negotiated audio (the Content-Type is set by the route)"""
+    return {'X-Audio-Profile': profile, 'Vary': TTS_VARY}
+
+
+def _accepted_audio(accept):
+    """Audio media types listed by name in an Accept value, preferred first"""
+    ranked = []
+    for position, item in enumerate((accept or '').split(',')):
+        media, _, params = item.partition(';')
+        media = media.strip().lower()
+        quality = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        if media in _MEDIA_PROFILES and quality > 0:
+            ranked.append((-quality, position, media))
+    return [media for _, _, media in sorted(ranked)]
+
+
+def constrained_network(hints):
+    """True when the client hints (Save-Data, ECT, Downlink) report a slow or metered connection"""
+    if (hints.get('Save-Data') or '').lower() == 'on':
+        return True
+    if (hints.get('ECT') or '').lower() in SLOW_CONNECTIONS:
+        return True
+    try:
+        downlink = float(hints.get('Downlink') or 0)
+    except ValueError:
+        return False
+    return 0 < downlink < LOW_DOWNLINK_MBPS
+
+
+def tts_profile(requested, accept, hints):
+    """Name of the output profile for a TTS request.
+
+    An explicit ``requested`` profile wins. Otherwise the first audio type the
+    ``accept`` value names picks it (Opus before MP3 when the client lists
+    both), and MP3 drops to the low bitrate when the network ``hints`` report a
+    slow connection. Clients that name no audio type get MP3.
+    """
+    if requested in TTS_PROFILES:
+        return requested
+    mp3 = 'low-bitrate' if constrained_network(hints) else DEFAULT_TTS_PROFILE
+    for media in _accepted_audio(accept):
+        return _MEDIA_PROFILES[media] or mp3
+    return mp3
+
+
+def tts_request(data):
+    """Return ``(voice_id, payload)`` for a TTS request body"""
+    voice_id = data.get('voice_id', DEFAULT_VOICE_ID)
+
+    # Use eleven_multilingual_v2 for automatic language detection
+    payload = {
+        'text': data.get('text', ''),
+        'model_id': TTS_MODEL_ID,
+        'voice_settings': {
+            'stability': 0.5,
+            'similarity_boost': 0.75
+        }
+    }
+    return voice_id, payload
+
+
+def stt_form(language):
+    """Form fields for a scribe_v2 transcription in ``language``"""
+    # ElevenLabs supports 'en' and 'fr' language codes
+    return {
+        'model_id': STT_MODEL_ID,
+        'language': 'fr' if language == 'fr' else 'en'  # Specify the language
+    }
+
+
+def transcript_seconds(result):
+    """Seconds of audio a transcription covered, up to its last word, for usage accounting"""
+    words = result.get('words') or []
+    return max((word.get('end') or 0.0 for word in words), default=0.0)
@@ -0,0 +1,109 @@
+"""Translation between the standard message format used by the frontend and Gemini's API.
+
+Shared by the Flask routes in server.py and the async routes in asgi.py so both
+serving modes build identical upstream payloads and identical responses.
+"""
+import json
+
+from upstream import GEMINI_MODEL
+
+
+def build_parts(data):
+    """Flatten ``system`` + ``messages`` from a request body into Gemini parts"""
+    messages = data.get('messages', [])
+    system_prompt = data.get('system', '')
+
+    # Combine system prompt with messages
+    combined_parts = []
+    if system_prompt:
+        combined_parts.append({'text': system_prompt + '\n\n'})
+
+    # Convert messages to Gemini format
+    for msg in messages:
+        if isinstance(msg.get('content'), str):
+            combined_parts.append({'text': msg['content']})
+        elif isinstance(msg.get('content'), list):
+            for content_block in msg['content']:
+                if content_block.get('type') == 'text':
+                    combined_parts.append({'text': content_block['text']})
+
+    return combined_parts
+
+
+def generation_config(temperature=0.7, max_tokens=4000):
+    return {
+        'temperature': temperature,
+        'maxOutputTokens': max_tokens,
+    }
+
+
+def build_payload(parts, temperature=0.7, max_tokens=4000, cached_content=None):
+    """Build a generateContent request body, optionally on top of a cachedContents prefix"""
+    payload = {
+        'contents': [{
+            'parts': parts
+        }],
+        'generationConfig': generation_config(temperature, max_tokens)
+    }
+    if cached_content:
+        payload['cachedContent'] = cached_content
+    return payload
+
+
+def format_response(gemini_response):
+    """Convert a generateContent response to the standard message structure"""
+    candidate = gemini_response.get('candidates', [{}])[0]
+
+    # Extract text from Gemini response
+    text_content = candidate.get('content', {}).get('parts', [{}])[0].get('text', '')
+
+    return {
+        'id': candidate.get('content', {}).get('role', 'model'),
+        'type': 'message',
+        'role': 'assistant',
+        'content': [{
+            'type': 'text',
+            'text': text_content
+        }],
+        'model': GEMINI_MODEL,
+        'stop_reason': candidate.get('finishReason', 'end_turn'),
+        'usage': {
+            'input_tokens': gemini_response.get('usageMetadata', {}).get('promptTokenCount', 0),
+            'output_tokens': gemini_response.get('usageMetadata', {}).get('candidatesTokenCount', 0)
+        }
+    }
+
+
+def sse_chunk(line):
+    """Return ``(text_delta, usage_metadata)`` for one line of Gemini's SSE stream; either may be None"""
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if not line.startswith('data: '):
+        return None, None
+
+    # Parse Gemini's streaming response
+    try:
+        gemini_data = json.loads(line[6:])  # Remove 'data: ' prefix
+    except json.JSONDecodeError:
+        return None, None
+
+    usage_metadata = gemini_data.get('usageMetadata')
+    if 'candidates' not in gemini_data:
+        return None, usage_metadata
+
+    # Extract text from Gemini response
+    return gemini_data['candidates'][0]['content']['parts'][0].get('text', ''), usage_metadata
+
+
+def delta_frame(text_delta):
+    """Standard SSE frame for a text delta"""
+    standard_format = {
+        'type': 'content_block_delta',
+        'index': 0,
+        'delta': {
+            'type': 'text_delta',
+            'text': text_delta
+        }
+    }
+
+    return f"data: {json.dumps(standard_format)}\n\n"
@@ -0,0 +1,180 @@
+"""Retries and hedged requests for the non-streaming Gemini calls.
+
+Transient failures (connection errors and 500/502/503/504) are retried up to
+GEMINI_RETRIES times with jittered exponential backoff. With GEMINI_HEDGE=1, a
+call that has not answered within the GEMINI_HEDGE_PERCENTILE latency of its
+route gets a second, identical request. The first good answer wins and the
+other response is closed when it arrives; requests cannot abort a call that is
+already waiting on the upstream. Hedges are capped at GEMINI_HEDGE_BUDGET of
+calls and only sent when admission quota is free right away, so a slow
+upstream is not hit with twice the load.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+import admission
+import metrics
+
+HEDGE_ENABLED = os.environ.get('GEMINI_HEDGE', '0') == '1'
+HEDGE_PERCENTILE = float(os.environ.get('GEMINI_HEDGE_PERCENTILE', 95))
+HEDGE_INITIAL_DELAY = float(os.environ.get('GEMINI_HEDGE_INITIAL_DELAY', 10))
+HEDGE_MIN_DELAY = float(os.environ.get('GEMINI_HEDGE_MIN_DELAY', 0.5))
+HEDGE_MAX_DELAY = float(os.environ.get('GEMINI_HEDGE_MAX_DELAY', 20))
+HEDGE_BUDGET = float(os.environ.get('GEMINI_HEDGE_BUDGET', 0.1))
+RETRIES = int(os.environ.get('GEMINI_RETRIES', 2))
+RETRY_BACKOFF = float(os.environ.get('GEMINI_RETRY_BACKOFF', 0.5))
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Latencies kept per route, and how many are needed before the percentile is trusted
+WINDOW = 500
+MIN_SAMPLES = 20
+
+HEDGES = metrics.registry.counter(
+    'intervue_gemini_hedges_total', 'Hedged Gemini requests sent, and how many of them answered first', ('route', 'outcome'))
+RETRIES_TOTAL = metrics.registry.counter(
+    'intervue_gemini_retries_total', 'Gemini requests retried after a transient failure', ('route', 'reason'))
+
+_attempts = ThreadPoolExecutor(max_workers=32, thread_name_prefix='gemini-hedge')
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies"""
+
+    def __init__(self, window=WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """The ``q``-th percentile, or None until MIN_SAMPLES calls have been seen"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+
+class Policy:
+    """Retry and hedging policy for one upstream"""
+
+    def __init__(self, limiter, hedge=HEDGE_ENABLED, percentile=HEDGE_PERCENTILE, retries=RETRIES,
+                 backoff=RETRY_BACKOFF, budget=HEDGE_BUDGET):
+        self.limiter = limiter
+        self.hedge = hedge
+        self.percentile = percentile
+        self.retries = retries
+        self.backoff = backoff
+        self.budget = budget
+        self.calls = 0
+        self.hedges = 0
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def _tracker(self, route):
+        with self._lock:
+            tracker = self._latency.get(route)
+            if tracker is None:
+                tracker = self._latency[route] = LatencyTracker()
+            return tracker
+
+    def hedge_delay(self, route):
+        """Seconds to wait for the first attempt before hedging, from the route's observed latency"""
+        latency = self._tracker(route).percentile(self.percentile)
+        if latency is None:
+            return HEDGE_INITIAL_DELAY
+        return min(max(latency, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    def call(self, route, send, units=0):
+        """Return the response of ``send()``, retried and hedged per this policy.
+
+        ``send`` makes one complete (non-streaming) request. The caller has
+        already been admitted for the first attempt; extra attempts go through
+        admission themselves, with ``units`` of volume each.
+        """
+        with self._lock:
+            self.calls += 1
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # Full jitter keeps retries from many workers from arriving together
+                time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+                self.limiter.acquire(units)
+            try:
+                response = self._attempt(route, send, units)
+            except requests.ConnectionError as e:
+                if attempt == self.retries:
+                    raise
+                print(f"[HEDGE] {route} connection error, retrying: {str(e)}")
+                RETRIES_TOTAL.labels(route, 'connection').inc()
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            print(f"[HEDGE] {route} answered {response.status_code}, retrying")
+            RETRIES_TOTAL.labels(route, str(response.status_code)).inc()
+            response.close()
+
+    def _timed(self, route, send):
+        started = time.perf_counter()
+        response = send()
+        if response.ok:
+            self._tracker(route).observe(time.perf_counter() - started)
+        return response
+
+    def _may_hedge(self, units):
+        with self._lock:
+            if self.hedges >= self.budget * self.calls:
+                return False
+            self.hedges += 1
+        try:
+            self.limiter.acquire(units, max_wait=0)
+        except admission.Overloaded:
+            with self._lock:
+                self.hedges -= 1
+            return False
+        return True
+
+    def _attempt(self, route, send, units):
+        if not self.hedge:
+            return self._timed(route, send)
+
+        first = _attempts.submit(self._timed, route, send)
+        done, _ = wait([first], timeout=self.hedge_delay(route))
+        if done or not self._may_hedge(units):
+            return first.result()
+
+        print(f"[HEDGE] {route} slower than its p{self.percentile:g}, sending a hedged request")
+        hedge = _attempts.submit(self._timed, route, send)
+        HEDGES.labels(route, 'sent').inc()
+        pending = {first, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().status_code not in RETRY_STATUSES:
+                    if future is hedge:
+                        HEDGES.labels(route, 'won').inc()
+                    for other in pending:
+                        other.add_done_callback(_discard)
+                    return future.result()
+                if pending:
+                    _discard(future)
+            if not pending:
+                # Both failed: report the last one, which the retry loop may retry
+                return future.result()
+
+
+def _discard(future):
+    """Close the response of the attempt that lost"""
+    if future.exception() is None:
+        future.result().close()
+
+
+gemini = Policy(admission.gemini)
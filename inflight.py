@@ -0,0 +1,320 @@
+"""Registry of in-flight streams and the upstream calls they hold, with client-disconnect cancellation.
+
+Every streaming response gets an entry while it is open. The pooled clients in
+upstream.py add each streaming Gemini or ElevenLabs call to the entry of the
+request that made it, so cancelling an entry shuts those upstream sockets down:
+a relay blocked on a read returns at once instead of at the next chunk, the
+connection is dropped, and the response ends quietly.
+
+Flask streams are cancelled when their client hangs up. Writing to a closed
+connection only fails a chunk or two later, so a watcher thread peeks at the
+client socket of every open stream each INFLIGHT_POLL_SECONDS instead. Under
+asgi.py Starlette already cancels a native stream when the client disconnects;
+its entries are cancelled by cancelling the task sending the body, and the
+mounted Flask streams are cancelled on the ASGI disconnect message.
+
+A stream shared through singleflight reads upstream in a ``shared`` entry of
+its own, cancelled once its last subscriber has left. /api/inflight lists the
+entries of the worker process that answers and cancels one by id.
+"""
+import asyncio
+import contextvars
+import os
+import socket
+import threading
+import time
+import uuid
+
+import ledger
+import metrics
+
+POLL_SECONDS = float(os.environ.get('INFLIGHT_POLL_SECONDS', 0.25))
+
+# Non-blocking peek at the client socket; without MSG_DONTWAIT (Windows) streams are not watched
+_PEEK_FLAGS = socket.MSG_PEEK | socket.MSG_DONTWAIT if hasattr(socket, 'MSG_DONTWAIT') else None
+
+_current = contextvars.ContextVar('inflight_entry', default=None)
+
+
+def _abort(response):
+    """Shut down the socket of a ``requests`` streaming response so a read blocked on it returns now.
+
+    Only the socket is touched: the thread reading the response closes it, as it would on any error.
+    """
+    connection = getattr(getattr(response, 'raw', None), 'connection', None)
+    sock = getattr(connection, 'sock', None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _hung_up(client):
+    """True once the peer of the ``client`` socket has closed the connection"""
+    try:
+        return client.recv(1, _PEEK_FLAGS) == b''
+    except (BlockingIOError, InterruptedError):
+        return False
+    except ValueError:
+        # TLS sockets refuse flags; such streams end when a write fails
+        return False
+    except OSError:
+        return True
+
+
+class Entry:
+    """One open stream (``kind`` 'stream') or shared upstream read ('shared')"""
+
+    def __init__(self, route, kind='stream'):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.kind = kind
+        self.started = time.time()
+        self.tags = {}
+        self.client = None
+        self.upstream = {}     # upstream name -> calls made
+        self.chunks = 0
+        self.cancelled = None  # reason, once cancelled
+        self._responses = []
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def track(self, name, response):
+        """Count an upstream call; its response is shut down if the entry is cancelled and closed at the end"""
+        with self._lock:
+            self.upstream[name] = self.upstream.get(name, 0) + 1
+            self._responses.append(response)
+            cancelled = self.cancelled is not None
+        if cancelled:
+            _abort(response)
+
+    def on_cancel(self, callback):
+        """Call ``callback`` (from any thread) when the entry is cancelled; now if it already is"""
+        with self._lock:
+            if self.cancelled is None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self, reason):
+        """Stop the stream and its upstream calls; False if it was already cancelled"""
+        with self._lock:
+            if self.cancelled is not None:
+                return False
+            self.cancelled = reason
+            responses = list(self._responses)
+            callbacks, self._callbacks = self._callbacks, []
+        print(f"[INFLIGHT] Cancelling {self.kind} {self.id} on {self.route}: {reason}")
+        metrics.STREAMS_CANCELLED.labels(self.route, reason).inc()
+        # Callbacks first: readers see the stream is cancelled before their upstream read fails
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[INFLIGHT] Cancel callback failed: {str(e)}")
+        for response in responses:
+            _abort(response)
+        return True
+
+    def _release(self):
+        with self._lock:
+            responses, self._responses = self._responses, []
+            self._callbacks = []
+        return responses
+
+    def close(self):
+        """Close the upstream responses still open once the stream is over (even if its body never started)"""
+        for response in self._release():
+            response.close()
+
+    async def aclose(self):
+        """close() for entries that may hold httpx responses"""
+        for response in self._release():
+            if hasattr(response, 'aclose'):
+                await response.aclose()
+            else:
+                response.close()
+
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'route': self.route,
+            'kind': self.kind,
+            'age_seconds': round(time.time() - self.started, 1),
+            'language': self.tags.get('language'),
+            'session_id': self.tags.get('session_id'),
+            'client': self.client,
+            'upstream': dict(self.upstream),
+            'chunks_sent': self.chunks,
+            'cancelled': self.cancelled,
+        }
+
+
+def enter(entry):
+    """Make ``entry`` the current one: upstream calls from this context (and copies of it) are added to it"""
+    _current.set(entry)
+    return entry
+
+
+def begin(route, kind='stream'):
+    """Start a new current entry for ``route``"""
+    return enter(Entry(route, kind))
+
+
+def current():
+    return _current.get()
+
+
+def track(name, response):
+    """Add an upstream streaming response to the current entry, if any"""
+    entry = _current.get()
+    if entry is not None:
+        entry.track(name, response)
+    return response
+
+
+class Registry:
+    """Entries of this process, and the watcher cancelling streams whose client has gone"""
+
+    def __init__(self, poll_seconds=POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._entries = {}
+        self._watched = {}  # entry id -> (entry, client socket)
+        self._lock = threading.Lock()
+        self._watcher_pid = None
+
+    def add(self, entry, client=None, address=None):
+        """List ``entry``; with a ``client`` socket it is cancelled as soon as that client hangs up"""
+        entry.tags = dict(ledger.tags())
+        if address is not None:
+            entry.client = address
+        with self._lock:
+            self._entries[entry.id] = entry
+            if client is not None and _PEEK_FLAGS is not None and self.poll_seconds > 0:
+                self._watched[entry.id] = (entry, client)
+                watch = True
+            else:
+                watch = False
+        if watch:
+            self._start_watcher()
+
+    def remove(self, entry):
+        with self._lock:
+            self._entries.pop(entry.id, None)
+            self._watched.pop(entry.id, None)
+
+    def cancel(self, entry_id, reason='admin'):
+        """Cancel the entry ``entry_id``; None if this process has no such entry"""
+        with self._lock:
+            entry = self._entries.get(entry_id)
+        if entry is None:
+            return None
+        entry.cancel(reason)
+        return entry
+
+    def snapshot(self):
+        """Every entry, oldest first"""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda entry: entry.started)
+        return [entry.snapshot() for entry in entries]
+
+    def _start_watcher(self):
+        # Threads do not survive a fork: each worker process starts its own
+        if self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='inflight-watcher', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            with self._lock:
+                watched = list(self._watched.values())
+            for entry, client in watched:
+                if entry.cancelled is None and _hung_up(client):
+                    with self._lock:
+                        self._watched.pop(entry.id, None)
+                    entry.cancel('disconnect')
+
+
+def guard(body):
+    """Iterate a streamed response ``body`` for the current entry.
+
+    Counts the chunks sent and ends the response quietly once the entry is
+    cancelled, however the aborted upstream read surfaced in ``body``.
+    """
+    entry = _current.get()
+    if entry is None:
+        return body
+    return _guarded(entry, body)
+
+
+def _guarded(entry, body):
+    try:
+        for chunk in body:
+            if entry.cancelled is not None:
+                return
+            entry.chunks += 1
+            yield chunk
+    except Exception:
+        if entry.cancelled is None:
+            raise
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+
+def aguard(body):
+    """Async guard(): cancelling the current entry, from any thread, cancels the task pulling from ``body``"""
+    entry = _current.get()
+    if entry is None:
+        return body
+    return _aguarded(entry, body)
+
+
+async def _aguarded(entry, body):
+    task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    pulling = [False]
+
+    def interrupt():
+        # Only while waiting on ``body``; between chunks the loop below sees ``cancelled`` itself
+        if pulling[0]:
+            task.cancel()
+
+    entry.on_cancel(lambda: loop.call_soon_threadsafe(interrupt))
+    registry.add(entry)
+    iterator = body.__aiter__()
+    try:
+        while entry.cancelled is None:
+            pulling[0] = True
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                pulling[0] = False
+            entry.chunks += 1
+            yield chunk
+    except asyncio.CancelledError:
+        if entry.cancelled is None:
+            raise
+        # Our own cancellation: end the response normally
+        if hasattr(task, 'uncancel'):
+            task.uncancel()
+    except Exception:
+        if entry.cancelled is None:
+            raise
+    finally:
+        aclose = getattr(body, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+
+registry = Registry()
@@ -0,0 +1,219 @@
+"""Persistent usage ledger for capacity planning.
+
+Every billed upstream call adds a row: Gemini input/output tokens, ElevenLabs
+TTS characters or STT audio seconds, tagged with the route, language and
+session of the request behind it. Rows go to an in-memory buffer that a
+background thread writes to SQLite in batches, so requests never wait on the
+disk. /api/usage returns aggregates.
+
+Tags live in a context variable: the route is set when a request starts and
+handlers add the language and session once they know them (``tag``). Threads
+that work for a request run in a copy of its context.
+"""
+import atexit
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+PATH = os.environ.get(
+    'USAGE_LEDGER_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'usage.sqlite3')
+)
+FLUSH_SECONDS = float(os.environ.get('USAGE_LEDGER_FLUSH_SECONDS', 5))
+BATCH_SIZE = int(os.environ.get('USAGE_LEDGER_BATCH_SIZE', 500))
+MAX_BUFFER = int(os.environ.get('USAGE_LEDGER_MAX_BUFFER', 50000))
+
+COLUMNS = ('ts', 'route', 'language', 'session_id', 'input_tokens', 'output_tokens', 'tts_characters',
+           'stt_seconds')
+# Accepted ``group_by`` values and the SQL they group on
+GROUPS = {
+    'route': 'route',
+    'language': 'language',
+    'session': 'session_id',
+    'day': "date(ts, 'unixepoch')",
+    'hour': "strftime('%Y-%m-%d %H:00', ts, 'unixepoch')",
+}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS usage (
+    ts REAL NOT NULL,
+    route TEXT NOT NULL,
+    language TEXT,
+    session_id TEXT,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    tts_characters INTEGER NOT NULL DEFAULT 0,
+    stt_seconds REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS usage_ts ON usage (ts);
+CREATE INDEX IF NOT EXISTS usage_route_ts ON usage (route, ts);
+"""
+_INSERT = f"INSERT INTO usage ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})"
+
+_tags = contextvars.ContextVar('usage_tags', default={})
+
+
+def reset(**tags):
+    """Start a request's tags over (``route``, ``language``, ``session_id``)"""
+    _tags.set(tags)
+
+
+def tag(**tags):
+    """Add tags to the current request's usage"""
+    _tags.set({**_tags.get(), **{key: value for key, value in tags.items() if value}})
+
+
+def tags():
+    """The current request's tags"""
+    return _tags.get()
+
+
+class Ledger:
+    """Buffered writer and aggregate queries over one SQLite file; ``path`` None disables it"""
+
+    def __init__(self, path=PATH, flush_seconds=FLUSH_SECONDS, batch_size=BATCH_SIZE, max_buffer=MAX_BUFFER):
+        self.path = path or None
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._buffer = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer_pid = None
+        self._schema_ready = False
+
+    def record(self, route=None, language=None, session_id=None, input_tokens=0, output_tokens=0,
+               tts_characters=0, stt_seconds=0.0):
+        """Queue one row.
+
+        Tags come from the request context; the arguments are used where it has
+        none, so a helper shared by several routes (the voice WebSocket runs
+        the /api/interview/stream pipeline) is billed to the route that called it.
+        """
+        if self.path is None:
+            return
+        tags = _tags.get()
+        row = (
+            time.time(),
+            tags.get('route') or route or 'unknown',
+            tags.get('language') or language,
+            tags.get('session_id') or session_id,
+            int(input_tokens or 0),
+            int(output_tokens or 0),
+            int(tts_characters or 0),
+            float(stt_seconds or 0.0),
+        )
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                # The writer is not keeping up: the oldest row is dropped
+                self.dropped += 1
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        self._start_writer()
+        if full:
+            self._wake.set()
+
+    def _start_writer(self):
+        # Threads do not survive a fork: each worker process starts its own
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+        threading.Thread(target=self._run, name='usage-ledger', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def _connect(self):
+        if not self._schema_ready:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Several worker processes share the file; WAL lets readers run during writes
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._schema_ready:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def flush(self):
+        """Write buffered rows now; returns how many were written"""
+        if self.path is None:
+            return 0
+        with self._write_lock:
+            with self._lock:
+                rows = list(self._buffer)
+                self._buffer.clear()
+            if not rows:
+                return 0
+            try:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.executemany(_INSERT, rows)
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                print(f"[LEDGER] Failed to write {len(rows)} usage rows: {str(e)}")
+                with self._lock:
+                    # Keep them for the next flush, behind nothing newer than them
+                    self._buffer.extendleft(reversed(rows))
+                return 0
+            return len(rows)
+
+    def aggregate(self, group_by=('route',), since=None, until=None):
+        """Totals per ``group_by`` combination between ``since`` and ``until`` (unix seconds), largest first.
+
+        Rows still buffered by this process are written first; other worker
+        processes may hold up to USAGE_LEDGER_FLUSH_SECONDS of theirs.
+        """
+        unknown = [name for name in group_by if name not in GROUPS]
+        if unknown:
+            raise ValueError(f"Unknown group_by {', '.join(unknown)}; use {', '.join(GROUPS)}")
+        if self.path is None:
+            return []
+        self.flush()
+
+        keys = [f'{GROUPS[name]} AS "{name}"' for name in group_by]
+        sums = ('COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(tts_characters), SUM(stt_seconds)')
+        query = f"SELECT {', '.join(keys + [sums])} FROM usage WHERE ts >= ? AND ts < ?"
+        if group_by:
+            query += f" GROUP BY {', '.join(GROUPS[name] for name in group_by)}"
+        query += ' ORDER BY SUM(input_tokens) + SUM(output_tokens) DESC'
+        params = (since if since is not None else 0, until if until is not None else time.time() + 1)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+        results = []
+        for row in rows:
+            calls, input_tokens, output_tokens, tts_characters, stt_seconds = row[len(group_by):]
+            if not calls:
+                continue
+            results.append({
+                **dict(zip(group_by, row[:len(group_by)])),
+                'calls': calls,
+                'input_tokens': input_tokens or 0,
+                'output_tokens': output_tokens or 0,
+                'tts_characters': tts_characters or 0,
+                'stt_seconds': round(stt_seconds or 0.0, 1),
+            })
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {'buffered': len(self._buffer), 'dropped': self.dropped}
+
+
+ledger = Ledger()
+atexit.register(ledger.flush)
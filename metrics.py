@@ -0,0 +1,291 @@
+"""Prometheus metrics for the routes and the upstream APIs, served at ``GET /metrics``.
+
+Recording a value never takes a lock: every thread updates its own shard of
+plain Python lists, and shards are only summed when /metrics is scraped. That
+keeps instrumentation out of the way of the SSE relay loops. Values are per
+worker process, so scrape every worker when serving with several processes.
+"""
+import bisect
+import threading
+import time
+
+from ledger import ledger
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_RATE_BUCKETS = (5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else str(int(value))
+    return str(value)
+
+
+def _merge(into, shard):
+    # list() snapshots the dict in one step, owners may add keys meanwhile
+    for key, cell in list(shard.items()):
+        total = into.get(key)
+        if total is None:
+            into[key] = list(cell)
+        else:
+            for i, value in enumerate(cell):
+                total[i] += value
+
+
+class _Value:
+    """One labelled counter or gauge series"""
+    __slots__ = ('_registry', '_key')
+
+    def __init__(self, registry, key):
+        self._registry = registry
+        self._key = key
+
+    def inc(self, amount=1):
+        shard = self._registry.shard()
+        cell = shard.get(self._key)
+        if cell is None:
+            cell = shard[self._key] = [0]
+        cell[0] += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _Buckets:
+    """One labelled histogram series: a count per bucket (the last one is +Inf) then the sum"""
+    __slots__ = ('_registry', '_key', '_bounds')
+
+    def __init__(self, registry, key, bounds):
+        self._registry = registry
+        self._key = key
+        self._bounds = bounds
+
+    def observe(self, value):
+        shard = self._registry.shard()
+        cell = shard.get(self._key)
+        if cell is None:
+            cell = shard[self._key] = [0] * (len(self._bounds) + 2)
+        cell[bisect.bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+
+class _Metric:
+    def __init__(self, registry, kind, name, help, labelnames, buckets=None):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+        self._children = {}
+
+    def labels(self, *values):
+        """The series for ``values`` (one per label name, in order)"""
+        child = self._children.get(values)
+        if child is None:
+            key = (self.name, values)
+            if self.kind == 'histogram':
+                child = _Buckets(self.registry, key, self.buckets)
+            else:
+                child = _Value(self.registry, key)
+            child = self._children.setdefault(values, child)
+        return child
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self, totals):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values in sorted(list(self._children)):
+            cell = totals.get((self.name, values))
+            if cell is None:
+                continue
+            if self.kind != 'histogram':
+                lines.append(f'{self.name}{_labels(self.labelnames, values)} {_number(cell[0])}')
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), cell):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, ("le", le))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, values)} {_number(cell[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, values)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Set of metrics whose values live in per-thread shards"""
+
+    def __init__(self):
+        self._metrics = []
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        # Taken once per thread (first record) and per scrape, never on the recording path
+        self._lock = threading.Lock()
+
+    def _add(self, *args, **kwargs):
+        metric = _Metric(self, *args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add('counter', name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add('gauge', name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add('histogram', name, help, labelnames, buckets)
+
+    def shard(self):
+        """This thread's private ``{series key: cell}`` dict"""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                # A thread per request would otherwise pile up shards between scrapes
+                self._retire_dead()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead(self):
+        """Fold the shards of exited threads into one (caller holds the lock)"""
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                _merge(self._retired, shard)
+        self._shards = live
+
+    def collect(self):
+        """Sum of every thread's shard; shards of exited threads are folded into one"""
+        totals = {}
+        with self._lock:
+            self._retire_dead()
+            _merge(totals, self._retired)
+            for _, shard in self._shards:
+                _merge(totals, shard)
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        totals = self.collect()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(totals))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    'intervue_http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+REQUEST_SECONDS = registry.histogram(
+    'intervue_http_request_duration_seconds', 'Time until the last byte of the response body', ('route',))
+REQUESTS_IN_FLIGHT = registry.gauge(
+    'intervue_http_requests_in_flight', 'Requests being handled, open streams included', ('route',))
+STREAMS_IN_FLIGHT = registry.gauge(
+    'intervue_streams_in_flight', 'Streaming responses currently open', ('route',))
+STREAMS_CANCELLED = registry.counter(
+    'intervue_streams_cancelled_total', 'Streams cancelled before the end (disconnect, admin, abandoned)',
+    ('route', 'reason'))
+UPSTREAM_TTFB = registry.histogram(
+    'intervue_upstream_ttfb_seconds', 'Time until the upstream response headers arrive', ('upstream', 'status'))
+UPSTREAM_ERRORS = registry.counter(
+    'intervue_upstream_errors_total', 'Upstream requests that failed without a response', ('upstream',))
+GEMINI_TTFT = registry.histogram(
+    'intervue_gemini_time_to_first_token_seconds', 'Time until the first text delta of a Gemini stream', ('route',))
+GEMINI_TOKENS_PER_SECOND = registry.histogram(
+    'intervue_gemini_stream_tokens_per_second', 'Candidate tokens per second after the first token', ('route',),
+    buckets=TOKEN_RATE_BUCKETS)
+GEMINI_TOKENS = registry.counter(
+    'intervue_gemini_tokens_total', 'Prompt and candidate tokens reported in usageMetadata', ('route', 'kind'))
+TTS_AUDIO_BYTES = registry.counter(
+    'intervue_tts_audio_bytes_total', 'Audio bytes generated by ElevenLabs (cache hits excluded)',
+    ('route', 'profile'))
+PDF_EXTRACT_SECONDS = registry.histogram(
+    'intervue_pdf_extract_seconds', 'PDF text extraction time', ('mode',))
+
+
+class RequestTimer:
+    """Counts one HTTP request from its start until its response body is closed"""
+
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.streamed = False
+        REQUESTS_IN_FLIGHT.labels(route).inc()
+
+    def streaming(self):
+        self.streamed = True
+        STREAMS_IN_FLIGHT.labels(self.route).inc()
+
+    def finish(self, status):
+        REQUEST_SECONDS.labels(self.route).observe(time.perf_counter() - self.started)
+        REQUESTS.labels(self.route, self.method, str(status)).inc()
+        REQUESTS_IN_FLIGHT.labels(self.route).dec()
+        if self.streamed:
+            STREAMS_IN_FLIGHT.labels(self.route).dec()
+
+
+def record_usage(route, usage_metadata):
+    """Add the token counts of a Gemini ``usageMetadata`` block, to the counters and the usage ledger"""
+    if not usage_metadata:
+        return
+    prompt_tokens = usage_metadata.get('promptTokenCount')
+    candidate_tokens = usage_metadata.get('candidatesTokenCount')
+    if prompt_tokens:
+        GEMINI_TOKENS.labels(route, 'prompt').inc(prompt_tokens)
+    if candidate_tokens:
+        GEMINI_TOKENS.labels(route, 'candidates').inc(candidate_tokens)
+    ledger.record(route, input_tokens=prompt_tokens, output_tokens=candidate_tokens)
+
+
+class GeminiStream:
+    """Time to first token and generation rate of one Gemini stream"""
+    __slots__ = ('route', 'started', 'first_token', 'usage')
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.usage = None
+
+    def chunk(self, text_delta, usage_metadata):
+        """Call for every parsed SSE chunk"""
+        if usage_metadata:
+            self.usage = usage_metadata
+        if text_delta and self.first_token is None:
+            self.first_token = time.perf_counter()
+            GEMINI_TTFT.labels(self.route).observe(self.first_token - self.started)
+
+    def finish(self):
+        """Call once when the stream ends, however it ends"""
+        if not self.usage:
+            return
+        record_usage(self.route, self.usage)
+        candidate_tokens = self.usage.get('candidatesTokenCount')
+        if candidate_tokens and self.first_token is not None:
+            elapsed = time.perf_counter() - self.first_token
+            if elapsed > 0:
+                GEMINI_TOKENS_PER_SECOND.labels(self.route).observe(candidate_tokens / elapsed)
@@ -0,0 +1,208 @@
+"""PDF text extraction off the request thread.
+
+Pages are extracted in parallel on a process pool so large or image-heavy CVs
+do not hold a worker's CPU and GIL while other users' streams stall. Uploads
+are bounded by page count and wall-clock time (parsing the page count
+included), and results are cached on the SHA-256 of the file so re-uploads
+skip extraction entirely.
+
+An upload that runs out of time fails on its own: new uploads go to a fresh
+pool while the extractions of other users finish on the old one, whose
+processes (runaway page included) are killed once those are done.
+"""
+import atexit
+import concurrent.futures
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+
+import metrics
+from analysis_cache import TTLCache
+
+MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES', 20))
+TIMEOUT_SECONDS = float(os.environ.get('PDF_EXTRACT_TIMEOUT', 15))
+WORKERS = int(os.environ.get('PDF_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+# PDFs up to this many pages are extracted in the request thread, saving a process round trip but
+# without the time limit: a crafted page can hold the thread for as long as it likes
+INLINE_MAX_PAGES = int(os.environ.get('PDF_INLINE_MAX_PAGES', 0))
+# Start the worker processes when the server starts rather than on the first upload
+WARM = os.environ.get('PDF_EXTRACT_WARM', '1') == '1'
+
+_cache = TTLCache(
+    max_entries=int(os.environ.get('PDF_CACHE_MAX_ENTRIES', 128)),
+    ttl=float(os.environ.get('PDF_CACHE_TTL', 3600))
+)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PdfExtractionError(Exception):
+    """The PDF could not be read within the configured limits"""
+
+
+def _extract_pages(data, start, stop):
+    """Extract text from pages [start, stop) of a PDF, each ended by a form feed (runs in a pool process)"""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    return [(reader.pages[i].extract_text() or '') + '\f' for i in range(start, stop)]
+
+
+def _count_pages(data):
+    """Page count of a PDF (runs in a pool process: parsing alone can be made arbitrarily slow)"""
+    import PyPDF2
+
+    return len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+
+
+def _noop():
+    import PyPDF2  # noqa: F401  (pre-import in the worker)
+
+
+def _watch_parent(parent_pid):
+    """Exit once the server process is gone, even if it died without shutting the pool down"""
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(1)
+        os._exit(0)
+
+    threading.Thread(target=watch, name='pdf-parent-watch', daemon=True).start()
+
+
+class _Pool:
+    """A process pool and the tasks submitted to it that have not finished"""
+
+    def __init__(self):
+        # spawn: forking a multi-threaded server process is not safe
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            # A server process killed by a signal never runs atexit
+            initializer=_watch_parent,
+            initargs=(os.getpid(),)
+        )
+        self.pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        future = self.executor.submit(fn, *args)
+        with self._lock:
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self.pending.discard(future)
+
+    def others(self, futures):
+        """Pending tasks other than ``futures``"""
+        with self._lock:
+            return self.pending - set(futures)
+
+    def kill(self):
+        # ProcessPoolExecutor has no public way to stop a running task
+        for process in list((getattr(self.executor, '_processes', None) or {}).values()):
+            process.terminate()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _Pool()
+        return _pool
+
+
+def _retire_pool(pool, futures):
+    """Stop using ``pool`` after its ``futures`` ran out of time or broke it.
+
+    New uploads get a fresh pool. The processes are killed, so a runaway page
+    stops consuming CPU, once the tasks of other uploads still running on the
+    pool are done (each is bounded by its own timeout).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for future in futures:
+        future.cancel()
+
+    def drain():
+        concurrent.futures.wait(pool.others(futures), timeout=TIMEOUT_SECONDS)
+        pool.kill()
+
+    threading.Thread(target=drain, name='pdf-pool-drain', daemon=True).start()
+
+
+@atexit.register
+def shutdown():
+    """Stop the worker processes (also at exit)"""
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _results(pool, futures, deadline):
+    """Results of ``futures`` submitted to ``pool``; raises PdfExtractionError past ``deadline`` or on failure"""
+    _, not_done = concurrent.futures.wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+    if not_done:
+        print(f"[PDF] Extraction timed out after {TIMEOUT_SECONDS}s")
+        _retire_pool(pool, futures)
+        raise PdfExtractionError(f'PDF took longer than {TIMEOUT_SECONDS:g}s to read')
+    try:
+        return [future.result() for future in futures]
+    except concurrent.futures.process.BrokenProcessPool as e:
+        _retire_pool(pool, futures)
+        raise PdfExtractionError(str(e))
+    except Exception as e:
+        raise PdfExtractionError(str(e))
+
+
+def warm():
+    """Start the worker processes ahead of the first upload"""
+    pool = _get_pool()
+    concurrent.futures.wait([pool.submit(_noop) for _ in range(WORKERS)])
+
+
+def extract_pdf_text(data):
+    """Return the text of a PDF given its raw bytes"""
+    key = hashlib.sha256(data).hexdigest()
+    cached = _cache.get(key)
+    if cached is not None:
+        print("[PDF] Cache hit - reusing extracted text")
+        return cached
+
+    started = time.perf_counter()
+    deadline = time.monotonic() + TIMEOUT_SECONDS
+    pool = _get_pool()
+    [page_count] = _results(pool, [pool.submit(_count_pages, data)], deadline)
+
+    if page_count > MAX_PAGES:
+        raise PdfExtractionError(f'PDF has {page_count} pages, the limit is {MAX_PAGES}')
+
+    if page_count <= INLINE_MAX_PAGES:
+        try:
+            text = ''.join(_extract_pages(data, 0, page_count))
+        except Exception as e:
+            raise PdfExtractionError(str(e))
+        metrics.PDF_EXTRACT_SECONDS.labels('inline').observe(time.perf_counter() - started)
+        _cache.put(key, text)
+        return text
+
+    # One contiguous page range per worker
+    per_task = -(-page_count // WORKERS)
+    ranges = [(start, min(start + per_task, page_count)) for start in range(0, page_count, per_task)]
+
+    futures = [pool.submit(_extract_pages, data, start, stop) for start, stop in ranges]
+    text = ''.join(page for pages in _results(pool, futures, deadline) for page in pages)
+
+    print(f"[PDF] Extracted {page_count} pages on {len(ranges)} worker(s)")
+    metrics.PDF_EXTRACT_SECONDS.labels('pool').observe(time.perf_counter() - started)
+    _cache.put(key, text)
+    return text
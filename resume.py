@@ -0,0 +1,115 @@
+"""Resume upload handling shared by the resume analysis routes"""
+import json
+
+import admission
+import analysis_cache
+import context_cache
+import gemini
+import hedging
+import metrics
+import pdf_extract
+import prompts
+import resume_normalize
+import singleflight
+import upstream
+from tokens import estimate_tokens
+
+
+class ResumeError(Exception):
+    """An upload that cannot be analyzed, with the HTTP status to report"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def extract_text(filename, data, log_tag='RESUME'):
+    """Return the text of an uploaded PDF or TXT resume given its raw bytes"""
+    if filename == '':
+        raise ResumeError('No file selected')
+
+    resume_text = ''
+    if filename.endswith('.pdf'):
+        try:
+            resume_text = pdf_extract.extract_pdf_text(data)
+        except pdf_extract.PdfExtractionError as e:
+            print(f"[ERROR] PDF extraction error: {str(e)}")
+            raise ResumeError(f'Failed to read PDF: {str(e)}')
+    elif filename.endswith('.txt'):
+        resume_text = data.decode('utf-8')
+    else:
+        raise ResumeError('Please upload a PDF or TXT file')
+
+    if not resume_text.strip():
+        raise ResumeError('No text found in the document')
+
+    print(f"[{log_tag}] Extracted {len(resume_text)} characters")
+    return resume_text
+
+
+def normalize(resume_text, log_tag='RESUME'):
+    """``(text, report)``: the extracted text cleaned up and cut to the input budget"""
+    text, report = resume_normalize.normalize(resume_text)
+    cut = f", cut: {', '.join(report['truncated_sections'])}" if report['truncated_sections'] else ''
+    print(f"[{log_tag}] Normalized {report['raw_tokens']} -> {report['tokens']} tokens{cut}")
+    # Clean-up can leave nothing of a document made only of boilerplate
+    if not text.strip():
+        raise ResumeError('No text found in the document')
+    return text, report
+
+
+def with_usage(body, report):
+    """``body`` with the normalization ``report`` in its ``usage`` block (error bodies unchanged)"""
+    if report is None or 'usage' not in body:
+        return body
+    return {**body, 'usage': {**body['usage'], 'normalization': report}}
+
+
+def usage_frame(report):
+    """Leading SSE frame of a streamed analysis carrying the normalization ``report``"""
+    return f"data: {json.dumps({'type': 'message_start', 'message': {'usage': {'normalization': report}}})}\n\n"
+
+
+def analyze(api_key, resume_text, language, route='/api/analyze-resume', log_tag='RESUME', max_wait=None,
+            normalization=None):
+    """Grade a resume without streaming.
+
+    Returns ``(status, body, cache_hit)`` where ``body`` is the
+    /api/analyze-resume response (or ``{'error': ...}``), with the
+    ``normalization`` report of ``resume_text`` added to its usage. Raises
+    admission.Overloaded if Gemini quota is not available within ``max_wait``.
+    """
+    template = prompts.get('resume', language)
+    cache_key = analysis_cache.analysis_key(resume_text, language, False, gemini.generation_config())
+    cached = analysis_cache.cache.get(cache_key)
+    if cached is not None:
+        print(f"[{log_tag}] Cache hit - returning previous analysis")
+        return 200, with_usage(cached, normalization), True
+
+    def call_gemini():
+        prompt_tokens = estimate_tokens(template.system + template.render(resume_text))
+        admission.gemini.acquire(prompt_tokens, max_wait)
+        print(f"[{log_tag}] Calling Gemini API...")
+        response = hedging.gemini.call(route, lambda: context_cache.cache.post(
+            template,
+            resume_text,
+            upstream.gemini_path(api_key),
+            timeout=60
+        ), prompt_tokens)
+
+        print(f"[{log_tag}] Response status: {response.status_code}")
+
+        if not response.ok:
+            print(f"[ERROR] Gemini error: {response.text}")
+            return response.status_code, {'error': response.text}
+
+        gemini_response = response.json()
+        metrics.record_usage(route, gemini_response.get('usageMetadata'))
+        formatted_response = gemini.format_response(gemini_response)
+        analysis_cache.cache.put(cache_key, formatted_response)
+        return response.status_code, formatted_response
+
+    # Identical uploads analyzed concurrently share one Gemini call
+    status, body = singleflight.group.do(f'resume:{cache_key}', call_gemini)
+    return status, with_usage(body, normalization), False
@@ -0,0 +1,114 @@
+"""Typed SSE events for a streamed resume analysis.
+
+The resume prompt makes Gemini open with ``Grade: B+ (85/100)`` (``Note : B+
+(85/100)`` in French) and introduce each part of the feedback with a
+``**Title**`` line. ResumeEvents follows the relayed text deltas and emits, next
+to the ``content_block_delta`` frames:
+
+- ``grade`` with ``letter`` and ``score`` (None if the model gave no score), as
+  soon as the score is complete;
+- ``section_start`` with ``index``, ``title`` and ``offset``, once a heading
+  line is complete;
+- ``section_end`` with ``index``, ``title`` and ``offset`` when the next section
+  starts or the stream ends.
+
+Offsets are positions in the concatenated delta text in UTF-16 code units, the
+unit of JavaScript string indices. A section runs from its heading line to the
+next one, so the client can lay out the feedback without searching the text.
+Each delta is scanned once and only the current line is kept, so the cost is
+linear in the length of the analysis.
+"""
+import json
+import re
+
+# Before the first section only: "Grade: B+ (85/100)", "Note : B+ (85/100)", "**Grade:** A"
+_GRADE = re.compile(
+    r'(?:^|[^\w])(?:grade|note|score)\s*\**\s*:\s*\**\s*([A-F][+-]?)(?![\w+-])\**'
+    r'(?:\s*\(\s*(\d{1,3})\s*(?:/|sur|out of)\s*100\s*\))?',
+    re.I
+)
+# "**Strengths**", "**ATS Optimization**.", "**Strengths** (2-3 points)", "## Strengths"
+_HEADING = re.compile(
+    r'^(?:#{1,4}\s+(?P<hash>[^#].*?)\s*#*'
+    r'|\*\*(?P<bold>[^*]+?)\*\*\s*[.:]?\s*(?:\([^)]*\)\s*[.:]?)?)\s*$'
+)
+MAX_TITLE_WORDS = 8
+
+
+def _units(text):
+    """Length of ``text`` in UTF-16 code units"""
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+
+def event_frame(event):
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def heading_title(line):
+    """Title of a section heading line, or None"""
+    match = _HEADING.match(line.strip())
+    if match is None:
+        return None
+    title = (match.group('hash') or match.group('bold')).strip(' :.')
+    if not title or len(title.split()) > MAX_TITLE_WORDS:
+        return None
+    return title
+
+
+class ResumeEvents:
+    """Incremental grade and section detection over the text deltas of one analysis"""
+
+    def __init__(self):
+        self.grade = None
+        self.sections = []
+        self._line = ''
+        self._line_offset = 0
+
+    def feed(self, text):
+        """Consume one delta; return the event frames it completes"""
+        frames = []
+        lines = text.split('\n')
+        for i, part in enumerate(lines):
+            self._line += part
+            if i < len(lines) - 1:
+                self._complete_line(frames)
+            elif self.grade is None and not self.sections:
+                # A scored grade needs no line end: show it while the rest of the line streams
+                self._find_grade(frames, complete=False)
+        return frames
+
+    def close(self):
+        """Event frames for the end of the stream (the last line, the open section)"""
+        frames = []
+        if self._line:
+            self._complete_line(frames, newline=False)
+        if self.sections:
+            frames.append(self._section_end(self._line_offset))
+        return frames
+
+    def _complete_line(self, frames, newline=True):
+        line = self._line
+        if self.grade is None and not self.sections:
+            self._find_grade(frames, complete=True)
+        title = heading_title(line)
+        if title is not None:
+            if self.sections:
+                frames.append(self._section_end(self._line_offset))
+            self.sections.append(title)
+            frames.append(event_frame({
+                'type': 'section_start', 'index': len(self.sections) - 1, 'title': title, 'offset': self._line_offset
+            }))
+        self._line_offset += _units(line) + (1 if newline else 0)
+        self._line = ''
+
+    def _find_grade(self, frames, complete):
+        match = _GRADE.search(self._line)
+        if match is None or (match.group(2) is None and not complete):
+            return
+        score = int(match.group(2)) if match.group(2) else None
+        self.grade = {'letter': match.group(1).upper(), 'score': score}
+        frames.append(event_frame({'type': 'grade', **self.grade}))
+
+    def _section_end(self, offset):
+        index = len(self.sections) - 1
+        return event_frame({'type': 'section_end', 'index': index, 'title': self.sections[index], 'offset': offset})
@@ -0,0 +1,184 @@
+"""Cleanup of extracted resume text before it goes into a prompt.
+
+PDF extraction ends every page with a form feed. Lines repeated at the top or
+bottom of most pages (running headers, footers, page numbers) are dropped,
+words hyphenated across a line break are rejoined, ligatures, icon-font glyphs
+and control characters are normalized away and whitespace is collapsed. If the
+text is still over RESUME_MAX_INPUT_TOKENS, sections are cut least important
+first (interests and references before experience), so what the analysis needs
+is what reaches Gemini.
+"""
+import math
+import os
+import re
+import unicodedata
+
+import metrics
+from tokens import CHARS_PER_TOKEN, estimate_tokens
+
+ENABLED = os.environ.get('RESUME_NORMALIZE', '1') == '1'
+MAX_INPUT_TOKENS = int(os.environ.get('RESUME_MAX_INPUT_TOKENS', 8000))
+
+PAGE_BREAK = '\f'
+# Non-empty lines at each end of a page that may be a running header or footer
+EDGE_LINES = 3
+# Share of the pages a line must appear on to count as boilerplate
+REPEAT_SHARE = 0.6
+TRUNCATION_MARK = '[...]'
+
+# Sections kept first when over budget; text before the first heading (name, contact) ranks 0
+SECTION_PRIORITY = (
+    (1, ('experience', 'expérience', 'employment', 'work history', 'parcours')),
+    (2, ('summary', 'profile', 'profil', 'objective', 'objectif', 'about me', 'à propos')),
+    (3, ('skills', 'compétences', 'competencies', 'expertise')),
+    (4, ('education', 'formation', 'études', 'diplômes')),
+    (5, ('projects', 'projets', 'certifications', 'achievements', 'réalisations', 'awards', 'distinctions')),
+    (6, ('languages', 'langues', 'publications', 'volunteer', 'bénévolat', 'activities', 'activités')),
+    (7, ('interests', 'hobbies', 'intérêt', 'loisirs', 'references', 'références')),
+)
+# Headings that match no keyword above (an all-caps line)
+OTHER_PRIORITY = 5
+
+_DIGITS = re.compile(r'\d+')
+_PAGE_NUMBER = re.compile(r'^(page|p\.)?\s*[-–—]?\s*\d{1,3}\s*((/|of|sur|de)\s*\d{1,3})?\s*[-–—]?$', re.I)
+_HYPHENATED = re.compile(r'(\w)[-\u00ad]\n([a-z\u00e0-\u00f6\u00f8-\u00ff])')
+_SPACES = re.compile(r'[ \t\u00a0\u2000-\u200a\u202f\u205f\u3000]+')
+_PRIVATE_USE = re.compile(r'[\ue000-\uf8ff]')
+_JUNK = re.compile(r'\(cid:\d+\)|[\x00-\x08\x0b-\x1f\x7f-\x9f\u00ad\u200b-\u200f\u2060\ufeff\ufffd]')
+_REPEATED_SYMBOL = re.compile(r'([^\w\s])\1{3,}')
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+RESUME_TOKENS = metrics.registry.counter(
+    'intervue_resume_tokens_total', 'Estimated resume tokens before and after normalization', ('stage',))
+
+
+def _line_key(line):
+    # Page numbers inside otherwise identical headers ("Jane Doe - page 2") still match
+    return _DIGITS.sub('#', line.lower())
+
+
+def _edges(lines):
+    """Indices of the first and last EDGE_LINES non-empty lines"""
+    filled = [i for i, line in enumerate(lines) if line]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def strip_boilerplate(pages):
+    """Drop running headers, footers and page numbers; returns ``(pages, lines removed)``"""
+    if len(pages) < 2:
+        return pages, 0
+    seen = {}
+    for lines in pages:
+        for key in {_line_key(lines[i]) for i in _edges(lines)}:
+            seen[key] = seen.get(key, 0) + 1
+    threshold = max(2, math.ceil(REPEAT_SHARE * len(pages)))
+
+    cleaned = []
+    removed = 0
+    for lines in pages:
+        edges = _edges(lines)
+        kept = []
+        for i, line in enumerate(lines):
+            if i in edges and (seen[_line_key(line)] >= threshold or _PAGE_NUMBER.match(line)):
+                removed += 1
+                continue
+            kept.append(line)
+        cleaned.append(kept)
+    return cleaned, removed
+
+
+def clean(text):
+    """``(text, boilerplate lines removed)`` with layout artifacts and junk characters removed"""
+    text = _PRIVATE_USE.sub('•', unicodedata.normalize('NFKC', text))
+    pages = [
+        [_SPACES.sub(' ', line).strip() for line in page.splitlines()]
+        for page in text.split(PAGE_BREAK) if page.strip()
+    ]
+    pages, removed = strip_boilerplate(pages)
+    text = '\n'.join('\n'.join(lines) for lines in pages)
+    text = _HYPHENATED.sub(r'\1\2', text)
+    text = _JUNK.sub('', text)
+    text = _REPEATED_SYMBOL.sub(r'\1\1\1', text)
+    return _BLANK_LINES.sub('\n\n', text).strip(), removed
+
+
+def heading_priority(line):
+    """Priority of the section ``line`` starts, or None if it is not a heading"""
+    if not line or len(line) > 40 or len(line.split()) > 5 or line.endswith('.'):
+        return None
+    key = line.lower().strip(' :•-–—|')
+    for priority, names in SECTION_PRIORITY:
+        if any(name in key for name in names):
+            return priority
+    if line.isupper() and len(line.split()) <= 4:
+        return OTHER_PRIORITY
+    return None
+
+
+def split_sections(text):
+    """``[priority, title, lines]`` per section, in document order"""
+    sections = [[0, 'header', []]]
+    for line in text.split('\n'):
+        priority = heading_priority(line)
+        if priority is not None:
+            sections.append([priority, line.strip(' :'), []])
+        sections[-1][2].append(line)
+    return [section for section in sections if any(section[2])]
+
+
+def truncate(text, max_tokens):
+    """``(text, titles of the sections cut)`` fitting ``max_tokens``, least important sections cut first"""
+    if estimate_tokens(text) <= max_tokens:
+        return text, []
+    sections = split_sections(text)
+    remaining = max_tokens * CHARS_PER_TOKEN
+    kept = {}
+    for index in sorted(range(len(sections)), key=lambda i: (sections[i][0], i)):
+        lines = sections[index][2]
+        size = sum(len(line) + 1 for line in lines)
+        if size <= remaining:
+            kept[index] = lines
+            remaining -= size
+            continue
+        # Keep the start of the section (its heading first) up to what is left
+        partial = []
+        room = remaining - len(TRUNCATION_MARK) - 1
+        for line in lines:
+            if len(line) + 1 > room:
+                if room > 1:
+                    # PDF text often comes as a few very long lines: cut the one that overflows, at a word if possible
+                    head = line[:room - 1]
+                    boundary = head.rfind(' ')
+                    head = (head[:boundary] if boundary > 0 else head).rstrip()
+                    if head:
+                        partial.append(head)
+                        room -= len(head) + 1
+                break
+            partial.append(line)
+            room -= len(line) + 1
+        if partial:
+            kept[index] = partial + [TRUNCATION_MARK]
+            remaining = room
+    cut = [sections[i][1] for i in range(len(sections)) if kept.get(i) is not sections[i][2]]
+    text = '\n'.join(line for i in range(len(sections)) for line in kept.get(i, ()))
+    return text, cut
+
+
+def normalize(text, max_tokens=MAX_INPUT_TOKENS):
+    """``(text, report)``: the text to send and a token summary for the response ``usage`` block"""
+    raw_tokens = estimate_tokens(text)
+    removed, cut = 0, []
+    if ENABLED:
+        text, removed = clean(text)
+        if max_tokens > 0:
+            text, cut = truncate(text, max_tokens)
+    tokens = estimate_tokens(text)
+    RESUME_TOKENS.labels('raw').inc(raw_tokens)
+    RESUME_TOKENS.labels('sent').inc(tokens)
+    return text, {
+        'raw_tokens': raw_tokens,
+        'tokens': tokens,
+        'saved_tokens': raw_tokens - tokens,
+        'boilerplate_lines': removed,
+        'truncated_sections': cut,
+    }
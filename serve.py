@@ -0,0 +1,93 @@
+"""Production launcher.
+
+Run with:  python serve.py
+
+Starts gunicorn with a worker model suited to long-lived streams: uvicorn
+workers serving asgi:app when uvicorn is installed ("async"), otherwise
+threaded gthread workers serving the Flask app ("threaded"); SERVER_WORKER_MODEL
+picks one explicitly. The app is imported and preloaded once in the master and
+shared copy-on-write by the workers. Each worker then opens its upstream
+connection pools and starts its background work before it accepts a
+connection, so the first requests after a deploy run at steady-state speed.
+
+One worker by default: sessions, batch jobs and open streams live in the
+worker process. With more (WEB_CONCURRENCY) a follow-up request may reach a
+worker that does not hold its session, batch uploads are refused, and the
+admission quotas are split between the workers.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from gunicorn.app.base import BaseApplication
+
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', 5000))
+WORKER_MODEL = os.environ.get('SERVER_WORKER_MODEL', 'auto')
+WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+THREADS = int(os.environ.get('SERVER_THREADS', 32))
+# Seconds a stream may keep running after a restart signal before its worker is killed
+GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 60))
+
+
+def worker_model():
+    """'async' or 'threaded'"""
+    if WORKER_MODEL in ('async', 'threaded'):
+        return WORKER_MODEL
+    try:
+        import uvicorn.workers  # noqa: F401
+    except ImportError:
+        return 'threaded'
+    return 'async'
+
+
+def post_fork(arbiter, worker):
+    import server
+    server.warm_worker(background=False)
+
+
+class Launcher(BaseApplication):
+    """gunicorn configured from the environment instead of the command line"""
+
+    def __init__(self, model):
+        self.model = model
+        super().__init__()
+
+    def load_config(self):
+        settings = {
+            'bind': f'{HOST}:{PORT}',
+            'workers': WORKERS,
+            'preload_app': True,
+            'post_fork': post_fork,
+            'graceful_timeout': GRACEFUL_TIMEOUT,
+        }
+        if self.model == 'async':
+            settings['worker_class'] = 'uvicorn.workers.UvicornWorker'
+        else:
+            settings['worker_class'] = 'gthread'
+            settings['threads'] = THREADS
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        if self.model == 'async':
+            import asgi
+            return asgi.app
+        import server
+        return server.create_app()
+
+
+def main():
+    model = worker_model()
+    detail = f'{WORKERS} uvicorn worker(s)' if model == 'async' else f'{WORKERS} worker(s) x {THREADS} threads'
+    print(f"🚀 Starting Intervue AI - PRODUCTION MODE ({model}: {detail})")
+    print(f"🌐 Server running on {HOST}:{PORT}")
+    if WORKERS > 1:
+        print("⚠️  Sessions are per worker and batch jobs are disabled: run one worker per instance")
+    Launcher(model).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,196 @@
-from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
+from flask import Blueprint, Flask, request, jsonify, send_from_directory, Response, stream_with_context, g
 from flask_cors import CORS
-import requests
-import PyPDF2
-import io
+import hmac
+import itertools
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+# Before the imports below: they read their settings from the environment
 load_dotenv()
-import json
-
-app = Flask(__name__)
-CORS(app)
+import admission
+import analysis_cache
+import batch
+import context_cache
+import elevenlabs
+import gemini
+import hedging
+import inflight
+import ledger
+import metrics
+import pdf_extract
+import prompts
+import resume
+import resume_events
+import sessions
+import singleflight
+import speech_pipeline
+import sse_relay
+import static_assets
+import tts_cache
+import upstream
+from tokens import estimate_tokens
+
+api = Blueprint('api', __name__)
 
 # API KEY WITH ENV
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
-
-if not GEMINI_API_KEY:
-    print("⚠️  WARNING: GEMINI_API_KEY not set!")
-if not ELEVENLABS_API_KEY:
-    print("⚠️  WARNING: ELEVENLABS_API_KEY not set!")
-
-@app.route('/')
+# Bearer token required by the admin routes (/api/inflight); unset leaves them open like /metrics
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# The frontend split into hashed assets, built by preload()
+site = None
+_warmed_pid = None
+
+def create_app():
+    """Flask app with every route registered and the process-wide startup work done"""
+    if not GEMINI_API_KEY:
+        print("⚠️  WARNING: GEMINI_API_KEY not set!")
+    if not ELEVENLABS_API_KEY:
+        print("⚠️  WARNING: ELEVENLABS_API_KEY not set!")
+
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(api)
+    preload()
+    return app
+
+def preload():
+    """Work shared by every worker, done once before forking: heavy imports and the static assets"""
+    global site
+    started = time.perf_counter()
+    import PyPDF2  # noqa: F401  (small PDFs are read in-process)
+    import stt_audio  # noqa: F401  (numpy)
+    if static_assets.ENABLED and site is None:
+        site = static_assets.build()
+    print(f"[STARTUP] Preloaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+def warm_worker(background=True):
+    """Per-worker warm-up; sockets, threads and processes do not survive a fork.
+
+    Opens keep-alive connections to Gemini and ElevenLabs, registers the
+    static prompt prefixes as Gemini cached contents (requests fall back to
+    inline prompts) and starts the PDF extraction processes. Runs once per
+    process; with ``background`` False the connections are open on return.
+    """
+    global _warmed_pid
+    if _warmed_pid == os.getpid():
+        return
+    _warmed_pid = os.getpid()
+    if os.environ.get('UPSTREAM_WARM', '1') == '1':
+        upstream.warm_all(background=background)
+    if context_cache.ENABLED and GEMINI_API_KEY:
+        context_cache.cache.start(GEMINI_API_KEY, prompts.templates())
+    if pdf_extract.WARM:
+        threading.Thread(target=pdf_extract.warm, name='pdf-warm', daemon=True).start()
+
+def __getattr__(name):
+    # ``server:app`` (plain gunicorn, flask run): built and warmed on first access
+    if name == 'app':
+        app = globals()['app'] = create_app()
+        warm_worker()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@api.before_app_request
+def start_request_timer():
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.request_timer = metrics.RequestTimer(route, request.method)
+    ledger.reset(route=route)
+    admission.prioritize(route)
+    inflight.begin(route)
+
+@api.after_app_request
+def finish_request_timer(response):
+    timer = g.pop('request_timer', None)
+    if timer is not None:
+        if response.is_streamed and response.status_code < 400:
+            timer.streaming()
+        # Runs once the body has been sent, so streams are timed to their last byte
+        response.call_on_close(lambda: timer.finish(response.status_code))
+    return response
+
+@api.after_app_request
+def register_stream(response):
+    """List streamed responses in the inflight registry, cancelled as soon as their client hangs up"""
+    entry = inflight.current()
+    if entry is None:
+        return response
+    if response.is_streamed:
+        response.response = inflight.guard(response.response)
+        client = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+        inflight.registry.add(entry, client, request.remote_addr)
+        # Under asgi.py there is no socket: RequestMetrics cancels the entry when uvicorn reports the disconnect
+        scope = request.environ.get('asgi.scope')
+        if scope is not None:
+            scope['inflight.entry'] = entry
+
+    def finish():
+        inflight.registry.remove(entry)
+        # Also closes upstream responses opened for a body that never started (the client left first)
+        entry.close()
+
+    response.call_on_close(finish)
+    return response
+
+def overloaded(e):
+    """429 for a call refused by admission control"""
+    return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+def conversation_parts(data):
+    """Gemini parts for a chat request, and the session it continues (None when stateless).
+
+    With ``session_id`` the history comes from the server-side session and the
+    body only carries the new turn in ``message``; otherwise from ``messages``.
+    Raises sessions.UnknownSession.
+    """
+    session_id = data.get('session_id')
+    if not session_id:
+        return gemini.build_parts(data), None
+    session = sessions.store.get(session_id)
+    ledger.tag(session_id=session.id, language=session.language)
+    return gemini.build_parts({
+        'system': data.get('system', session.system),
+        'messages': session.messages(data.get('message', ''))
+    }), session
+
+def session_recorder(session, data):
+    """Callback storing the finished reply in ``session``, or None for stateless requests"""
+    if session is None:
+        return None
+    return lambda reply: sessions.store.record(session, data.get('message', ''), reply, GEMINI_API_KEY)
+
+def admin_denied():
+    """401 response unless the request carries ADMIN_TOKEN, when one is set"""
+    if not ADMIN_TOKEN:
+        return None
+    given = request.headers.get('Authorization', '').encode('utf-8')
+    if hmac.compare_digest(given, f'Bearer {ADMIN_TOKEN}'.encode('utf-8')):
+        return None
+    return jsonify({'error': 'Admin token required'}), 401
+
+def asset_response(asset):
+    status, headers, body = asset.response(
+        request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match')
+    )
+    return Response(body, status=status, headers=headers)
+
+@api.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
-
-@app.route('/api/analyze-resume', methods=['POST'])
+    if site is None:
+        return send_from_directory('.', 'index.html')
+    return asset_response(site.index)
+
+@api.route('/assets/<name>')
+def static_asset(name):
+    asset = site.assets.get(name) if site is not None else None
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    return asset_response(asset)
+
+@api.route('/api/analyze-resume', methods=['POST'])
 def analyze_resume():
     """Analyze resume/CV with detailed feedback (non-streaming)"""
     try:
@@ -36,179 +201,82 @@ def analyze_resume():
         
         file = request.files['resume']
         language = request.form.get('language', 'en')
+        ledger.tag(language=language)
         
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        resume_text = ''
-        if file.filename.endswith('.pdf'):
-            try:
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
-                for page in pdf_reader.pages:
-                    resume_text += page.extract_text() + '\n'
-            except Exception as e:
-                print(f"[ERROR] PDF extraction error: {str(e)}")
-                return jsonify({'error': f'Failed to read PDF: {str(e)}'}), 400
-        elif file.filename.endswith('.txt'):
-            resume_text = file.read().decode('utf-8')
-        else:
-            return jsonify({'error': 'Please upload a PDF or TXT file'}), 400
-        
-        if not resume_text.strip():
-            return jsonify({'error': 'No text found in the document'}), 400
-        
-        print(f"[RESUME] Extracted {len(resume_text)} characters")
+        try:
+            resume_text, normalization = resume.normalize(resume.extract_text(file.filename, file.read()))
+        except resume.ResumeError as e:
+            return jsonify({'error': e.message}), e.status
         
         if not GEMINI_API_KEY or GEMINI_API_KEY == 'YOUR_GEMINI_API_KEY_HERE':
             print("[ERROR] Gemini API key not configured!")
             return jsonify({'error': 'API key not configured in server.py'}), 500
         
-        if language == 'fr':
-            system_prompt = """Vous êtes un conseiller en carrière expert et consultant en CV avec plus de 20 ans d'expérience en recrutement dans plusieurs secteurs. Vous vous spécialisez dans l'aide aux candidats pour optimiser leurs CV pour les systèmes ATS et les recruteurs humains.
-
-Votre analyse doit être complète, actionnable et structurée. Concentrez-vous sur :
-1. Qualité et pertinence du contenu
-2. Structure et formatage
-3. Optimisation ATS
-4. Impact et réalisations
-5. Langue et ton
-6. Meilleures pratiques spécifiques au secteur"""
-
-            user_prompt = f"""Veuillez fournir une analyse approfondie de ce CV. Structurez vos commentaires comme suit :
-
-**Impression générale** (2-3 phrases)
-Fournissez une évaluation générale de l'efficacité du CV.
-
-**Points forts** (2-3 points spécifiques). Gardez les points concis (1-2 phrases).
-Identifiez ce qui fonctionne bien. Soyez spécifique avec des exemples du CV.
-
-**Axes d'amélioration** (2-3 points)
-Fournissez des commentaires actionnables sur ce qui nécessite du travail. Gardez les points concis (1-2 phrases).
-
-**Optimisation ATS** (1-2 phrases).
-- Analyse des mots-clés : Quels mots-clés manquent pour leur poste cible ?
-- Problèmes de formatage qui pourraient confondre les systèmes ATS
-- Améliorations spécifiques pour la compatibilité ATS
-
-**Amélioration du contenu** (1-2 phrases).
-- Quels points manquent d'impact ou de quantification ?
-- Où les réalisations peuvent-elles remplacer les responsabilités ?
-- Suggestions spécifiques pour renforcer les sections faibles
-
-**Conseils spécifiques au secteur** (2-3 phrases).
-Sur la base du contenu du CV, fournissez des conseils adaptés à leur secteur/poste spécifique.
-
-**Plan d'action** (Liste priorisée)
-Énumérez 5-7 changements par ordre de priorité qui auront le plus grand impact. Gardez les points concis (1-2 phrases).
-
-Voici le CV à analyser :
-
-{resume_text}
-
-Rappelez-vous : Soyez direct, spécifique et actionnable. Utilisez des exemples de leur CV réel. Ne dites pas simplement "améliorez vos points" - montrez-leur exactement comment."""
-        else:
-            system_prompt = """You are an expert career advisor and resume consultant with 20+ years of experience in recruitment across multiple industries. You specialize in helping candidates optimize their resumes for ATS systems and human recruiters.
-
-Your analysis should be comprehensive, actionable, and structured. Focus on:
-1. Content quality and relevance
-2. Structure and formatting
-3. ATS optimization
-4. Impact and achievements
-5. Language and tone
-6. Industry-specific best practices"""
-
-            user_prompt = f"""Please provide an in-depth analysis of this resume/CV. Structure your feedback as follows:
-
-**Overall Impression** (2-3 sentences)
-Provide a high-level assessment of the resume's effectiveness.
-
-**Strengths** (2-3 specific points). Keep points concise (1-2 sentences).
-Identify what works well. Be specific with examples from the resume.
-
-**Areas for Improvement** (2-3 points)
-Provide actionable feedback on what needs work. Keep points concise (1-2 sentences).
-
-**ATS Optimization** (1-2 sentences).
-- Keyword analysis: What keywords are missing for their target role?
-- Formatting issues that might confuse ATS systems
-- Specific improvements for ATS compatibility
-
-**Content Enhancement** (1-2 sentences).
-- Which bullet points lack impact or quantification?
-- Where can achievements replace responsibilities?
-- Specific suggestions to strengthen weak sections
-
-**Industry-Specific Advice** (2-3 sentences).
-Based on the resume content, provide tailored advice for their specific industry/role.
-
-**Action Plan** (Prioritized list)
-List 5-7 changes in order of priority that will have the biggest impact. Keep points concise (1-2 sentences).
-
-Here is the resume/CV to analyze:
-
-{resume_text}
-
-Remember: Be direct, specific, and actionable. Use examples from their actual resume. Don't just say "improve your bullet points" - show them exactly how."""
+        status, body, cache_hit = resume.analyze(GEMINI_API_KEY, resume_text, language, normalization=normalization)
+        return jsonify(body), status, {'X-Cache': 'HIT' if cache_hit else 'MISS'}
+        
+    except admission.Overloaded as e:
+        return overloaded(e)
+    except Exception as e:
+        print(f"[ERROR] Resume analysis exception: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-        # Combine system and user prompts
-        combined_prompt = f"{system_prompt}\n\n{user_prompt}"
+@api.route('/api/analyze-resume/batch', methods=['POST'])
+def analyze_resume_batch():
+    """Analyze many resumes (files and/or zip archives), streaming NDJSON results as they finish"""
+    if not batch.SINGLE_WORKER:
+        return jsonify({'error': 'Batch jobs need a single worker process (WEB_CONCURRENCY=1)'}), 501
+    try:
+        # Refused before the form is parsed; collect_files enforces the same cap on what it keeps
+        if (request.content_length or 0) > batch.MAX_TOTAL_BYTES:
+            return jsonify({'error': f'At most {batch.MAX_TOTAL_BYTES // (1024 * 1024)} MB of files per batch'}), 413
         
-        print(f"[RESUME] Calling Gemini API...")
-        response = requests.post(
-            f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp:generateContent?key={GEMINI_API_KEY}',
-            headers={
-                'Content-Type': 'application/json'
-            },
-            json={
-                'contents': [{
-                    'parts': [{
-                        'text': combined_prompt
-                    }]
-                }],
-                'generationConfig': {
-                    'temperature': 0.7,
-                    'maxOutputTokens': 4000,
-                }
-            },
-            timeout=60
-        )
+        uploads = request.files.getlist('resumes') + request.files.getlist('resume')
+        if not uploads:
+            return jsonify({'error': 'No file uploaded'}), 400
         
-        print(f"[RESUME] Response status: {response.status_code}")
+        language = request.form.get('language', 'en')
         
-        if not response.ok:
-            print(f"[ERROR] Gemini error: {response.text}")
-            return jsonify({'error': response.text}), response.status_code
-        
-        # Convert Gemini response format to standard format
-        gemini_response = response.json()
-        
-        # Extract text from Gemini response
-        text_content = gemini_response.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-        
-        # Format response in standard structure
-        formatted_response = {
-            'id': gemini_response.get('candidates', [{}])[0].get('content', {}).get('role', 'model'),
-            'type': 'message',
-            'role': 'assistant',
-            'content': [{
-                'type': 'text',
-                'text': text_content
-            }],
-            'model': 'gemini-2.0-flash-exp',
-            'stop_reason': gemini_response.get('candidates', [{}])[0].get('finishReason', 'end_turn'),
-            'usage': {
-                'input_tokens': gemini_response.get('usageMetadata', {}).get('promptTokenCount', 0),
-                'output_tokens': gemini_response.get('usageMetadata', {}).get('candidatesTokenCount', 0)
-            }
-        }
+        if not GEMINI_API_KEY or GEMINI_API_KEY == 'YOUR_GEMINI_API_KEY_HERE':
+            print("[ERROR] Gemini API key not configured!")
+            return jsonify({'error': 'API key not configured in server.py'}), 500
+        
+        try:
+            files = batch.collect_files([(file.filename, file.stream) for file in uploads])
+        except resume.ResumeError as e:
+            return jsonify({'error': e.message}), e.status
+        if not files:
+            return jsonify({'error': 'No file uploaded'}), 400
         
-        return jsonify(formatted_response), response.status_code
+        job = batch.jobs.create(GEMINI_API_KEY, language, files)
+        print(f"[BATCH] Job {job.id}: {job.total} files")
+        return batch_response(job)
         
     except Exception as e:
-        print(f"[ERROR] Resume analysis exception: {str(e)}")
+        print(f"[ERROR] Batch analysis exception: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analyze-resume/stream', methods=['POST'])
+@api.route('/api/analyze-resume/batch/<job_id>', methods=['GET'])
+def analyze_resume_batch_resume(job_id):
+    """Re-attach to a batch job, skipping the first ``after`` results already received"""
+    job = batch.jobs.get(job_id)
+    if job is None:
+        # Expired, or the worker restarted
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return batch_response(job, request.args.get('after', 0, type=int))
+
+def batch_response(job, after=0):
+    return Response(
+        job.lines(after),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'X-Job-Id': job.id
+        }
+    )
+
+@api.route('/api/analyze-resume/stream', methods=['POST'])
 def analyze_resume_stream():
     """Analyze resume/CV with streaming feedback"""
     try:
@@ -219,345 +287,160 @@ def analyze_resume_stream():
         
         file = request.files['resume']
         language = request.form.get('language', 'en')
+        ledger.tag(language=language)
         
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        resume_text = ''
-        if file.filename.endswith('.pdf'):
-            try:
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
-                for page in pdf_reader.pages:
-                    resume_text += page.extract_text() + '\n'
-            except Exception as e:
-                print(f"[ERROR] PDF extraction error: {str(e)}")
-                return jsonify({'error': f'Failed to read PDF: {str(e)}'}), 400
-        elif file.filename.endswith('.txt'):
-            resume_text = file.read().decode('utf-8')
-        else:
-            return jsonify({'error': 'Please upload a PDF or TXT file'}), 400
-        
-        if not resume_text.strip():
-            return jsonify({'error': 'No text found in the document'}), 400
-        
-        print(f"[RESUME-STREAM] Extracted {len(resume_text)} characters")
+        try:
+            resume_text, normalization = resume.normalize(
+                resume.extract_text(file.filename, file.read(), log_tag='RESUME-STREAM'), log_tag='RESUME-STREAM'
+            )
+        except resume.ResumeError as e:
+            return jsonify({'error': e.message}), e.status
         
         if not GEMINI_API_KEY or GEMINI_API_KEY == 'YOUR_GEMINI_API_KEY_HERE':
             print("[ERROR] Gemini API key not configured!")
             return jsonify({'error': 'API key not configured in server.py'}), 500
         
-        if language == 'fr':
-            system_prompt = """Vous êtes un conseiller en carrière expert et consultant en CV avec plus de 20 ans d'expérience en recrutement dans plusieurs secteurs. Vous vous spécialisez dans l'aide aux candidats pour optimiser leurs CV pour les systèmes ATS et les recruteurs humains.
-
-Votre analyse doit être complète, actionnable et structurée. Concentrez-vous sur :
-1. Qualité et pertinence du contenu. Gardez les points concis (1-2 phrases).
-2. Structure et formatage. Gardez les points concis (1-2 phrases).
-3. Optimisation ATS. Gardez les points concis (1-2 phrases).
-4. Impact et réalisations. Gardez les points concis (3-4 phrases).
-5. Langue et ton. Gardez les points concis (1-2 phrases).
-6. Meilleures pratiques spécifiques au secteur. Gardez les points concis (3-4 phrases).
-
-Commencez votre réponse par : Note : [LETTRE] ([SCORE]/100)"""
-
-            user_prompt = f"""Veuillez fournir une analyse approfondie de ce CV. Structurez vos commentaires comme suit :
-
-Note : [A+, A, A-, B+, B, B-, C+, C, C-, D, ou F] ([Score sur 100])
-
-**Impression générale** (2-3 phrases)
-Fournissez une évaluation générale de l'efficacité du CV.
-
-**Points forts** (2-3 points spécifiques). Gardez les points concis (1-2 phrases).
-Identifiez ce qui fonctionne bien. Soyez spécifique avec des exemples du CV.
-
-**Axes d'amélioration** (2-3 points détaillés). Gardez les points concis (1-2 phrases).
-Fournissez des commentaires actionnables sur ce qui nécessite du travail. Pour chaque point :
-- Expliquez POURQUOI c'est un problème
-- Fournissez un exemple AVANT/APRÈS spécifique ou une suggestion
-- Expliquez l'IMPACT de ce changement
-
-**Optimisation ATS**.(2-3 phrases).
-- Analyse des mots-clés : Quels mots-clés manquent pour leur poste cible ?
-- Problèmes de formatage qui pourraient confondre les systèmes ATS
-- Améliorations spécifiques pour la compatibilité ATS
-
-**Amélioration du contenu**.(2-3 phrases).
-- Quels points manquent d'impact ou de quantification ?
-- Où les réalisations peuvent-elles remplacer les responsabilités ?
-- Suggestions spécifiques pour renforcer les sections faibles
-
-**Conseils spécifiques au secteur**. (2-3 phrases).
-Sur la base du contenu du CV, fournissez des conseils adaptés à leur secteur/poste spécifique.
-
-**Plan d'action** (Liste priorisée) (1-2 phrases par changement).
-Énumérez 4-7 changements par ordre de priorité qui auront le plus grand impact.
-
-Voici le CV à analyser :
-
-{resume_text}
-
-Rappelez-vous : Soyez direct, spécifique et actionnable. Utilisez des exemples de leur CV réel. Ne dites pas simplement "améliorez vos points" - montrez-leur exactement comment."""
-        else:
-            system_prompt = """You are an expert career advisor and resume consultant with 20+ years of experience in recruitment across multiple industries. You specialize in helping candidates optimize their resumes for ATS systems and human recruiters.
-
-Your analysis should be comprehensive, actionable, and structured. Focus on:
-1. Content quality and relevance. Keep points concise (1-2 sentences).
-2. Structure and formatting. Keep points concise (1-2 sentences).
-3. ATS optimization. Keep points concise (1-2 sentences).
-4. Impact and achievements. Keep points concise (3-4 sentences).
-5. Language and tone. Keep points concise (1-2 sentences).
-6. Industry-specific best practices. Keep points concise (3-4 sentences).
-
-Start your response with: Grade: [LETTER] ([SCORE]/100)"""
-
-            user_prompt = f"""Please provide an in-depth analysis of this resume/CV. Structure your feedback as follows:
-
-Grade: [A+, A, A-, B+, B, B-, C+, C, C-, D, or F] ([Score out of 100])
-
-**Overall Impression** (2-3 sentences)
-Provide a high-level assessment of the resume's effectiveness.
-
-**Strengths** (2-3 specific points) . Keep points concise (1-2 sentences).
-Identify what works well. Be specific with examples from the resume.
-
-**Areas for Improvement** (2-3 detailed points) . Keep points concise (1-2 sentences).
-Provide actionable feedback on what needs work. For each point:
-- Explain WHY it's an issue
-- Provide a specific BEFORE/AFTER example or suggestion
-- Explain the IMPACT of making this change
-
-**ATS Optimization**.(2-3 sentences).
-- Keyword analysis: What keywords are missing for their target role?
-- Formatting issues that might confuse ATS systems
-- Specific improvements for ATS compatibility
-
-**Content Enhancement**.(2-3 sentences).
-- Which bullet points lack impact or quantification?
-- Where can achievements replace responsibilities?
-- Specific suggestions to strengthen weak sections
-
-**Industry-Specific Advice** . (2-3 sentences).
-Based on the resume content, provide tailored advice for their specific industry/role.
-
-**Action Plan** (Prioritized list) (1-2 sentences per changes).
-List 4-7 changes in order of priority that will have the biggest impact.
-
-Here is the resume/CV to analyze:
-
-{resume_text}
-
-Remember: Be direct, specific, and actionable. Use examples from their actual resume. Don't just say "improve your bullet points" - show them exactly how."""
-
-        # Combine system and user prompts
-        combined_prompt = f"{system_prompt}\n\n{user_prompt}"
+        template = prompts.get('resume-stream', language)
+        cache_key = analysis_cache.analysis_key(resume_text, language, True, gemini.generation_config())
+        cached = analysis_cache.cache.get(cache_key)
+        if cached is not None:
+            # Replay the previous analysis at full speed instead of calling Gemini again
+            print("[RESUME-STREAM] Cache hit - replaying previous analysis")
+            return Response(
+                itertools.chain(
+                    [resume.usage_frame(normalization)],
+                    analysis_cache.replay_frames(cached, resume_events.ResumeEvents())
+                ),
+                mimetype='text/event-stream',
+                headers={
+                    'Cache-Control': 'no-cache',
+                    'X-Accel-Buffering': 'no',
+                    'X-Cache': 'HIT'
+                }
+            )
         
-        def generate():
+        # Admit before answering so an overload is still a clean 429
+        admission.gemini.acquire(estimate_tokens(template.system + template.render(resume_text)))
+        
+        def produce():
             print(f"[RESUME-STREAM] Calling Gemini streaming API...")
-            response = requests.post(
-                f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp:streamGenerateContent?key={GEMINI_API_KEY}&alt=sse',
-                headers={
-                    'Content-Type': 'application/json'
-                },
-                json={
-                    'contents': [{
-                        'parts': [{
-                            'text': combined_prompt
-                        }]
-                    }],
-                    'generationConfig': {
-                        'temperature': 0.7,
-                        'maxOutputTokens': 4000,
-                    }
-                },
+            # Grade and section boundaries are sent as typed events next to the text
+            relay = sse_relay.GeminiRelay(
+                '/api/analyze-resume/stream', keep_text=True, events=resume_events.ResumeEvents()
+            )
+            response = context_cache.cache.post(
+                template,
+                resume_text,
+                upstream.gemini_path(GEMINI_API_KEY, stream=True),
                 stream=True,
                 timeout=120
             )
             
             print(f"[RESUME-STREAM] Response status: {response.status_code}")
             
-            for line in response.iter_lines():
-                if line:
-                    decoded_line = line.decode('utf-8')
-                    if decoded_line.startswith('data: '):
-                        # Parse Gemini's streaming response
-                        try:
-                            gemini_data = json.loads(decoded_line[6:])  # Remove 'data: ' prefix
-                            
-                            # Extract text from Gemini response
-                            if 'candidates' in gemini_data:
-                                text_delta = gemini_data['candidates'][0]['content']['parts'][0].get('text', '')
-                                
-                                # Convert to standard streaming format
-                                standard_format = {
-                                    'type': 'content_block_delta',
-                                    'index': 0,
-                                    'delta': {
-                                        'type': 'text_delta',
-                                        'text': text_delta
-                                    }
-                                }
-                                
-                                yield f"data: {json.dumps(standard_format)}\n\n"
-                        except json.JSONDecodeError:
-                            continue
+            # Only analyses that streamed to completion are cached
+            yield from relay.relay(response, on_complete=lambda text: analysis_cache.cache.put(cache_key, text))
         
+        # Identical uploads streamed concurrently attach to the same Gemini stream
         return Response(
-            stream_with_context(generate()),
+            stream_with_context(itertools.chain(
+                [resume.usage_frame(normalization)],
+                singleflight.group.stream(f'resume-stream:{cache_key}', produce)
+            )),
             mimetype='text/event-stream',
             headers={
                 'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no'
+                'X-Accel-Buffering': 'no',
+                'X-Cache': 'MISS'
             }
         )
         
+    except admission.Overloaded as e:
+        return overloaded(e)
     except Exception as e:
         print(f"[ERROR] Resume streaming exception: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/gemini', methods=['POST'])
+@api.route('/api/gemini', methods=['POST'])
 def gemini_proxy():
     """Proxy requests to Gemini API (non-streaming)"""
     try:
         data = request.json
-        
-        # Extract messages from request
-        messages = data.get('messages', [])
-        system_prompt = data.get('system', '')
-        
-        # Combine system prompt with messages
-        combined_parts = []
-        if system_prompt:
-            combined_parts.append({'text': system_prompt + '\n\n'})
-        
-        # Convert messages to Gemini format
-        for msg in messages:
-            if isinstance(msg.get('content'), str):
-                combined_parts.append({'text': msg['content']})
-            elif isinstance(msg.get('content'), list):
-                for content_block in msg['content']:
-                    if content_block.get('type') == 'text':
-                        combined_parts.append({'text': content_block['text']})
-        
-        # Non-streaming request
-        response = requests.post(
-            f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp:generateContent?key={GEMINI_API_KEY}',
-            headers={
-                'Content-Type': 'application/json'
-            },
-            json={
-                'contents': [{
-                    'parts': combined_parts
-                }],
-                'generationConfig': {
-                    'temperature': data.get('temperature', 0.7),
-                    'maxOutputTokens': data.get('max_tokens', 4000),
-                }
-            },
-            timeout=30
+        combined_parts, session = conversation_parts(data)
+        record_reply = session_recorder(session, data)
+        payload = gemini.build_payload(
+            combined_parts,
+            temperature=data.get('temperature', 0.7),
+            max_tokens=data.get('max_tokens', 4000)
         )
         
-        if not response.ok:
-            return jsonify({'error': response.text}), response.status_code
-        
-        # Convert Gemini response format to standard format
-        gemini_response = response.json()
-        
-        # Extract text from Gemini response
-        text_content = gemini_response.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-        
-        # Format response in standard structure
-        formatted_response = {
-            'id': gemini_response.get('candidates', [{}])[0].get('content', {}).get('role', 'model'),
-            'type': 'message',
-            'role': 'assistant',
-            'content': [{
-                'type': 'text',
-                'text': text_content
-            }],
-            'model': 'gemini-2.0-flash-exp',
-            'stop_reason': gemini_response.get('candidates', [{}])[0].get('finishReason', 'end_turn'),
-            'usage': {
-                'input_tokens': gemini_response.get('usageMetadata', {}).get('promptTokenCount', 0),
-                'output_tokens': gemini_response.get('usageMetadata', {}).get('candidatesTokenCount', 0)
-            }
-        }
-        
-        return jsonify(formatted_response), response.status_code
-        
+        def call_gemini():
+            prompt_tokens = admission.payload_tokens(payload)
+            admission.gemini.acquire(prompt_tokens)
+            # Non-streaming request, retried and optionally hedged
+            response = hedging.gemini.call('/api/gemini', lambda: upstream.gemini.post(
+                upstream.gemini_path(GEMINI_API_KEY),
+                headers={
+                    'Content-Type': 'application/json'
+                },
+                json=payload,
+                timeout=30
+            ), prompt_tokens)
+            
+            if not response.ok:
+                return response.status_code, {'error': response.text}
+            
+            gemini_response = response.json()
+            metrics.record_usage('/api/gemini', gemini_response.get('usageMetadata'))
+            formatted_response = gemini.format_response(gemini_response)
+            if record_reply is not None:
+                record_reply(formatted_response['content'][0]['text'])
+            return response.status_code, formatted_response
+        
+        key = singleflight.key_for('gemini', payload, session.id if session else None)
+        status, body = singleflight.group.do(key, call_gemini)
+        return jsonify(body), status
+        
+    except sessions.UnknownSession:
+        return jsonify({'error': 'Unknown session'}), 404
+    except admission.Overloaded as e:
+        return overloaded(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/gemini/stream', methods=['POST'])
+@api.route('/api/gemini/stream', methods=['POST'])
 def gemini_stream():
     """Proxy requests to Gemini API with streaming support"""
     try:
         data = request.json
+        combined_parts, session = conversation_parts(data)
+        record_reply = session_recorder(session, data)
+        payload = gemini.build_payload(
+            combined_parts,
+            temperature=data.get('temperature', 0.7),
+            max_tokens=data.get('max_tokens', 4000)
+        )
         
-        # Extract messages from request
-        messages = data.get('messages', [])
-        system_prompt = data.get('system', '')
-        
-        # Combine system prompt with messages
-        combined_parts = []
-        if system_prompt:
-            combined_parts.append({'text': system_prompt + '\n\n'})
-        
-        # Convert messages to Gemini format
-        for msg in messages:
-            if isinstance(msg.get('content'), str):
-                combined_parts.append({'text': msg['content']})
-            elif isinstance(msg.get('content'), list):
-                for content_block in msg['content']:
-                    if content_block.get('type') == 'text':
-                        combined_parts.append({'text': content_block['text']})
+        admission.gemini.acquire(admission.payload_tokens(payload))
         
-        def generate():
+        def produce():
             print(f"[GEMINI-STREAM] Starting stream...")
-            response = requests.post(
-                f'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp:streamGenerateContent?key={GEMINI_API_KEY}&alt=sse',
+            relay = sse_relay.GeminiRelay('/api/gemini/stream', keep_text=record_reply is not None)
+            response = upstream.gemini.post(
+                upstream.gemini_path(GEMINI_API_KEY, stream=True),
                 headers={
                     'Content-Type': 'application/json'
                 },
-                json={
-                    'contents': [{
-                        'parts': combined_parts
-                    }],
-                    'generationConfig': {
-                        'temperature': data.get('temperature', 0.7),
-                        'maxOutputTokens': data.get('max_tokens', 4000),
-                    }
-                },
+                json=payload,
                 stream=True,
                 timeout=60
             )
             
-            for line in response.iter_lines():
-                if line:
-                    decoded_line = line.decode('utf-8')
-                    if decoded_line.startswith('data: '):
-                        # Parse Gemini's streaming response
-                        try:
-                            gemini_data = json.loads(decoded_line[6:])  # Remove 'data: ' prefix
-                            
-                            # Extract text from Gemini response
-                            if 'candidates' in gemini_data:
-                                text_delta = gemini_data['candidates'][0]['content']['parts'][0].get('text', '')
-                                
-                                # Convert to standard streaming format
-                                standard_format = {
-                                    'type': 'content_block_delta',
-                                    'index': 0,
-                                    'delta': {
-                                        'type': 'text_delta',
-                                        'text': text_delta
-                                    }
-                                }
-                                
-                                yield f"data: {json.dumps(standard_format)}\n\n"
-                        except json.JSONDecodeError:
-                            continue
+            yield from relay.relay(response, on_complete=record_reply)
         
+        key = singleflight.key_for('gemini-stream', payload, session.id if session else None)
         return Response(
-            stream_with_context(generate()),
+            stream_with_context(singleflight.group.stream(key, produce)),
             mimetype='text/event-stream',
             headers={
                 'Cache-Control': 'no-cache',
@@ -565,110 +448,266 @@ def gemini_stream():
             }
         )
         
+    except sessions.UnknownSession:
+        return jsonify({'error': 'Unknown session'}), 404
+    except admission.Overloaded as e:
+        return overloaded(e)
     except Exception as e:
         print(f"[ERROR] Gemini stream error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/elevenlabs/tts', methods=['POST'])
-def elevenlabs_tts_proxy():
-    """Proxy requests to ElevenLabs Text-to-Speech API"""
+@api.route('/api/interview/stream', methods=['POST'])
+def interview_stream():
+    """Stream Gemini text and pre-fetched TTS audio for each sentence in one SSE response"""
     try:
         if not ELEVENLABS_API_KEY:
             print("[ERROR] ElevenLabs API key not configured!")
             return jsonify({'error': 'ElevenLabs API key not configured on server'}), 500
         
         data = request.json
-        voice_id = data.get('voice_id', '1SM7GgM6IMuvQlz2BwM3')
-        text = data.get('text', '')
-        language = data.get('language', 'en')
-        
-        print(f"[TTS] Processing text ({language}): {text[:50]}...")
-        
-        headers = {
-            'Accept': 'audio/mpeg',
-            'Content-Type': 'application/json',
-            'xi-api-key': ELEVENLABS_API_KEY
-        }
+        combined_parts, session = conversation_parts(data)
+        ledger.tag(language=data.get('language'))
+        voice_id = data.get('voice_id', elevenlabs.DEFAULT_VOICE_ID)
+        
+        # The SSE response has its own Accept header: the playable audio types come in the body
+        profile = elevenlabs.tts_profile(data.get('output_profile'), data.get('audio_accept'), request.headers)
+        
+        print(f"[PIPELINE] Starting speech stream ({data.get('language', 'en')}, {profile})...")
+        payload = gemini.build_payload(
+            combined_parts,
+            temperature=data.get('temperature', 0.7),
+            max_tokens=data.get('max_tokens', 4000)
+        )
+        admission.gemini.acquire(admission.payload_tokens(payload))
         
-        # Use eleven_multilingual_v2 for automatic language detection
-        payload = {
-            'text': text,
-            'model_id': 'eleven_multilingual_v2',
-            'voice_settings': {
-                'stability': 0.5,
-                'similarity_boost': 0.75
+        return Response(
+            stream_with_context(speech_pipeline.stream_speech(
+                GEMINI_API_KEY, ELEVENLABS_API_KEY, payload, voice_id,
+                on_complete=session_recorder(session, data), profile=profile
+            )),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
             }
-        }
-        
-        response = requests.post(
-            f'https://api.elevenlabs.io/v1/text-to-speech/{voice_id}',
-            headers=headers,
-            json=payload,
-            timeout=30
         )
         
-        if not response.ok:
-            print(f"[ERROR] ElevenLabs TTS failed: {response.status_code} - {response.text}")
-            return jsonify({'error': f'TTS API error: {response.status_code}'}), response.status_code
+    except sessions.UnknownSession:
+        return jsonify({'error': 'Unknown session'}), 404
+    except admission.Overloaded as e:
+        return overloaded(e)
+    except Exception as e:
+        print(f"[ERROR] Speech pipeline error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/sessions', methods=['POST'])
+def create_session():
+    """Start a server-side conversation; later turns send only ``session_id`` and ``message``"""
+    data = request.json or {}
+    session = sessions.store.create(
+        system=data.get('system', ''),
+        language=data.get('language', 'en'),
+        messages=data.get('messages')
+    )
+    print(f"[SESSION] Created {session.id} ({session.language}, {len(session.turns)} turns)")
+    return jsonify(session.info()), 201
+
+@api.route('/api/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """Summary and size of a session's history"""
+    try:
+        return jsonify(sessions.store.get(session_id).info())
+    except sessions.UnknownSession:
+        return jsonify({'error': 'Unknown session'}), 404
+
+@api.route('/api/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not sessions.store.delete(session_id):
+        return jsonify({'error': 'Unknown session'}), 404
+    return '', 204
+
+@api.route('/api/elevenlabs/tts', methods=['POST'])
+def elevenlabs_tts_proxy():
+    """Proxy requests to ElevenLabs Text-to-Speech API"""
+    try:
+        if not ELEVENLABS_API_KEY:
+            print("[ERROR] ElevenLabs API key not configured!")
+            return jsonify({'error': 'ElevenLabs API key not configured on server'}), 500
         
-        print(f"[TTS] Success - Generated {len(response.content)} bytes of audio")
-        return response.content, response.status_code, {'Content-Type': 'audio/mpeg'}
+        data = request.json
+        voice_id, payload = elevenlabs.tts_request(data)
+        language = data.get('language', 'en')
+        ledger.tag(language=language)
+        
+        # Opus, low-bitrate MP3 or PCM, from the body or the Accept and network hint headers
+        profile = elevenlabs.tts_profile(data.get('output_profile'), request.headers.get('Accept'), request.headers)
+        output_format, media_type, _ = elevenlabs.TTS_PROFILES[profile]
+        headers = {'Content-Type': media_type, **elevenlabs.audio_headers(profile)}
+        
+        print(f"[TTS] Processing text ({language}, {profile}): {payload['text'][:50]}...")
+        
+        key = tts_cache.cache_key(voice_id, payload, output_format)
+        audio = tts_cache.cache.get(key)
+        if audio is not None:
+            print(f"[TTS] Cache hit - Served {len(audio)} bytes of audio")
+            return audio, 200, {**headers, 'X-Cache': 'HIT'}
+        
+        def call_elevenlabs():
+            admission.elevenlabs.acquire(len(payload['text']))
+            response = upstream.elevenlabs.post(
+                elevenlabs.tts_path(voice_id, profile),
+                headers=elevenlabs.tts_headers(ELEVENLABS_API_KEY, media_type),
+                json=payload,
+                timeout=30
+            )
+            
+            if not response.ok:
+                print(f"[ERROR] ElevenLabs TTS failed: {response.status_code} - {response.text}")
+                return response.status_code, None
+            
+            ledger.ledger.record(tts_characters=len(payload['text']))
+            print(f"[TTS] Success - Generated {len(response.content)} bytes of audio")
+            metrics.TTS_AUDIO_BYTES.labels('/api/elevenlabs/tts', profile).inc(len(response.content))
+            tts_cache.cache.put(key, response.content)
+            return response.status_code, response.content
+        
+        # The same sentence requested twice at once is synthesized once
+        status, audio = singleflight.group.do(f'tts:{key}', call_elevenlabs)
+        if audio is None:
+            return jsonify({'error': f'TTS API error: {status}'}), status
+        
+        return audio, status, {**headers, 'X-Cache': 'MISS'}
         
+    except admission.Overloaded as e:
+        return overloaded(e)
     except Exception as e:
         print(f"[ERROR] TTS exception: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/elevenlabs/tts/stream', methods=['POST'])
+@api.route('/api/elevenlabs/tts/stream', methods=['POST'])
 def elevenlabs_tts_stream():
     """Stream text-to-speech from ElevenLabs with WebSocket support"""
     try:
         data = request.json
-        voice_id = data.get('voice_id', '1SM7GgM6IMuvQlz2BwM3')
-        text = data.get('text', '')
-        language = data.get('language', 'en')
-        
-        headers = {
-            'Accept': 'audio/mpeg',
-            'Content-Type': 'application/json',
-            'xi-api-key': ELEVENLABS_API_KEY
-        }
-        
-        payload = {
-            'text': text,
-            'model_id': 'eleven_multilingual_v2',
-            'voice_settings': {
-                'stability': 0.5,
-                'similarity_boost': 0.75
-            }
-        }
+        voice_id, payload = elevenlabs.tts_request(data)
+        ledger.tag(language=data.get('language'))
+        profile = elevenlabs.tts_profile(data.get('output_profile'), request.headers.get('Accept'), request.headers)
+        output_format, media_type, chunk_bytes = elevenlabs.TTS_PROFILES[profile]
+        
+        # Cached audio is served whole, with no upstream round trip
+        key = tts_cache.cache_key(voice_id, payload, output_format)
+        audio = tts_cache.cache.get(key)
+        if audio is not None:
+            return Response(
+                audio,
+                content_type=media_type,
+                headers={
+                    'Cache-Control': 'no-cache',
+                    'X-Accel-Buffering': 'no',
+                    'X-Cache': 'HIT',
+                    **elevenlabs.audio_headers(profile)
+                }
+            )
         
         # Stream the audio response
-        response = requests.post(
-            f'https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream',
-            headers=headers,
+        admission.elevenlabs.acquire(len(payload['text']))
+        response = upstream.elevenlabs.post(
+            elevenlabs.tts_path(voice_id, profile, stream=True),
+            headers=elevenlabs.tts_headers(ELEVENLABS_API_KEY, media_type),
             json=payload,
             stream=True,
             timeout=30
         )
+        if response.ok:
+            # Characters are billed once the synthesis starts, even if the client leaves early
+            ledger.ledger.record(tts_characters=len(payload['text']))
         
         def generate():
-            for chunk in response.iter_content(chunk_size=4096):
-                if chunk:
-                    yield chunk
+            chunks = []
+            try:
+                for chunk in response.iter_content(chunk_size=chunk_bytes):
+                    if chunk:
+                        chunks.append(chunk)
+                        yield chunk
+                # Only complete, successful streams are worth caching
+                if response.ok:
+                    audio = b''.join(chunks)
+                    metrics.TTS_AUDIO_BYTES.labels('/api/elevenlabs/tts/stream', profile).inc(len(audio))
+                    tts_cache.cache.put(key, audio)
+            finally:
+                response.close()
         
         return Response(
             stream_with_context(generate()),
-            mimetype='audio/mpeg',
+            content_type=media_type,
             headers={
                 'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no'
+                'X-Accel-Buffering': 'no',
+                'X-Cache': 'MISS',
+                **elevenlabs.audio_headers(profile)
             }
         )
         
+    except admission.Overloaded as e:
+        return overloaded(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/elevenlabs/stt', methods=['POST'])
+@api.route('/api/elevenlabs/tts/cache', methods=['GET'])
+def elevenlabs_tts_cache_stats():
+    """Hit/miss/eviction counters for the TTS audio cache"""
+    return jsonify(tts_cache.cache.stats())
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, upstream, token, TTS and PDF metrics in the Prometheus text format"""
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api.route('/api/usage', methods=['GET'])
+def usage_report():
+    """Aggregated tokens, TTS characters and STT seconds from the usage ledger.
+
+    ``group_by`` is a comma-separated list of route, language, session, day and
+    hour; the window is ``since``/``until`` in unix seconds, or the last ``hours``.
+    """
+    try:
+        group_by = [name for name in request.args.get('group_by', 'route').split(',') if name]
+        since = request.args.get('since', type=float)
+        until = request.args.get('until', type=float)
+        hours = request.args.get('hours', type=float)
+        if since is None and hours is not None:
+            since = time.time() - hours * 3600
+        rows = ledger.ledger.aggregate(group_by, since, until)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    totals = {
+        column: sum(row[column] for row in rows)
+        for column in ('calls', 'input_tokens', 'output_tokens', 'tts_characters', 'stt_seconds')
+    }
+    totals['stt_seconds'] = round(totals['stt_seconds'], 1)
+    return jsonify({'group_by': group_by, 'since': since, 'until': until, 'rows': rows, 'totals': totals,
+                    **ledger.ledger.stats()})
+
+@api.route('/api/inflight', methods=['GET'])
+def list_inflight():
+    """Open streams of the worker answering, with their upstream calls (each worker lists its own)"""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    return jsonify({'worker': os.getpid(), 'entries': inflight.registry.snapshot()})
+
+@api.route('/api/inflight/<entry_id>', methods=['DELETE'])
+def cancel_inflight(entry_id):
+    """Cancel an open stream: its upstream connections are closed and the response ends"""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    entry = inflight.registry.cancel(entry_id)
+    if entry is None:
+        return jsonify({'error': 'Unknown stream (finished, or open in another worker)', 'worker': os.getpid()}), 404
+    return jsonify(entry.snapshot())
+
+@api.route('/api/elevenlabs/stt', methods=['POST'])
 def elevenlabs_stt_proxy():
     """Proxy requests to ElevenLabs Speech-to-Text API - Uses scribe_v2 model with language support"""
     try:
@@ -677,33 +716,30 @@ def elevenlabs_stt_proxy():
         
         audio_file = request.files['audio']
         language = request.form.get('language', 'en')  # Get language from request
+        ledger.tag(language=language)
         
         if not ELEVENLABS_API_KEY or ELEVENLABS_API_KEY == 'YOUR_ELEVENLABS_API_KEY_HERE':
             print("[ERROR] ElevenLabs API key not configured!")
             return jsonify({'error': 'ElevenLabs API key not configured in server.py'}), 500
         
-        headers = {
-            'xi-api-key': ELEVENLABS_API_KEY
-        }
+        # Add language parameter
+        data = elevenlabs.stt_form(language)
         
-        audio_data = audio_file.read()
-        
-        files = {
-            'file': (audio_file.filename, audio_data, audio_file.content_type)
-        }
+        print(f"[STT] Transcribing audio file: {audio_file.filename} (Language: {data['language']})")
+        # WAV is trimmed and downsampled to 16 kHz PCM; the body is streamed from the upload
+        import stt_audio
+        body = stt_audio.upload_body(audio_file, data)
         
-        # Add language parameter - ElevenLabs supports 'en' and 'fr' language codes
-        data = {
-            'model_id': 'scribe_v2',
-            'language': 'fr' if language == 'fr' else 'en'  # Specify the language
+        headers = {
+            'xi-api-key': ELEVENLABS_API_KEY,
+            'Content-Type': body.content_type
         }
         
-        print(f"[STT] Transcribing audio file: {audio_file.filename} (Language: {data['language']})")
-        response = requests.post(
-            'https://api.elevenlabs.io/v1/speech-to-text',
+        admission.elevenlabs.acquire()
+        response = upstream.elevenlabs.post(
+            '/v1/speech-to-text',
             headers=headers,
-            files=files,
-            data=data,
+            data=body,
             timeout=30
         )
         
@@ -711,46 +747,44 @@ def elevenlabs_stt_proxy():
         
         if not response.ok:
             print(f"[ERROR] STT error: {response.text}")
+            return jsonify(response.json()), response.status_code
         
-        return jsonify(response.json()), response.status_code
+        result = response.json()
+        ledger.ledger.record(stt_seconds=elevenlabs.transcript_seconds(result))
+        return jsonify(result), response.status_code
         
+    except admission.Overloaded as e:
+        return overloaded(e)
     except Exception as e:
         print(f"[ERROR] STT exception: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    import os
-    
-    # Production settings
+    # Single-process server for local use; production runs through serve.py
     port = int(os.environ.get('PORT', 5000))
     host = os.environ.get('HOST', '0.0.0.0')
-    
-    # Local development vs Production
-    is_production = os.environ.get('RENDER') == 'True' or os.environ.get('PORT') != '5000'
-    
-    if is_production:
-        print("🚀 Starting Intervue AI - PRODUCTION MODE")
-        print("🌐 Server running on 0.0.0.0:" + str(port))
-        app.run(host=host, port=port, debug=False)
-    else:
-        # Original development startup screen
-        print("🚀 Starting AI Interview Trainer Server...")
-        print("=" * 60)
-        print("✅ FEATURES ENABLED:")
-        print("   - Interview Mode with Real-time Streaming")
-        print("   - Resume Analysis with Streaming TTS")
-        print("   - Cold Email Review with Streaming TTS")
-        print("   - Speech-to-Text (ElevenLabs Scribe)")
-        print("   - Text-to-Speech (ElevenLabs)")
-        print("   - Bilingual Support (English & French)")
-        print("=" * 60)
-        print("⚙️  API Configuration:")
-        print(f"   - Gemini API: {'✅ Configured' if GEMINI_API_KEY and GEMINI_API_KEY != 'YOUR_GEMINI_API_KEY_HERE' else '❌ Not Configured'}")
-        print(f"   - ElevenLabs API: {'✅ Configured' if ELEVENLABS_API_KEY and ELEVENLABS_API_KEY != 'YOUR_ELEVENLABS_API_KEY_HERE' else '❌ Not Configured'}")
-        print("=" * 60)
-        print("🌐 Server running at: http://localhost:5000")
-        print("📖 Open http://localhost:5000 in your browser")
-        print("=" * 60)
-        print("⚡ Powered by Google Gemini 2.0 Flash")
-        print("=" * 60)
-        app.run(debug=True, port=5000)
\ No newline at end of file
+    debug = os.environ.get('FLASK_DEBUG') == '1'
+
+    app = create_app()
+    warm_worker()
+
+    print("🚀 Starting AI Interview Trainer Server...")
+    print("=" * 60)
+    print("✅ FEATURES ENABLED:")
+    print("   - Interview Mode with Real-time Streaming")
+    print("   - Resume Analysis with Streaming TTS")
+    print("   - Cold Email Review with Streaming TTS")
+    print("   - Speech-to-Text (ElevenLabs Scribe)")
+    print("   - Text-to-Speech (ElevenLabs)")
+    print("   - Bilingual Support (English & French)")
+    print("=" * 60)
+    print("⚙️  API Configuration:")
+    print(f"   - Gemini API: {'✅ Configured' if GEMINI_API_KEY and GEMINI_API_KEY != 'YOUR_GEMINI_API_KEY_HERE' else '❌ Not Configured'}")
+    print(f"   - ElevenLabs API: {'✅ Configured' if ELEVENLABS_API_KEY and ELEVENLABS_API_KEY != 'YOUR_ELEVENLABS_API_KEY_HERE' else '❌ Not Configured'}")
+    print("=" * 60)
+    print(f"🌐 Server running at: http://localhost:{port}")
+    print(f"📖 Open http://localhost:{port} in your browser")
+    print("=" * 60)
+    print("⚡ Powered by Google Gemini 2.0 Flash")
+    print("=" * 60)
+    app.run(host=host, port=port, debug=debug, threaded=True)
\ No newline at end of file
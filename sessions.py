@@ -0,0 +1,194 @@
+"""Server-side conversation sessions for the interview and chat routes.
+
+The client creates a session once, then sends only each new turn with its
+``session_id``. The server keeps the history and, once it grows past
+SESSION_HISTORY_TOKENS, folds the oldest turns into a rolling summary on a
+background thread. Prompts therefore stay roughly the same size however long
+the interview runs. Sessions live in worker memory and expire when idle; the
+frontend recreates one from its own copy of the conversation if the server no
+longer knows it.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import admission
+import gemini
+import upstream
+from ledger import ledger
+from tokens import estimate_tokens
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get('SESSION_HISTORY_TOKENS', 2000))
+KEEP_RECENT_TURNS = int(os.environ.get('SESSION_KEEP_TURNS', 4))
+TTL_SECONDS = float(os.environ.get('SESSION_TTL', 3600))
+MAX_SESSIONS = int(os.environ.get('SESSION_MAX', 1000))
+
+SUMMARY_PROMPTS = {
+    'en': """Summarize this job interview so far for the interviewer's own notes, in at most 150 words. Keep every concrete fact the candidate shared (roles, employers, skills, numbers), the questions already asked, and any feedback already given. Write plain sentences, no lists or formatting.""",
+    'fr': """Résumez cet entretien d'embauche jusqu'ici pour les notes du recruteur, en 150 mots maximum. Conservez chaque fait concret partagé par le candidat (postes, employeurs, compétences, chiffres), les questions déjà posées et les retours déjà donnés. Écrivez des phrases simples, sans listes ni mise en forme.""",
+}
+
+SUMMARY_LABELS = {
+    'en': 'Summary of the conversation so far:',
+    'fr': 'Résumé de la conversation jusqu\'ici :',
+}
+
+_compactor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='session-compact')
+
+
+class UnknownSession(Exception):
+    """The session id is not (or no longer) known to this worker"""
+
+
+class Session:
+    def __init__(self, system='', language='en', messages=None):
+        self.id = uuid.uuid4().hex
+        self.system = system
+        self.language = language if language in SUMMARY_PROMPTS else 'en'
+        self.summary = ''
+        self.turns = []
+        self.compacting = False
+        self.compactions = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        for message in messages or []:
+            self._append(message.get('role', 'user'), message.get('content', ''))
+
+    def _append(self, role, content):
+        if isinstance(content, list):
+            content = ''.join(block.get('text', '') for block in content if block.get('type') == 'text')
+        self.turns.append({'role': role, 'content': content, 'tokens': estimate_tokens(content)})
+
+    def history_tokens(self):
+        return estimate_tokens(self.summary) + sum(turn['tokens'] for turn in self.turns)
+
+    def messages(self, message):
+        """Standard ``messages`` for the next request: summary, recent turns, then ``message``"""
+        with self.lock:
+            messages = []
+            if self.summary:
+                messages.append({'role': 'user', 'content': f"{SUMMARY_LABELS[self.language]}\n{self.summary}\n\n"})
+            messages.extend({'role': turn['role'], 'content': turn['content']} for turn in self.turns)
+        messages.append({'role': 'user', 'content': message})
+        return messages
+
+    def record(self, message, reply):
+        """Append a completed exchange"""
+        with self.lock:
+            self._append('user', message)
+            self._append('assistant', reply)
+            self.last_used = time.monotonic()
+
+    def info(self):
+        with self.lock:
+            return {
+                'session_id': self.id,
+                'language': self.language,
+                'turns': len(self.turns),
+                'summary': self.summary,
+                'history_tokens': self.history_tokens(),
+                'compactions': self.compactions,
+            }
+
+
+class SessionStore:
+    """Idle-expiring, size-bounded map of session id -> Session"""
+
+    def __init__(self, ttl=TTL_SECONDS, max_sessions=MAX_SESSIONS, budget=HISTORY_TOKEN_BUDGET,
+                 keep_recent=KEEP_RECENT_TURNS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, system='', language='en', messages=None):
+        session = Session(system, language, messages)
+        with self._lock:
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id):
+        """The live session for ``session_id``; raises UnknownSession"""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or now - session.last_used > self.ttl:
+                self._sessions.pop(session_id, None)
+                raise UnknownSession(session_id)
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+            return session
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def record(self, session, message, reply, api_key):
+        """Append an exchange and compact in the background if the history is over budget"""
+        session.record(message, reply)
+        with session.lock:
+            if session.compacting or session.history_tokens() <= self.budget:
+                return
+            if len(session.turns) <= self.keep_recent:
+                return
+            session.compacting = True
+            old_turns = session.turns[:len(session.turns) - self.keep_recent]
+            summary = session.summary
+        _compactor.submit(self._compact, session, summary, old_turns, api_key)
+
+    def _compact(self, session, summary, old_turns, api_key):
+        try:
+            transcript = '\n\n'.join(
+                f"{'Interviewer' if turn['role'] == 'assistant' else 'Candidate'}: {turn['content']}"
+                for turn in old_turns
+            )
+            if summary:
+                transcript = f"{SUMMARY_LABELS[session.language]}\n{summary}\n\n{transcript}"
+            payload = gemini.build_payload(
+                [{'text': SUMMARY_PROMPTS[session.language] + '\n\n'}, {'text': transcript}],
+                temperature=0.2,
+                max_tokens=400
+            )
+            # Not a route in ROUTE_PRIORITIES: queued behind live calls as bulk work
+            admission.prioritize('session-compaction')
+            admission.gemini.acquire(admission.payload_tokens(payload))
+            response = upstream.gemini.post(
+                upstream.gemini_path(api_key),
+                headers={'Content-Type': 'application/json'},
+                json=payload,
+                timeout=30
+            )
+            if not response.ok:
+                print(f"[SESSION] Compaction failed: {response.status_code}")
+                return
+            data = response.json()
+            usage = data.get('usageMetadata') or {}
+            ledger.record(
+                'session-compaction', session.language, session.id,
+                input_tokens=usage.get('promptTokenCount'), output_tokens=usage.get('candidatesTokenCount')
+            )
+            new_summary = gemini.format_response(data)['content'][0]['text'].strip()
+            if not new_summary:
+                return
+            with session.lock:
+                # Turns are only ever appended, so the compacted ones are still the oldest
+                if session.turns[:len(old_turns)] == old_turns:
+                    del session.turns[:len(old_turns)]
+                    session.summary = new_summary
+                    session.compactions += 1
+            print(f"[SESSION] Compacted {len(old_turns)} turns into a {estimate_tokens(new_summary)}-token summary")
+        except Exception as e:
+            print(f"[SESSION] Compaction exception: {str(e)}")
+        finally:
+            with session.lock:
+                session.compacting = False
+
+
+store = SessionStore()
@@ -0,0 +1,238 @@
+"""Coalescing of identical in-flight upstream requests.
+
+Concurrent requests with the same canonical upstream payload (double clicks,
+frontend retries) share a single upstream call. For streams, the upstream is
+consumed by a background producer into a shared buffer: the first subscriber
+and any follower that attaches later read the chunks already produced and then
+the live tail. The upstream is abandoned once every subscriber has gone.
+
+Each producer reads upstream in an inflight ``shared`` entry of its own, so a
+subscriber leaving (or its client hanging up) only ends its own subscription;
+the upstream connection is shut down when the last one leaves.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import threading
+
+import inflight
+
+
+def key_for(route, payload, session_id=None):
+    """Canonical hash of an upstream payload for ``route``.
+
+    A call whose reply is recorded into a session is only shared with requests
+    continuing that same session: the producer records it once, for its own.
+    """
+    encoded = json.dumps(
+        [route, payload, session_id], sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Flight:
+    """Buffer of chunks from one producer, shared by every subscriber"""
+
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.subscribers = 0
+        self.cancelled = False
+        self.condition = threading.Condition()
+        self.entry = None
+
+
+class Group:
+    """Thread-based single-flight group used by the Flask routes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._flights = {}
+        self._counters = {'leaders': 0, 'followers': 0, 'stream_leaders': 0, 'stream_followers': 0}
+
+    def do(self, key, fn):
+        """Run ``fn()`` once for all concurrent callers with the same ``key``"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters['leaders'] += 1
+            else:
+                self._counters['followers'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            print("[SINGLEFLIGHT] Joined an identical in-flight request")
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stream(self, key, produce):
+        """Return an iterator over the chunks of ``produce()``, shared by identical streams"""
+        entry = inflight.current()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                flight.entry = inflight.Entry(entry.route if entry is not None else 'unknown', 'shared')
+                self._counters['stream_leaders'] += 1
+                start = True
+            else:
+                self._counters['stream_followers'] += 1
+                print("[SINGLEFLIGHT] Attached to an identical in-flight stream")
+                start = False
+            with flight.condition:
+                flight.subscribers += 1
+
+        if start:
+            # The producer runs in the leader's context (usage ledger tags)
+            threading.Thread(
+                target=contextvars.copy_context().run, args=(self._run, key, flight, produce),
+                name='singleflight-producer', daemon=True
+            ).start()
+        return self._subscribe(flight, entry)
+
+    def _run(self, key, flight, produce):
+        inflight.enter(flight.entry)
+        inflight.registry.add(flight.entry)
+        generator = produce()
+        try:
+            for chunk in generator:
+                with flight.condition:
+                    if flight.cancelled:
+                        break
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+        except Exception as e:
+            if flight.entry.cancelled is None:
+                print(f"[SINGLEFLIGHT] Producer error: {str(e)}")
+        finally:
+            generator.close()
+            inflight.registry.remove(flight.entry)
+            flight.entry.close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.condition:
+                flight.finished = True
+                flight.condition.notify_all()
+
+    def _subscribe(self, flight, entry):
+        index = 0
+        if entry is not None:
+            entry.on_cancel(lambda: self._wake(flight))
+        try:
+            while True:
+                with flight.condition:
+                    while index >= len(flight.chunks) and not flight.finished:
+                        if entry is not None and entry.cancelled is not None:
+                            return
+                        flight.condition.wait()
+                    if index >= len(flight.chunks):
+                        return
+                    pending = flight.chunks[index:]
+                index += len(pending)
+                yield from pending
+        finally:
+            with flight.condition:
+                flight.subscribers -= 1
+                abandoned = flight.subscribers == 0 and not flight.finished
+                if abandoned:
+                    # Nobody is listening any more, stop reading from upstream
+                    flight.cancelled = True
+            if abandoned:
+                flight.entry.cancel('abandoned')
+
+    @staticmethod
+    def _wake(flight):
+        with flight.condition:
+            flight.condition.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+class AsyncGroup:
+    """asyncio counterpart of Group.stream for the ASGI routes"""
+
+    def __init__(self):
+        self._flights = {}
+
+    def stream(self, key, produce):
+        flight = self._flights.get(key)
+        if flight is None:
+            entry = inflight.current()
+            flight = self._flights[key] = {
+                'chunks': [], 'finished': False, 'subscribers': 0, 'changed': asyncio.Event(), 'task': None,
+                'entry': inflight.Entry(entry.route if entry is not None else 'unknown', 'shared')
+            }
+            flight['task'] = asyncio.ensure_future(self._run(key, flight, produce))
+        else:
+            print("[SINGLEFLIGHT] Attached to an identical in-flight stream")
+        flight['subscribers'] += 1
+        return self._subscribe(flight)
+
+    async def _run(self, key, flight, produce):
+        # The task has its own context: the entry is not the leader's
+        entry = inflight.enter(flight['entry'])
+        inflight.registry.add(entry)
+        loop = asyncio.get_running_loop()
+        entry.on_cancel(lambda: loop.call_soon_threadsafe(flight['task'].cancel))
+        try:
+            async for chunk in produce():
+                flight['chunks'].append(chunk)
+                flight['changed'].set()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"[SINGLEFLIGHT] Producer error: {str(e)}")
+        finally:
+            inflight.registry.remove(entry)
+            await entry.aclose()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight['finished'] = True
+            flight['changed'].set()
+
+    async def _subscribe(self, flight):
+        index = 0
+        try:
+            while True:
+                if index < len(flight['chunks']):
+                    pending = flight['chunks'][index:]
+                    index += len(pending)
+                    for chunk in pending:
+                        yield chunk
+                    continue
+                if flight['finished']:
+                    return
+                flight['changed'].clear()
+                await flight['changed'].wait()
+        finally:
+            flight['subscribers'] -= 1
+            if flight['subscribers'] == 0 and not flight['finished']:
+                flight['task'].cancel()
+
+
+group = Group()
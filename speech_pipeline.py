@@ -0,0 +1,246 @@
+"""Server-side sentence pipeline: Gemini text and TTS audio in one multiplexed stream.
+
+The Gemini stream is read on a background thread and segmented into sentences
+as deltas arrive. Each complete sentence is handed to a shared TTS worker pool
+straight away, so audio for sentence N+1 is being generated while sentence N
+is still being sent. Text deltas and audio chunks are interleaved into a single
+SSE stream, with audio always delivered in sentence order.
+"""
+import base64
+import contextvars
+import json
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import admission
+import elevenlabs
+import inflight
+import ledger
+import metrics
+import sse_relay
+import tts_cache
+import upstream
+
+TTS_WORKERS = int(os.environ.get('PIPELINE_TTS_WORKERS', 8))
+
+_tts_pool = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix='pipeline-tts')
+
+# Sentence end: terminal punctuation, optional closing quote/bracket, then whitespace
+_SENTENCE_END = re.compile(r'[.!?]+["\'»)\]]*\s+')
+
+_FORMATTING = [
+    (re.compile(r'\*\*(.+?)\*\*'), r'\1'),          # Remove bold
+    (re.compile(r'\*(.+?)\*'), r'\1'),              # Remove italic
+    (re.compile(r'_(.+?)_'), r'\1'),                # Remove underscores
+    (re.compile(r'#{1,6}\s'), ''),                  # Remove headers
+    (re.compile(r'`(.+?)`'), r'\1'),                # Remove code blocks
+    (re.compile(r'\[(.+?)\]\(.+?\)'), r'\1'),       # Remove links, keep text
+    (re.compile(r'^[\-\*]\s', re.M), ''),           # Remove bullet points
+    (re.compile(r'^\d+\.\s', re.M), ''),            # Remove numbered lists
+]
+
+
+def strip_formatting(text):
+    """Remove markdown before speaking, same rules as the frontend's stripFormatting"""
+    for pattern, replacement in _FORMATTING:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+class SentenceSegmenter:
+    """Accumulates text deltas and returns sentences as soon as they are complete"""
+
+    def __init__(self):
+        self._buffer = ''
+
+    def feed(self, text):
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            sentences.append(self._buffer[start:match.end()].strip())
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return [s for s in sentences if s]
+
+    def flush(self):
+        rest, self._buffer = self._buffer.strip(), ''
+        return [rest] if rest else []
+
+
+def _frame(event):
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def _synthesize(index, sentence, voice_id, api_key, events, cancelled, profile):
+    """Generate audio for one sentence, pushing chunks onto ``events`` as they arrive"""
+    try:
+        voice_id, payload = elevenlabs.tts_request({'voice_id': voice_id, 'text': sentence})
+        output_format, media_type, _ = elevenlabs.TTS_PROFILES[profile]
+        key = tts_cache.cache_key(voice_id, payload, output_format)
+        audio = tts_cache.cache.get(key)
+        if audio is not None:
+            events.put(('audio', index, audio))
+            return
+
+        admission.elevenlabs.acquire(len(payload['text']))
+        response = upstream.elevenlabs.post(
+            elevenlabs.tts_path(voice_id, profile, stream=True),
+            headers=elevenlabs.tts_headers(api_key, media_type),
+            json=payload,
+            stream=True,
+            timeout=30
+        )
+        try:
+            if not response.ok:
+                print(f"[PIPELINE] TTS failed for sentence {index}: {response.status_code}")
+                return
+            ledger.ledger.record(tts_characters=len(payload['text']))
+            chunks = []
+            for chunk in response.iter_content(chunk_size=8192):
+                if cancelled.is_set():
+                    return
+                if chunk:
+                    chunks.append(chunk)
+                    events.put(('audio', index, chunk))
+            audio = b''.join(chunks)
+            metrics.TTS_AUDIO_BYTES.labels('/api/interview/stream', profile).inc(len(audio))
+            tts_cache.cache.put(key, audio)
+        finally:
+            response.close()
+    except Exception as e:
+        if not cancelled.is_set():
+            print(f"[PIPELINE] TTS exception for sentence {index}: {str(e)}")
+    finally:
+        events.put(('audio_done', index, None))
+
+
+def stream_speech(gemini_api_key, elevenlabs_api_key, gemini_payload, voice_id, timeout=60, on_complete=None,
+                  profile=elevenlabs.DEFAULT_TTS_PROFILE):
+    """Yield SSE frames interleaving text deltas with per-sentence audio.
+
+    ``on_complete`` is called with the full reply once Gemini finished successfully.
+    Audio is synthesized in the elevenlabs.TTS_PROFILES ``profile``; each
+    ``audio_stop`` event names its ``media_type``. Cancelling the current
+    inflight entry ends the stream at once.
+    """
+    media_type = elevenlabs.TTS_PROFILES[profile][1]
+    events = queue.Queue()
+    cancelled = threading.Event()
+    sentences = []
+    state = {'response': None}
+
+    def cancel():
+        cancelled.set()
+        events.put(('cancelled', None, None))
+
+    entry = inflight.current()
+    if entry is not None:
+        entry.on_cancel(cancel)
+
+    def start_sentence(sentence):
+        spoken = strip_formatting(sentence)
+        if not spoken:
+            return
+        index = len(sentences)
+        sentences.append(spoken)
+        events.put(('sentence', index, spoken))
+        # Worker threads run in the request's context, so usage is tagged with its route and session
+        _tts_pool.submit(
+            contextvars.copy_context().run, _synthesize, index, spoken, voice_id, elevenlabs_api_key, events,
+            cancelled, profile
+        )
+
+    def read_gemini():
+        segmenter = SentenceSegmenter()
+        relay = sse_relay.GeminiRelay('/api/interview/stream', keep_text=on_complete is not None)
+        try:
+            response = upstream.gemini.post(
+                upstream.gemini_path(gemini_api_key, stream=True),
+                headers={'Content-Type': 'application/json'},
+                json=gemini_payload,
+                stream=True,
+                timeout=timeout
+            )
+            state['response'] = response
+            try:
+                for data in response.iter_content(chunk_size=None):
+                    if cancelled.is_set():
+                        return
+                    deltas = relay.feed(data)
+                    frame = relay.frame()
+                    if frame:
+                        events.put(('text', None, frame))
+                    for text in deltas:
+                        for sentence in segmenter.feed(text):
+                            start_sentence(sentence)
+                frame = relay.flush()
+                if frame:
+                    events.put(('text', None, frame))
+                for sentence in segmenter.flush():
+                    start_sentence(sentence)
+                if on_complete is not None and response.ok and relay.text_parts:
+                    on_complete(relay.text())
+            finally:
+                response.close()
+        except Exception as e:
+            if cancelled.is_set():
+                return
+            print(f"[PIPELINE] Gemini stream error: {str(e)}")
+            events.put(('error', None, str(e)))
+        finally:
+            relay.finish()
+            events.put(('text_done', None, None))
+
+    reader = threading.Thread(
+        target=contextvars.copy_context().run, args=(read_gemini,), name='pipeline-gemini', daemon=True
+    )
+    reader.start()
+
+    # Audio is emitted strictly in sentence order; later sentences are held back until earlier ones finish
+    pending = {}
+    finished = set()
+    next_audio = 0
+    text_done = False
+    try:
+        while not (text_done and next_audio == len(sentences)):
+            kind, index, value = events.get()
+            if kind == 'cancelled':
+                return
+            if kind == 'text':
+                yield value
+            elif kind == 'error':
+                yield _frame({'type': 'error', 'error': {'message': value}})
+            elif kind == 'text_done':
+                text_done = True
+            elif kind == 'sentence':
+                pending[index] = []
+            elif kind == 'audio':
+                if index == next_audio:
+                    yield _frame({'type': 'audio_delta', 'index': index,
+                                  'audio': base64.b64encode(value).decode('ascii')})
+                else:
+                    pending[index].append(value)
+            elif kind == 'audio_done':
+                finished.add(index)
+
+            # Release every sentence whose audio is complete, then the head's buffered chunks
+            while next_audio in finished:
+                yield _frame({'type': 'audio_stop', 'index': next_audio, 'text': sentences[next_audio],
+                              'media_type': media_type})
+                pending.pop(next_audio, None)
+                next_audio += 1
+                for chunk in pending.get(next_audio, []):
+                    yield _frame({'type': 'audio_delta', 'index': next_audio,
+                                  'audio': base64.b64encode(chunk).decode('ascii')})
+                if next_audio in pending:
+                    pending[next_audio] = []
+
+        yield _frame({'type': 'message_stop'})
+    finally:
+        cancelled.set()
+        if state['response'] is not None:
+            state['response'].close()
@@ -0,0 +1,239 @@
+"""Relay from Gemini's streamGenerateContent SSE to standard ``content_block_delta`` frames.
+
+Shared by every streaming route. Instead of decoding each line, parsing the
+whole Gemini chunk and serializing a new frame per delta, the relay finds the
+single ``"text"`` string in the raw bytes and copies it, still JSON-escaped,
+into a reused frame buffer. Chunks that do not fit that shape (several parts,
+no text, unusual escaping) fall back to a full parse.
+
+Deltas from the same upstream read always share one frame. With
+SSE_COALESCE_MS > 0, frames are also held until that window has passed or
+SSE_COALESCE_BYTES of text are pending. The first frame of a stream is never
+held, so time to first token is unchanged. The sync relay checks the window
+when upstream data arrives; the async relay also flushes on a timer.
+
+A route can pass ``events`` (e.g. resume_events.ResumeEvents) to add its own
+typed frames: they are sent after the delta frames of the read that completed
+them, and held text is flushed first, so their offsets never point past the
+text the client has.
+"""
+import asyncio
+import json
+import os
+import time
+from json.decoder import scanstring
+from json.encoder import encode_basestring_ascii
+
+import gemini
+import metrics
+
+COALESCE_MS = float(os.environ.get('SSE_COALESCE_MS', 0))
+COALESCE_BYTES = int(os.environ.get('SSE_COALESCE_BYTES', 256))
+
+_DATA = b'data: '
+_TEXT_KEY = b'"text"'
+_USAGE_KEY = b'"usageMetadata"'
+_FRAME_PREFIX = b'data: {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "'
+_FRAME_SUFFIX = b'"}}\n\n'
+_SPACE = b' \t'
+
+
+class GeminiRelay:
+    """Turns raw streamGenerateContent bytes into coalesced delta frames for one stream.
+
+    Create it just before the upstream request so time to first token is measured from there.
+    """
+
+    def __init__(self, route, keep_text=False, coalesce_ms=COALESCE_MS, coalesce_bytes=COALESCE_BYTES, events=None):
+        self.metrics = metrics.GeminiStream(route)
+        self.keep_text = keep_text
+        self.events = events
+        self.text_parts = []
+        self.window = coalesce_ms / 1000.0
+        self.max_pending = coalesce_bytes
+        self._lines = bytearray()
+        self._frame = bytearray(_FRAME_PREFIX)
+        self._pending_since = None
+        self._frames_sent = 0
+        self._usage_line = None
+
+    def feed(self, data):
+        """Consume raw upstream bytes; return the text deltas of every line they complete"""
+        lines = self._lines
+        lines += data
+        deltas = []
+        start = 0
+        while True:
+            end = lines.find(b'\n', start)
+            if end == -1:
+                break
+            stop = end - 1 if end > start and lines[end - 1] == 13 else end  # strip \r
+            if lines.startswith(_DATA, start, stop):
+                text = self._delta(lines, start + len(_DATA), stop)
+                if text is not None:
+                    deltas.append(text)
+                    self.metrics.chunk(text, None)
+            start = end + 1
+        if start:
+            del lines[:start]
+
+        if self.keep_text:
+            self.text_parts.extend(deltas)
+        if self._pending_since is None and len(self._frame) > len(_FRAME_PREFIX):
+            self._pending_since = time.monotonic()
+        return deltas
+
+    def _delta(self, buf, start, stop):
+        if buf.find(_USAGE_KEY, start, stop) != -1:
+            # Only the last one matters; parsed once in finish()
+            self._usage_line = bytes(buf[start:stop])
+
+        key = buf.find(_TEXT_KEY, start, stop)
+        if key == -1 or buf[key - 1] == 92 or buf.find(_TEXT_KEY, key + len(_TEXT_KEY), stop) != -1:
+            return self._parse(buf, start, stop)
+
+        i = key + len(_TEXT_KEY)
+        while i < stop and buf[i] in _SPACE:
+            i += 1
+        if i >= stop or buf[i] != 58:  # ':'
+            return self._parse(buf, start, stop)
+        i += 1
+        while i < stop and buf[i] in _SPACE:
+            i += 1
+        if i >= stop or buf[i] != 34:  # '"'
+            return self._parse(buf, start, stop)
+        i += 1
+
+        end = buf.find(b'"', i, stop)
+        if end != -1 and buf.find(b'\\', i, end) == -1:
+            # No escapes: the raw bytes are both the text and valid JSON string content
+            raw = buf[i:end]
+            self._frame += raw
+            return raw.decode('utf-8')
+
+        tail = buf[i:stop].decode('utf-8')
+        try:
+            text, end = scanstring(tail, 0)
+        except ValueError:
+            return self._parse(buf, start, stop)
+        self._frame += tail[:end - 1].encode('utf-8')
+        return text
+
+    def _parse(self, buf, start, stop):
+        text, _ = gemini.sse_chunk(bytes(buf[start - len(_DATA):stop]))
+        if text is not None:
+            self._frame += encode_basestring_ascii(text)[1:-1].encode('ascii')
+        return text
+
+    def remaining(self):
+        """Seconds until pending text must be flushed, or None if nothing is held"""
+        if self._pending_since is None or not self.window or not self._frames_sent:
+            return None
+        return max(0.0, self.window - (time.monotonic() - self._pending_since))
+
+    def frame(self):
+        """The pending text as one frame if the coalescing window allows sending it now, else None"""
+        pending = len(self._frame) - len(_FRAME_PREFIX)
+        if not pending:
+            return None
+        if self.window and self._frames_sent and pending < self.max_pending:
+            if time.monotonic() - self._pending_since < self.window:
+                return None
+        return self.flush()
+
+    def flush(self):
+        """The pending text as one frame regardless of the window, or None"""
+        if len(self._frame) == len(_FRAME_PREFIX):
+            return None
+        self._frame += _FRAME_SUFFIX
+        frame = bytes(self._frame)
+        del self._frame[len(_FRAME_PREFIX):]
+        self._pending_since = None
+        self._frames_sent += 1
+        return frame
+
+    def text(self):
+        return ''.join(self.text_parts)
+
+    def event_frames(self, deltas):
+        """Frames of the ``events`` completed by ``deltas``"""
+        if self.events is None:
+            return []
+        return [frame for text in deltas for frame in self.events.feed(text)]
+
+    def closing_frames(self):
+        return self.events.close() if self.events is not None else []
+
+    def finish(self):
+        """Report usage and generation rate; call once however the stream ends"""
+        if self._usage_line is not None:
+            try:
+                self.metrics.usage = json.loads(self._usage_line).get('usageMetadata')
+            except ValueError:
+                pass
+        self.metrics.finish()
+
+    def relay(self, response, on_complete=None):
+        """Yield frames from a ``requests`` streaming response, closing it at the end.
+
+        ``on_complete`` is called with the full text once the stream finishes
+        successfully (requires ``keep_text``).
+        """
+        try:
+            for data in response.iter_content(chunk_size=None):
+                deltas = self.feed(data)
+                events = self.event_frames(deltas)
+                frame = self.flush() if events else self.frame()
+                if frame:
+                    yield frame
+                yield from events
+            frame = self.flush()
+            if frame:
+                yield frame
+            yield from self.closing_frames()
+            if on_complete is not None and response.ok and self.text_parts:
+                on_complete(self.text())
+        finally:
+            # Hand the keep-alive connection back to the pool even if the client left early
+            response.close()
+            self.finish()
+
+    async def arelay(self, response, on_complete=None):
+        """Async counterpart of relay() for an httpx streaming response (closed by the caller)"""
+        chunks = response.aiter_bytes().__aiter__()
+        next_chunk = None
+        try:
+            while True:
+                if next_chunk is None:
+                    next_chunk = asyncio.ensure_future(chunks.__anext__())
+                done, _ = await asyncio.wait({next_chunk}, timeout=self.remaining())
+                if not done:
+                    # Window expired while upstream is quiet
+                    frame = self.flush()
+                    if frame:
+                        yield frame
+                    continue
+                try:
+                    data = next_chunk.result()
+                except StopAsyncIteration:
+                    next_chunk = None
+                    break
+                next_chunk = None
+                deltas = self.feed(data)
+                events = self.event_frames(deltas)
+                frame = self.flush() if events else self.frame()
+                if frame:
+                    yield frame
+                for frame in events:
+                    yield frame
+            frame = self.flush()
+            if frame:
+                yield frame
+            for frame in self.closing_frames():
+                yield frame
+            if on_complete is not None and response.is_success and self.text_parts:
+                on_complete(self.text())
+        finally:
+            if next_chunk is not None:
+                next_chunk.cancel()
+            self.finish()
@@ -0,0 +1,114 @@
+"""Static delivery of the single-file frontend.
+
+At startup index.html is split: each inline ``<style>`` and ``<script>`` block
+becomes a file named after a hash of its content, served from /assets/ with
+``Cache-Control: immutable``, so browsers keep them until the code changes. The
+rewritten page is revalidated on every load. Every file is precompressed once
+with gzip and brotli and served in the best encoding the client accepts, with
+a strong ETag per encoding, and ``If-None-Match`` revalidations answer 304
+without a body.
+"""
+import gzip
+import hashlib
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENABLED = os.environ.get('STATIC_ASSETS', '1') == '1'
+ASSET_MAX_AGE = int(os.environ.get('STATIC_ASSET_MAX_AGE', 31536000))
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+PREFIX = '/assets/'
+# Below this, compression does not pay for the Content-Encoding round trip
+MIN_COMPRESS_BYTES = 1024
+
+_INLINE = re.compile(r'<(style|script)>(.*?)</\1>', re.S)
+_TYPES = {'style': ('css', 'text/css; charset=utf-8'), 'script': ('js', 'text/javascript; charset=utf-8')}
+
+
+class Asset:
+    """One file and its precompressed variants"""
+
+    def __init__(self, body, content_type, cache_control):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {None: body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants['br'] = brotli.compress(body, quality=11)
+
+    def etag(self, encoding):
+        # Strong validators must differ per encoding: the bytes differ
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+    def encoding_for(self, accept_encoding):
+        """The smallest variant allowed by an Accept-Encoding header (None = identity)"""
+        accepted = {}
+        for item in (accept_encoding or '').split(','):
+            name, _, params = item.strip().partition(';')
+            quality = 1.0
+            match = re.search(r'q=([0-9.]+)', params)
+            if match:
+                try:
+                    quality = float(match.group(1))
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip().lower()] = quality
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def response(self, accept_encoding, if_none_match):
+        """``(status, headers, body)`` for a GET with the given request headers"""
+        encoding = self.encoding_for(accept_encoding)
+        etag = self.etag(encoding)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        candidates = [tag.strip() for tag in (if_none_match or '').split(',')]
+        if '*' in candidates or etag in candidates:
+            return 304, headers, b''
+        body = self.variants[encoding]
+        headers['Content-Type'] = self.content_type
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return 200, headers, body
+
+
+class Site:
+    """The rewritten index page and the assets split out of it"""
+
+    def __init__(self, path):
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        self.assets = {}
+
+        def extract(match):
+            tag, content = match.group(1), match.group(2)
+            extension, content_type = _TYPES[tag]
+            asset = Asset(content.encode('utf-8'), content_type, f'public, max-age={ASSET_MAX_AGE}, immutable')
+            name = f'app.{asset.digest}.{extension}'
+            self.assets[name] = asset
+            if tag == 'style':
+                return f'<link rel="stylesheet" href="{PREFIX}{name}">'
+            return f'<script src="{PREFIX}{name}"></script>'
+
+        page = _INLINE.sub(extract, html)
+        # The page names the current asset hashes, so it must be revalidated on every load
+        self.index = Asset(page.encode('utf-8'), 'text/html; charset=utf-8', 'no-cache')
+        sizes = ', '.join(f"{name} {len(asset.variants[None])} B" for name, asset in self.assets.items())
+        print(f"[STATIC] index.html {len(self.index.variants[None])} B, assets: {sizes or 'none'}"
+              f"{'' if brotli else ' (brotli not installed, gzip only)'}")
+
+
+def build(path=os.path.join(ROOT, 'index.html')):
+    return Site(path)
@@ -0,0 +1,212 @@
+"""Preprocessing of recorded answers before they are sent to ElevenLabs STT.
+
+Uncompressed WAV uploads are downmixed to mono, trimmed to the span that
+contains speech (frame-energy voice activity detection), resampled to 16 kHz
+and sent as raw 16-bit PCM with ``file_format=pcm_s16le_16``, the input scribe
+transcribes with the least overhead. Decoding works on a view of the upload,
+with no extra copies. The multipart body is read by requests in blocks, so it
+is never assembled in memory either. Compressed formats (the browser's webm)
+and WAV variants that are not handled are forwarded unchanged.
+"""
+import io
+import os
+import struct
+import uuid
+
+import numpy as np
+
+TARGET_RATE = 16000
+STT_FILE_FORMAT = 'pcm_s16le_16'
+
+VAD_ENABLED = os.environ.get('STT_VAD', '1') == '1'
+VAD_THRESHOLD_DB = float(os.environ.get('STT_VAD_THRESHOLD_DB', 35))
+VAD_PADDING_SECONDS = float(os.environ.get('STT_VAD_PADDING', 0.25))
+FRAME_SECONDS = 0.02
+# Frames quieter than this are silence however quiet the whole recording is
+ABSOLUTE_FLOOR = 10 ** (-60 / 20)
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+_PCM_DTYPES = {8: np.uint8, 16: np.dtype('<i2'), 32: np.dtype('<i4')}
+
+
+def parse_wav(buffer):
+    """``(format, channels, rate, bits, data)`` of a RIFF/WAVE buffer, or None.
+
+    ``data`` is a memoryview of the sample bytes inside ``buffer``.
+    """
+    view = memoryview(buffer)
+    if len(view) < 12 or view[:4] != b'RIFF' or view[8:12] != b'WAVE':
+        return None
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        size = struct.unpack_from('<I', view, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b'fmt ' and size >= 16:
+            audio_format, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', view, body)
+            if audio_format == _WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                audio_format = struct.unpack_from('<H', view, body + 24)[0]
+            fmt = (audio_format, channels, rate, bits)
+        elif chunk_id == b'data' and fmt is not None:
+            # Streaming recorders leave the size at 0 or 0xFFFFFFFF: take everything
+            end = len(view) if size in (0, 0xFFFFFFFF) else min(len(view), body + size)
+            return fmt + (view[body:end],)
+        offset = body + size + (size & 1)
+    return None
+
+
+def to_mono(audio_format, channels, bits, data):
+    """float32 mono samples in [-1, 1] for PCM 8/16/32-bit or float32 data, or None"""
+    if channels < 1:
+        return None
+    if audio_format == _WAVE_FORMAT_FLOAT and bits == 32:
+        dtype, scale, offset = np.dtype('<f4'), 1.0, 0.0
+    elif audio_format == _WAVE_FORMAT_PCM and bits in _PCM_DTYPES:
+        dtype = _PCM_DTYPES[bits]
+        scale = 1.0 / (2 ** (bits - 1))
+        offset = 128.0 if bits == 8 else 0.0
+    else:
+        return None
+    frame_bytes = channels * bits // 8
+    usable = len(data) - len(data) % frame_bytes
+    samples = np.frombuffer(data[:usable], dtype=dtype).reshape(-1, channels)
+    mono = samples.mean(axis=1, dtype=np.float32) if channels > 1 else samples[:, 0].astype(np.float32)
+    if offset:
+        mono -= offset
+    mono *= scale
+    return mono
+
+
+def voiced_span(samples, rate, threshold_db=VAD_THRESHOLD_DB, padding=VAD_PADDING_SECONDS):
+    """``(start, stop)`` sample indices around the frames whose energy is speech-like"""
+    frame = max(1, int(rate * FRAME_SECONDS))
+    frames = len(samples) // frame
+    if frames == 0:
+        return 0, len(samples)
+    rms = np.sqrt(np.mean(np.square(samples[:frames * frame].reshape(frames, frame)), axis=1))
+    threshold = max(rms.max() * 10 ** (-threshold_db / 20), ABSOLUTE_FLOOR)
+    voiced = np.flatnonzero(rms >= threshold)
+    if len(voiced) == 0:
+        return 0, len(samples)
+    pad = int(rate * padding)
+    return max(0, voiced[0] * frame - pad), min(len(samples), (voiced[-1] + 1) * frame + pad)
+
+
+def _lowpass_taps(cutoff, taps=63):
+    """Hamming-windowed sinc low-pass FIR; ``cutoff`` is a fraction of the source rate"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(samples, rate, target=TARGET_RATE):
+    """Resample to ``target`` Hz, low-passing first when downsampling"""
+    if rate == target or len(samples) == 0:
+        return samples
+    if rate > target:
+        # Keep content below ~0.45 of the new rate so nothing folds back into the speech band
+        samples = np.convolve(samples, _lowpass_taps(0.45 * target / rate), mode='same')
+    positions = np.arange(int(len(samples) * target / rate), dtype=np.float64) * (rate / target)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def to_pcm16(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+
+
+def preprocess_wav(buffer, vad=VAD_ENABLED):
+    """16 kHz mono 16-bit PCM for a WAV upload plus a summary, or None if unsupported"""
+    wav = parse_wav(buffer)
+    if wav is None:
+        return None
+    audio_format, channels, rate, bits, data = wav
+    samples = to_mono(audio_format, channels, bits, data)
+    if samples is None or rate <= 0:
+        return None
+    duration = len(samples) / rate
+    if vad:
+        start, stop = voiced_span(samples, rate)
+        samples = samples[start:stop]
+    pcm = to_pcm16(resample(samples, rate))
+    summary = (f"{duration:.1f}s @ {rate} Hz x{channels} -> {len(pcm) / TARGET_RATE:.1f}s @ "
+               f"{TARGET_RATE} Hz mono ({len(buffer)} -> {pcm.nbytes} bytes)")
+    return pcm, summary
+
+
+class _BufferReader:
+    """``read(n)`` over a buffer, without copying it whole"""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._offset = 0
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else self._offset + size
+        chunk = self._view[self._offset:end]
+        self._offset += len(chunk)
+        return chunk.tobytes()
+
+
+class MultipartBody:
+    """multipart/form-data body with one file, read incrementally by requests"""
+
+    def __init__(self, fields, name, filename, content_type, content, size):
+        boundary = uuid.uuid4().hex
+        head = ''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'
+            for key, value in fields.items()
+        )
+        head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: {content_type}\r\n\r\n')
+        tail = f'\r\n--{boundary}--\r\n'
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        self._parts = [io.BytesIO(head.encode('utf-8')), content, io.BytesIO(tail.encode('utf-8'))]
+        self._length = len(head.encode('utf-8')) + size + len(tail)
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and (size is None or size < 0 or size > 0):
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            chunks.append(chunk)
+            if size is not None and size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+
+def upload_body(audio_file, form, log_tag='STT'):
+    """Multipart body for /v1/speech-to-text from an uploaded ``audio_file`` and the ``form`` fields"""
+    stream = audio_file.stream
+    head = stream.read(12)
+    stream.seek(0)
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        buffer = stream.getbuffer() if isinstance(stream, io.BytesIO) else stream.read()
+        try:
+            result = preprocess_wav(buffer)
+        except Exception as e:
+            print(f"[{log_tag}] Audio preprocessing failed, sending the original: {str(e)}")
+            result = None
+        if result is not None:
+            pcm, summary = result
+            print(f"[{log_tag}] Preprocessed audio: {summary}")
+            return MultipartBody(
+                {**form, 'file_format': STT_FILE_FORMAT}, 'file', 'audio.pcm', 'application/octet-stream',
+                _BufferReader(pcm), pcm.nbytes
+            )
+
+    # Anything else is forwarded as uploaded, straight from the spooled upload. The client's file
+    # name is not: it would go unescaped into the part headers
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return MultipartBody(
+        form, 'file', 'audio', audio_file.content_type or 'application/octet-stream', stream, size
+    )
@@ -0,0 +1,20 @@
+"""Run the app against bench.fake_upstream: the server modules read their settings on import"""
+import os
+
+from bench import fake_upstream
+
+_server, UPSTREAM_URL = fake_upstream.start(0, fake_upstream.Config(
+    latency_ms=50, token_rate=15, tokens=300, chunk_tokens=2, audio_bytes=48000, audio_chunk=1000, audio_rate=4000
+))
+
+os.environ.update(
+    GEMINI_BASE_URL=UPSTREAM_URL,
+    ELEVENLABS_BASE_URL=UPSTREAM_URL,
+    GEMINI_API_KEY='test',
+    ELEVENLABS_API_KEY='test',
+    UPSTREAM_WARM='0',
+    GEMINI_CONTEXT_CACHE='0',
+    PDF_EXTRACT_WARM='0',
+    USAGE_LEDGER_PATH='',
+    TTS_CACHE_DIR='',
+)
@@ -0,0 +1,36 @@
+import context_cache
+import prompts
+
+
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+
+    def post(self, path, **kwargs):
+        self.calls.append(path)
+        raise AssertionError('no cachedContents should be created')
+
+
+def test_templates_under_the_minimum_are_never_registered(capsys):
+    client = RecordingClient()
+    cache = context_cache.ContextCache(client=client, min_tokens=1024)
+    cache.start('key', prompts.templates())
+    assert cache._thread is None
+    assert cache._refresh() == cache.ttl
+    assert client.calls == []
+    assert cache.name_for(prompts.get('resume')) is None
+    assert capsys.readouterr().out.count('under the 1024 token minimum') == len(prompts.templates())
+
+
+def test_extension_without_quota_keeps_the_live_entry(monkeypatch):
+    class NoQuota:
+        def acquire(self, units=0, max_wait=None):
+            raise context_cache.admission.Overloaded('gemini', 7)
+
+    monkeypatch.setattr(context_cache.admission, 'gemini', NoQuota())
+    template = prompts.get('resume')
+    cache = context_cache.ContextCache(client=RecordingClient(), ttl=600, refresh_margin=300, min_tokens=0)
+    cache._templates = [template]
+    cache._entries[template.key] = ('cachedContents/abc', context_cache.time.monotonic() + 100)
+    assert 5 < cache._refresh() <= 7
+    assert cache.name_for(template) == 'cachedContents/abc'
@@ -0,0 +1,54 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+uvicorn = pytest.importorskip('uvicorn')
+
+import asgi
+import inflight
+
+
+@pytest.fixture(scope='module')
+def asgi_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(asgi.app, log_level='warning'))
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    yield sock.getsockname()[1]
+    server.should_exit = True
+    thread.join(10)
+
+
+def entries(route):
+    return [entry for entry in list(inflight.registry._entries.values()) if entry.route == route]
+
+
+def test_mounted_stream_cancelled_when_asgi_client_disconnects(asgi_port):
+    route = '/api/interview/stream'
+    body = json.dumps({'system': 'Interviewer', 'messages': [{'role': 'user', 'content': 'hello'}]}).encode()
+    client = socket.create_connection(('127.0.0.1', asgi_port))
+    client.sendall(
+        f'POST {route} HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+    )
+    assert client.recv(4096).startswith(b'HTTP/1.1 200')
+
+    deadline = time.time() + 5
+    while not (entries(route) and entries(route)[0].chunks) and time.time() < deadline:
+        time.sleep(0.05)
+    [entry] = entries(route)
+    assert entry.cancelled is None
+
+    client.close()
+    deadline = time.time() + 1
+    while entries(route) and time.time() < deadline:
+        time.sleep(0.05)
+    assert entry.cancelled == 'disconnect'
+    assert not entries(route)
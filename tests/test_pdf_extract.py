@@ -0,0 +1,60 @@
+import io
+import multiprocessing
+
+import pytest
+from PyPDF2 import PageObject, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+import pdf_extract
+
+
+def make_pdf(pages, lines):
+    """A PDF whose pages each hold ``lines`` text lines; extraction time grows with ``lines``"""
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    })
+    for _ in range(pages):
+        page = PageObject.create_blank_page(width=612, height=792)
+        page[NameObject('/Resources')] = DictionaryObject({NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})})
+        content = DecodedStreamObject()
+        content.set_data(b'BT /F1 12 Tf 72 720 Td ' + b'(Experience Python) Tj 0 -14 Td ' * lines + b'ET')
+        page[NameObject('/Contents')] = content
+        writer.add_page(page)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def hold(started, release):
+    """Stands in for another upload's extraction, running on the pool until ``release`` is set"""
+    started.set()
+    release.wait(60)
+    return 'done'
+
+
+def test_timeout_only_fails_the_slow_upload(monkeypatch):
+    monkeypatch.setattr(pdf_extract, 'WORKERS', 4)
+    # A page of 60000 lines takes several times longer than this to read
+    monkeypatch.setattr(pdf_extract, 'TIMEOUT_SECONDS', 1.5)
+    pdf_extract.shutdown()
+    monkeypatch.setattr(pdf_extract, '_pool', None)
+    manager = multiprocessing.get_context('spawn').Manager()
+    try:
+        started, release = manager.Event(), manager.Event()
+        other = pdf_extract._get_pool().submit(hold, started, release)
+        assert started.wait(60)
+
+        with pytest.raises(pdf_extract.PdfExtractionError):
+            pdf_extract.extract_pdf_text(make_pdf(2, 60000))
+        # The other upload was running when the pool was retired, and is left to finish
+        release.set()
+        assert other.result(timeout=60) == 'done'
+
+        # Later uploads use a fresh pool
+        assert pdf_extract.extract_pdf_text(make_pdf(2, 10)).count('\f') == 2
+    finally:
+        pdf_extract.shutdown()
+        manager.shutdown()
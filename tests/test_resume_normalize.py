@@ -0,0 +1,20 @@
+import resume_normalize
+from tokens import estimate_tokens
+
+
+def test_single_long_line_is_cut_not_dropped():
+    line = 'Jane Doe experience at ACME building things. ' * 4000
+    text, report = resume_normalize.normalize(line, max_tokens=1000)
+    assert text.startswith('Jane Doe experience at ACME')
+    assert text.endswith('\n' + resume_normalize.TRUNCATION_MARK)
+    # Cut at a word boundary
+    assert line.startswith(text[:-len(resume_normalize.TRUNCATION_MARK) - 1] + ' ')
+    assert estimate_tokens(text) <= 1000
+    assert report['truncated_sections'] == ['header']
+
+
+def test_long_line_under_a_heading_is_cut():
+    text, report = resume_normalize.normalize('Jane Doe\nEXPERIENCE\n' + 'Built things at ACME. ' * 4000, max_tokens=1000)
+    assert text.startswith('Jane Doe\nEXPERIENCE\nBuilt things at ACME.')
+    assert estimate_tokens(text) <= 1000
+    assert report['truncated_sections'] == ['EXPERIENCE']
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import resume_events
+import sse_relay
+
+DELTAS = [
+    'Grade: B+ (85/100)\n\n',
+    '**Strengths**\n',
+    'Clear structure and ',
+    'measurable results.\n\n',
+    '**Areas for Improvement**\n',
+    'Add a skills section.\n',
+    '**ATS Optimization**\n',
+    'Use standard headings.',
+]
+
+
+def upstream_chunks():
+    for text in DELTAS:
+        chunk = {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]}
+        yield f'data: {json.dumps(chunk)}\r\n\r\n'.encode()
+
+
+class Response:
+    ok = True
+    is_success = True
+
+    def iter_content(self, chunk_size=None):
+        return upstream_chunks()
+
+    async def aiter_bytes(self):
+        for chunk in upstream_chunks():
+            yield chunk
+
+    def close(self):
+        pass
+
+
+def check_offsets(frames):
+    """Every event offset points into text already sent; returns the event types"""
+    sent = ''
+    types = []
+    for frame in frames:
+        # Delta frames are bytes, event frames str
+        event = json.loads((frame.decode() if isinstance(frame, bytes) else frame)[len('data: '):])
+        if event['type'] == 'content_block_delta':
+            sent += event['delta']['text']
+            continue
+        types.append(event['type'])
+        if 'offset' in event:
+            assert event['offset'] <= len(sent), (event, sent)
+    assert sent == ''.join(DELTAS)
+    return types
+
+
+def relay(**kwargs):
+    return sse_relay.GeminiRelay('/test', coalesce_ms=60000, coalesce_bytes=1 << 20,
+                                 events=resume_events.ResumeEvents(), **kwargs)
+
+
+def test_events_follow_coalesced_text():
+    frames = list(relay().relay(Response()))
+    types = check_offsets(frames)
+    assert types.count('section_start') == 3 and types.count('section_end') == 3
+
+
+def test_events_follow_coalesced_text_async():
+    async def collect():
+        return [frame async for frame in relay().arelay(Response())]
+
+    types = check_offsets(asyncio.run(collect()))
+    assert types.count('section_start') == 3 and types.count('section_end') == 3
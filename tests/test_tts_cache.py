@@ -0,0 +1,14 @@
+import os
+
+import tts_cache
+
+
+def test_failed_disk_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    def fail(src, dst):
+        raise OSError('disk full')
+
+    cache = tts_cache.TTSCache(disk_dir=str(tmp_path))
+    monkeypatch.setattr(tts_cache.os, 'replace', fail)
+    cache.put('key', b'audio' * 100)
+    assert [name for _, _, names in os.walk(tmp_path) for name in names] == []
+    assert cache.get('key') == b'audio' * 100
@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip('httpx')
+from starlette.testclient import TestClient
+
+import asgi
+
+
+def test_malformed_frame_gets_an_error_and_keeps_the_session():
+    # Without ``with``: the lifespan (warm-up, pool shutdown) is not run
+    client = TestClient(asgi.app)
+    with client.websocket_connect('/ws/voice') as ws:
+        for frame in ('{not json', '[1, 2]'):
+            ws.send_text(frame)
+            assert ws.receive_json() == {'type': 'error', 'error': {'message': 'Messages must be JSON objects'}}
+        ws.send_json({'type': 'start', 'language': 'en'})
+        assert ws.receive_json()['type'] == 'ready'
@@ -0,0 +1,13 @@
+"""Cheap token estimates for budgeting prompts without a countTokens round trip.
+
+Gemini averages about four characters per token on English and French text,
+which is close enough to decide when a conversation needs compacting.
+"""
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Approximate Gemini token count of ``text``"""
+    if not text:
+        return 0
+    return -(-len(text) // CHARS_PER_TOKEN)
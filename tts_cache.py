@@ -0,0 +1,201 @@
+"""Content-addressed cache for generated TTS audio.
+
+Two tiers: an in-memory LRU bounded by a byte budget, backed by an on-disk
+store so hits survive restarts and are shared between workers. Entries are
+keyed on a hash of the normalized (voice_id, text, model_id, voice_settings,
+output format) request, so the same sentence spoken by the same voice is only
+paid for once.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+MEMORY_MAX_BYTES = int(os.environ.get('TTS_CACHE_MEMORY_BYTES', 64 * 1024 * 1024))
+DISK_MAX_BYTES = int(os.environ.get('TTS_CACHE_DISK_BYTES', 512 * 1024 * 1024))
+DISK_DIR = os.environ.get(
+    'TTS_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'tts')
+)
+
+_WHITESPACE = re.compile(r'\s+')
+# ElevenLabs' default output format, which every entry stored before output profiles existed is in
+DEFAULT_OUTPUT_FORMAT = 'mp3_44100_128'
+
+
+def cache_key(voice_id, payload, output_format=DEFAULT_OUTPUT_FORMAT):
+    """Hash of the normalized TTS request and its output format"""
+    normalized = {
+        'voice_id': voice_id,
+        'text': _WHITESPACE.sub(' ', payload.get('text', '')).strip(),
+        'model_id': payload.get('model_id'),
+        'voice_settings': payload.get('voice_settings') or {},
+    }
+    if output_format != DEFAULT_OUTPUT_FORMAT:
+        # Left out for the default so the keys of existing entries do not change
+        normalized['output_format'] = output_format
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """Memory LRU with a byte budget in front of an optional disk store"""
+
+    def __init__(self, memory_max_bytes=MEMORY_MAX_BYTES, disk_dir=DISK_DIR,
+                 disk_max_bytes=DISK_MAX_BYTES):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'disk_evictions': 0,
+        }
+
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            except OSError as e:
+                print(f"[TTS-CACHE] Disk tier disabled: {str(e)}")
+                self.disk_dir = None
+
+    def get(self, key):
+        """Return cached audio for ``key`` or None"""
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return audio
+
+        audio = self._read_disk(key)
+        with self._lock:
+            if audio is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+            self._counters['disk_hits'] += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        """Store ``audio`` under ``key`` in both tiers"""
+        if not audio:
+            return
+        with self._lock:
+            self._counters['stores'] += 1
+            self._remember(key, audio)
+        self._write_disk(key, audio)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['memory_max_bytes'] = self.memory_max_bytes
+            stats['disk_bytes'] = self._disk_bytes if self.disk_dir else 0
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _remember(self, key, audio):
+        # Caller holds the lock
+        if len(audio) > self.memory_max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._entries[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._counters['evictions'] += 1
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + '.audio')
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, audio):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(audio)
+            # A key written again (two misses racing, an entry pruned from memory) replaces its file
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[TTS-CACHE] Disk write failed: {str(e)}")
+            if tmp_path:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+            return
+
+        with self._lock:
+            self._disk_bytes += len(audio) - replaced
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._prune_disk()
+
+    def _disk_files(self):
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith('.audio'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _prune_disk(self):
+        """Drop the oldest disk entries until the store is back under 90% of its budget"""
+        files = sorted(self._disk_files(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9
+        evicted = 0
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._counters['disk_evictions'] += evicted
+
+
+cache = TTSCache()
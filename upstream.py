@@ -0,0 +1,182 @@
+"""Pooled HTTP clients for the Gemini and ElevenLabs upstream APIs.
+
+Every route goes through one of the module-level clients below instead of a
+bare ``requests.post`` so TCP+TLS handshakes are paid once per worker and the
+connections are kept alive between requests.
+"""
+import contextlib
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import admission
+import inflight
+import metrics
+
+# Overridable to point the server at local stand-ins (see bench/fake_upstream.py)
+GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com')
+ELEVENLABS_BASE_URL = os.environ.get('ELEVENLABS_BASE_URL', 'https://api.elevenlabs.io')
+GEMINI_MODEL = 'gemini-2.0-flash-exp'
+
+# Pool sizing and timeouts, overridable per deployment
+POOL_MAXSIZE = int(os.environ.get('UPSTREAM_POOL_MAXSIZE', 32))
+POOL_WARM_CONNECTIONS = int(os.environ.get('UPSTREAM_WARM_CONNECTIONS', 2))
+CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 30))
+
+
+class UpstreamClient:
+    """Keep-alive connection pool for a single upstream host"""
+
+    def __init__(self, name, base_url, pool_maxsize=POOL_MAXSIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, path, timeout=None, **kwargs):
+        """POST to ``path`` on this host, reusing a pooled connection"""
+        return self.request('POST', path, timeout=timeout, **kwargs)
+
+    def request(self, method, path, timeout=None, **kwargs):
+        read_timeout = timeout if timeout is not None else self.read_timeout
+        try:
+            response = self.session.request(
+                method,
+                self.base_url + path,
+                timeout=(self.connect_timeout, read_timeout),
+                **kwargs
+            )
+        except requests.RequestException:
+            metrics.UPSTREAM_ERRORS.labels(self.name).inc()
+            raise
+        # elapsed stops at the response headers, even for non-streaming requests
+        metrics.UPSTREAM_TTFB.labels(self.name, str(response.status_code)).observe(response.elapsed.total_seconds())
+        if response.status_code == 429:
+            admission.limiters[self.name].backoff(response.headers.get('Retry-After'))
+        if kwargs.get('stream'):
+            # Shut down if the stream it feeds is cancelled
+            inflight.track(self.name, response)
+        return response
+
+    def warm(self, connections=POOL_WARM_CONNECTIONS):
+        """Open ``connections`` keep-alive connections ahead of real traffic"""
+        def open_one():
+            try:
+                self.session.head(self.base_url, timeout=(self.connect_timeout, self.connect_timeout))
+            except requests.RequestException as e:
+                print(f"[UPSTREAM] Warm-up of {self.name} failed: {str(e)}")
+
+        threads = [threading.Thread(target=open_one, daemon=True) for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"[UPSTREAM] Warmed {connections} connection(s) to {self.name}")
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncUpstreamClient:
+    """httpx-based counterpart of UpstreamClient for the asyncio serving mode"""
+
+    def __init__(self, name, base_url, pool_maxsize=POOL_MAXSIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        import httpx
+
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=pool_maxsize),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    def _timeout(self, timeout):
+        import httpx
+
+        read_timeout = timeout if timeout is not None else self.read_timeout
+        return httpx.Timeout(read_timeout, connect=self.connect_timeout)
+
+    async def open_stream(self, path, timeout=None, **kwargs):
+        """POST and return the response as soon as its headers arrive; the caller must ``aclose()`` it"""
+        request = self.client.build_request('POST', path, timeout=self._timeout(timeout), **kwargs)
+        started = time.perf_counter()
+        try:
+            response = await self.client.send(request, stream=True)
+        except Exception:
+            metrics.UPSTREAM_ERRORS.labels(self.name).inc()
+            raise
+        metrics.UPSTREAM_TTFB.labels(self.name, str(response.status_code)).observe(time.perf_counter() - started)
+        if response.status_code == 429:
+            admission.limiters[self.name].backoff(response.headers.get('Retry-After'))
+        return inflight.track(self.name, response)
+
+    async def post(self, path, timeout=None, **kwargs):
+        response = await self.open_stream(path, timeout=timeout, **kwargs)
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        return response
+
+    @contextlib.asynccontextmanager
+    async def stream(self, path, timeout=None, **kwargs):
+        """Async context manager yielding a streaming POST response"""
+        response = await self.open_stream(path, timeout=timeout, **kwargs)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    async def warm(self, connections=POOL_WARM_CONNECTIONS):
+        import asyncio
+
+        async def open_one():
+            try:
+                await self.client.head('/', timeout=self._timeout(self.connect_timeout))
+            except Exception as e:
+                print(f"[UPSTREAM] Warm-up of {self.name} failed: {str(e)}")
+
+        await asyncio.gather(*(open_one() for _ in range(connections)))
+        print(f"[UPSTREAM] Warmed {connections} async connection(s) to {self.name}")
+
+    async def close(self):
+        await self.client.aclose()
+
+
+gemini = UpstreamClient('gemini', GEMINI_BASE_URL)
+elevenlabs = UpstreamClient('elevenlabs', ELEVENLABS_BASE_URL)
+
+
+def gemini_path(api_key, stream=False, model=GEMINI_MODEL):
+    """Build the generateContent / streamGenerateContent path for ``model``"""
+    if stream:
+        return f'/v1beta/models/{model}:streamGenerateContent?key={api_key}&alt=sse'
+    return f'/v1beta/models/{model}:generateContent?key={api_key}'
+
+
+def warm_all(background=True):
+    """Warm every upstream pool, in a daemon thread unless ``background`` is False"""
+    def run():
+        for client in (gemini, elevenlabs):
+            client.warm()
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='upstream-warm', daemon=True)
+    thread.start()
+    return thread